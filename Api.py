@@ -1,10 +1,34 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
+from typing import Optional
+from collections import Counter
+from urllib.parse import quote
 import shutil
 import os
 import json
 import asyncio
+import logging
+import time
+from action_plan import is_plan, validate_plan
+from blob_store import from_env as blob_store_from_env
+from inference_executor import InferenceQueueFull, from_env as inference_executor_from_env
+from log_config import setup_logging
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY, Tracer, instrument_app
+from micro_batcher import MicroBatcher
+from model_manager import ModelManager, ModelNotReady
+from model_worker_pool import from_env as model_worker_pool_from_env, processes_from_env as model_workers_from_env
+from observation_encoder import encode_ui_state
+from plan_cache import PlanCache
+from presence import PresenceRegistry
+from prompt_jobs import FINISHED as FINISHED_JOB_STATUSES, JobCancelled, JobQueueFull, JobTimeout, PromptJobManager
+from session_registry import SessionRegistry
+from shared_state import from_env as shared_state_from_env, reset_from_env as reset_shared_state_from_env
+from state_store import from_env as state_store_from_env
+from trace_recorder import from_env as trace_recorder_from_env
+from ui_state_patch import UiStateConflict
+from task_state import ACTIVE_STATES, PENDING_STATES, InvalidTransition, SessionGone, TaskType
 USE_MOCK_MODEL = True  # ← 테스트 목업 데이터 사용 시 True, 실제 배포 시 False 해주세용 
 
 app = FastAPI()
@@ -17,26 +41,113 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-STUDENT_ID = None
-PASSWORD = None
-TASK_TYPE = 0
-PROMPT_TEXT = None
-PROMPT_EVENT = asyncio.Event() # 다 비동기로 바꿨어 로그인 할 떄 충돌나서 .. 
-PROMPT_EVENT.set()
-LOGIN_EVENT = asyncio.Event()
-LOGIN_EVENT.set()
+# ============================
+# 로깅 / 메트릭 / trace
+# print 대신 레벨별 로깅 (LOG_LEVEL=WARNING 이면 진행 로그 꺼짐, LOG_FORMAT=json 이면 구조화 로그)
+# /metrics 는 Prometheus text 형식, 테스크별 trace(/prompt → /state, /action → /verification)는 /traces
+# ============================
+setup_logging()
+log = logging.getLogger("api")
+instrument_app(app)
+TRACER = Tracer(max_traces=int(os.environ.get("TRACE_MAX_TASKS", 200)))
+INFERENCE_SECONDS = REGISTRY.histogram("action_inference_seconds", "액션 생성 대기(queued) / 실행(run) 시간", ("phase",))
+ACTIONS_TOTAL = REGISTRY.counter("actions_generated_total", "생성된 액션 수 (source: model | cache | fallback)", ("source",))
+VERIFICATIONS_TOTAL = REGISTRY.counter("verifications_total", "실행 웹 검증 결과", ("success",))
+UI_STATE_UPDATES_TOTAL = REGISTRY.counter("ui_state_updates_total", "/state 로 받은 ui_state (kind: full | patch | resync)", ("kind",))
+PLANS_TOTAL = REGISTRY.counter("action_plans_total", "plan 모드 (kind: plan | replan | aborted)", ("kind",))
+
+# ============================
+# 세션 레지스트리
+# 기존 전역 변수(STUDENT_ID, TASK_TYPE, PROMPT_EVENT, BROWSER_* ...)는 전부 Session 객체로 이동
+# session_id 를 안 보내는 기존 클라이언트는 "default" 세션을 사용함
+# SHARED_STATE(sqlite:///경로 | redis://...) 가 있으면 세션 / 테스크 상태 / 상태 저장소 / job 을 worker 끼리 공유
+# (WEB_CONCURRENCY > 1 로 여러 worker 를 띄울 때 필요)
+# ============================
+SHARED_STATE = shared_state_from_env()
+SESSIONS = SHARED_STATE.sessions if SHARED_STATE is not None else SessionRegistry()
+
+
+async def _shared_state_unavailable(request: Request, exc: Exception):
+    """공유 백엔드가 SHARED_STATE_TIMEOUT_MS 안에 응답하지 않음 (SQLite 잠금 / Redis) → 잠깐 뒤 재시도"""
+    log.warning("[SharedState] %s %s 처리 중 백엔드 응답 지연: %s", request.method, request.url.path, exc)
+    return JSONResponse({"detail": "공유 상태 저장소가 바쁩니다. 잠시 후 다시 시도하세요."},
+                        status_code=503, headers={"Retry-After": "1"})
+
+
+if SHARED_STATE is not None:
+    for _error in SHARED_STATE.backend.errors:
+        app.add_exception_handler(_error, _shared_state_unavailable)
+
+# ============================
+# 상태 저장소 (기존 state.json / login_state.json 대체)
+# 기본은 메모리, STATE_STORE=file 이면 백그라운드에서 파일로도 저장 (SHARED_STATE 가 있으면 공유 백엔드)
+# ============================
+STATE_STORE = SHARED_STATE.state_store() if SHARED_STATE is not None else state_store_from_env()
+
+# ============================
+# 실행 웹 연결 상태 (execution_web_id 별, 없으면 session_id)
+# /command 폴링마다 heartbeat, EXECUTION_WEB_TIMEOUT 초 동안 폴링이 없으면 연결 끊김 (timing wheel 로 만료)
+# ============================
+PRESENCE = PresenceRegistry(
+    timeout=float(os.environ.get("EXECUTION_WEB_TIMEOUT", 8)),
+    store=SHARED_STATE.backend if SHARED_STATE is not None else None,
+)
 
-EXECUTION_WEB_CONNECTED = False #얘는 실행 웹
-LAST_POLL_TIME = None
+# ============================
+# 추가: 스크린샷 저장소 (sha256 content-addressed)
+# state 에는 base64 대신 참조 {"blob": digest, ...} 만 저장
+# 스크린샷은 올린 세션만 조회 가능, 테스크가 끝나거나 로그아웃하면 삭제
+# BLOB_TTL 초(기본 하루, 0 이면 안 함)보다 오래된 것은 주기적으로 정리 (끝나지 않은 테스크 등)
+# ============================
+BLOB_STORE = blob_store_from_env()
+BLOB_TTL = float(os.environ.get("BLOB_TTL", 86400))
 
-BROWSER_RUNNING = False #얜 브라우저
-BROWSER_COUNT = 0
+# ============================
+# 추가: 액션 생성(모델 추론) 전용 executor
+# /state 에서 추론하는 동안 이벤트 루프가 막히지 않도록 여기로 넘김
+# ============================
+INFERENCE_EXECUTOR = inference_executor_from_env()
 
 # ============================
-# 추가: verification 데이터 저장용
+# 추가: 반복 프롬프트용 액션 캐시 ((프롬프트, step, UI 상태 지문) → 다음 액션)
+# Mock 모델은 세션별 step 카운터가 있어서 기본은 꺼둠
 # ============================
-STATUS_SUCCESS = None
-STATUS_MESSAGE = None
+PLAN_CACHE_ENABLED = os.environ.get("PLAN_CACHE_ENABLED", "0" if USE_MOCK_MODEL else "1") == "1"
+PLAN_CACHE = PlanCache(
+    max_entries=int(os.environ.get("PLAN_CACHE_MAX_ENTRIES", 512)),
+    ttl_seconds=float(os.environ.get("PLAN_CACHE_TTL", 3600)),
+)
+
+
+# ============================
+# 추가: 모델에 넘기는 observation 형식
+# (main.py 의 프롬프트용 STATE_PROMPT_ENCODING 과는 별개)
+# raw     : 기존처럼 사이드바 트리 그대로 (기본, action_model 입력 형식 유지)
+# compact : observation_encoder 로 줄인 텍스트(observation_text)만
+# both    : 둘 다
+# ============================
+OBSERVATION_ENCODING = os.environ.get("OBSERVATION_ENCODING", "raw")
+OBSERVATION_PRUNE_COLLAPSED = os.environ.get("OBSERVATION_PRUNE_COLLAPSED", "1") == "1"
+OBSERVATION_MAX_DEPTH = int(os.environ["OBSERVATION_MAX_DEPTH"]) if os.environ.get("OBSERVATION_MAX_DEPTH") else None
+
+# ============================
+# 추가: plan 모드 (실행 웹이 /state 에 plan=true 를 보내고, 모델이 get_plan 을 제공할 때)
+# 첫 /state 에서 전체 액션 목록(+ checkpoint)을 한 번에 생성 → 실행 웹이 로컬에서 실행
+# checkpoint 실패 보고(data.plan_failure)가 오면 그 step 부터 다시 계획, PLAN_MAX_REPLANS 번 넘게 실패하면 테스크 실패
+# ============================
+PLAN_MODE_ENABLED = os.environ.get("PLAN_MODE_ENABLED", "1") == "1"
+PLAN_MAX_REPLANS = int(os.environ.get("PLAN_MAX_REPLANS", 2))
+
+# long-poll / SSE 설정
+COMMAND_MAX_WAIT = 30.0       # /command?wait=, /jobs/{id}?wait= 최대 대기 시간(초)
+COMMAND_STREAM_KEEPALIVE = 15.0  # SSE keep-alive 주기(초)
+
+
+def _get_session(session_id):
+    session = SESSIONS.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"세션을 찾을 수 없습니다: {session_id}")
+    return session
 
 # ============================
 # 추가: VerificationUpdate 모델
@@ -44,167 +155,619 @@ STATUS_MESSAGE = None
 class VerificationUpdate(BaseModel):
     success: bool
     message: str
+    session_id: Optional[str] = None
 # ============================
 
 
 class LoginRequest(BaseModel):
     student_id: str
     password: str
+    session_id: Optional[str] = None
 
 @app.post("/login")
 async def login(request: LoginRequest):
-    global STUDENT_ID, PASSWORD, TASK_TYPE, LOGIN_EVENT
+    session = SESSIONS.get_or_create(request.session_id)
 
-    if not LOGIN_EVENT.is_set(): # 이미 대기 중인 로그인 요청이 있으면 거절
+    if session.task.state == TaskType.LOGIN: # 이미 대기 중인 로그인 요청이 있으면 거절
         raise HTTPException(status_code=409, detail="이미 대기 중인 로그인 요청이 있습니다.")
+    if not session.task.can_transition(TaskType.LOGIN):
+        raise HTTPException(status_code=409, detail="진행 중인 테스크가 있어 로그인할 수 없습니다.")
 
-    # state.json 삭제 (값이 계속 남아있으면 로그인할 때 꼬여서 넣음)
-    state_path = os.path.join(os.path.dirname(__file__), "state.json")
-    if os.path.exists(state_path):
-        os.remove(state_path)
-        print(f"[로그인] 이전 state.json 삭제 완료")
+    # state 삭제 (값이 계속 남아있으면 로그인할 때 꼬여서 넣음)
+    if STATE_STORE.delete(session.session_id, "state"):
+        log.debug("[로그인] 이전 state 삭제 완료")
 
-    login_state_path = os.path.join(os.path.dirname(__file__), "login_state.json") #로그인 세션 유지 파일 생성
-    login_info = {
+    login_info = { #로그인 세션 유지 정보 저장
         "logged_in": True,
         "student_id": request.student_id,
     }
-    with open(login_state_path, "w", encoding="utf-8") as f:
-        json.dump(login_info, f, ensure_ascii=False, indent=2)
-    print("[로그인] login_state.json 생성 완료")
+    STATE_STORE.put(session.session_id, "login_state", login_info)
+    log.debug("[로그인] login_state 저장 완료")
 
-    STUDENT_ID = request.student_id
-    PASSWORD = request.password
-    TASK_TYPE = 1
-    LOGIN_EVENT.clear()
+    session.student_id = request.student_id
+    session.password = request.password
+    session.task.transition(TaskType.LOGIN)
 
-    print(f"[로그인] 로그인 요청 접수: {request.student_id}")
+    log.info("[로그인] 로그인 요청 접수: %s (session: %s)", request.student_id, session.session_id)
 
     return {
         "ok": True,
-        "student_id": STUDENT_ID,
+        "student_id": session.student_id,
+        "session_id": session.session_id,
         "message": "로그인 요청이 접수되었습니다.",
     }
 
 
-@app.post("/execution_web/init") #실행웹 시작 때  백엔드의 상태(state.json, PROMPT_TEXT 등)를 초기화
+@app.post("/execution_web/init") #실행웹 시작 때  백엔드의 상태(state, PROMPT_TEXT 등)를 초기화
 async def execution_web_init(request: dict):
-    global PROMPT_TEXT
+    session = SESSIONS.get_or_create(request.get("session_id"))
 
-    print("\n[INIT] 실행웹 초기화 요청 수신")
+    log.info("[INIT] 실행웹 초기화 요청 수신 (session: %s)", session.session_id)
 
-    PROMPT_TEXT = "" # PROMPT_TEXT 초기화
+    session.prompt_text = "" # PROMPT_TEXT 초기화
 
-    for fname in ["state.json", "login_state.json"]: # 이전에 남아있으면 무조건 삭제 해야함.
-        path = os.path.join(os.path.dirname(__file__), fname)
-        if os.path.exists(path):
-            try:
-                os.remove(path)
-                print(f"[INIT] {fname} 삭제 완료")
-            except Exception as e:
-                print(f"[INIT] {fname} 삭제 실패: {e}")
+    for key in ["state", "login_state"]: # 이전에 남아있으면 무조건 삭제 해야함.
+        if STATE_STORE.delete(session.session_id, key):
+            log.debug("[INIT] %s 삭제 완료", key)
 
-    print("[INIT] 백엔드 상태 초기화 완료")
+    log.debug("[INIT] 백엔드 상태 초기화 완료")
     return {"ok": True, "message": "백엔드 상태 초기화 완료"}
 
 
 class PromptRequest(BaseModel):
     text: str
+    session_id: Optional[str] = None
+    wait: bool = True  # False 면 job_id 를 바로 반환 (결과는 GET /jobs/{job_id} 또는 /jobs/{job_id}/events)
+
+
+# ============================
+# 추가: 프롬프트 job 큐
+# /prompt 는 세션별 큐에 job 으로 넣고 순서대로 실행 (진행 중인 테스크가 있어도 409 대신 대기열로)
+# PROMPT_JOB_TIMEOUT : 테스크 하나의 최대 실행 시간(초), 넘으면 상태 초기화 후 timeout
+# PROMPT_WAIT_TIMEOUT: wait=true 인 /prompt 가 응답을 붙잡고 있는 최대 시간(초), 넘으면 504 (job 은 계속 실행)
+# ============================
+PROMPT_JOB_TIMEOUT = float(os.environ.get("PROMPT_JOB_TIMEOUT", 600))
+PROMPT_WAIT_TIMEOUT = float(os.environ.get("PROMPT_WAIT_TIMEOUT", 60))
+
+
+async def _run_prompt_job(job):
+    """job 하나 = 프롬프트 하나: STATE 로 전이하고 /verification (또는 종료 / 로그아웃)까지 대기"""
+    session = SESSIONS.get(job.session_id)
+    if session is None:  # 다른 worker 에서 로그아웃되어 세션이 삭제됨
+        raise JobCancelled(f"세션이 삭제되어 취소되었습니다: {job.session_id}")
+
+    # 아직 전달되지 않은 로그인 / 종료 명령이 있으면 먼저 처리되길 기다림
+    # (다른 worker 의 job 이 먼저 NONE → STATE 로 바꿨으면 다시 대기)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + PROMPT_JOB_TIMEOUT
+    while True:
+        remaining = deadline - loop.time()
+        if remaining <= 0 or await session.task.wait_for((TaskType.NONE,), timeout=remaining) is None:
+            raise JobTimeout(f"테스크를 시작하지 못했습니다. (상태: {session.task.state.name})")
+        if PROMPT_JOBS.is_cancelled(job):  # 기다리는 동안 (다른 worker 에서) 로그아웃됨
+            raise JobCancelled("세션이 로그아웃되어 취소되었습니다.")
+        try:
+            session.transition(TaskType.STATE, expect=TaskType.NONE,
+                               prompt_text=job.text, # 요기가 프롬프트 저장
+                               plan_cache_keys=[], plan_replans=0, status_success=None, status_message=None)
+            break
+        except SessionGone:  # 삭제된 세션은 NONE 으로 읽혀서 계속 재시도하게 됨
+            raise JobCancelled(f"세션이 삭제되어 취소되었습니다: {job.session_id}")
+        except InvalidTransition:
+            continue
+    session.trace_id = TRACER.start(session_id=session.session_id, prompt=job.text, job_id=job.job_id)
+
+    # /verification 으로 NONE 이 되거나 종료 / 로그아웃될 때까지 대기 (그 전이에서만 깨어남)
+    try:
+        outcome = await session.task.wait_for((TaskType.NONE, TaskType.SHUTDOWN, TaskType.LOGOUT),
+                                              timeout=PROMPT_JOB_TIMEOUT)
+    finally:
+        await _release_screenshots(session)  # 결과와 상관없이 이번 테스크의 스크린샷은 더 이상 필요 없음
+    if outcome is None: # 타임아웃 시 상태 초기화
+        session.prompt_text = None
+        if session.task.state in ACTIVE_STATES:
+            session.task.transition(TaskType.NONE)
+        TRACER.end(session.trace_id, outcome="timeout")
+        raise JobTimeout("action이 완료되지 않아 타임아웃되었습니다.")
+    if outcome == TaskType.NONE and PROMPT_JOBS.is_cancelled(job):
+        outcome = TaskType.LOGOUT  # LOGOUT → NONE 이 한 번에 보였음 (다른 worker 에서 로그아웃 후 세션 삭제)
+    if outcome != TaskType.NONE:
+        TRACER.end(session.trace_id, outcome=outcome.name.lower())
+        return {"success": False, "message": f"테스크가 중단되었습니다. ({outcome.name})"}
+
+    # 검증 결과
+    return {
+        "success": session.status_success,
+        "message": session.status_message,
+    }
+
+
+PROMPT_JOBS = PromptJobManager(
+    _run_prompt_job,
+    max_queued=int(os.environ.get("PROMPT_QUEUE_SIZE", 20)),
+    max_jobs=int(os.environ.get("PROMPT_JOBS_MAX", 1000)),
+    ttl=float(os.environ.get("PROMPT_JOBS_TTL", 3600)),
+    store=SHARED_STATE.backend if SHARED_STATE is not None else None,
+)
+
 
 @app.post("/prompt")
 async def prompt(request: PromptRequest):
-    global PROMPT_TEXT, PROMPT_EVENT, TASK_TYPE, STATUS_SUCCESS, STATUS_MESSAGE
+    session = _get_session(request.session_id)
 
-    if not PROMPT_EVENT.is_set(): # 이미 대기 중인 프롬프트가 있으면 거절
-        raise HTTPException(status_code=409, detail="이미 대기 중인 프롬프트가 있습니다.")
+    try:
+        job = PROMPT_JOBS.submit(session.session_id, request.text)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
 
-    PROMPT_TEXT = request.text # 요기가 프롬프트 저장
-    TASK_TYPE = 2
-    PROMPT_EVENT.clear()
+    if not request.wait:
+        return JSONResponse(PROMPT_JOBS.describe(job), status_code=202)
 
-    try:
-        await asyncio.wait_for(PROMPT_EVENT.wait(), timeout=60.0) # /verification에서 검증 완료될 때까지 대기
-    except asyncio.TimeoutError:# 타임아웃 시 상태 초기화
-        PROMPT_TEXT = None
-        PROMPT_EVENT.set()
-        raise HTTPException(status_code=504, detail="action이 완료되지 않아 타임아웃되었습니다.")
+    # 기존 클라이언트: 결과가 나올 때까지 응답 보류
+    if not await PROMPT_JOBS.wait(job, PROMPT_WAIT_TIMEOUT):
+        raise HTTPException(status_code=504, detail=f"action이 아직 완료되지 않았습니다. GET /jobs/{job.job_id} 로 결과를 확인하세요.")
+    if job.status == "timeout":
+        raise HTTPException(status_code=504, detail=job.error)
+    if job.status != "succeeded":
+        return {"success": False, "message": job.error or f"테스크가 {job.status} 상태로 끝났습니다.", "job_id": job.job_id}
 
     # 검증 결과 반환 (폴링 불필요)
-    return {
-        "success": STATUS_SUCCESS,
-        "message": STATUS_MESSAGE,
-    }
+    return {**job.result, "job_id": job.job_id}
+
+
+@app.get("/jobs")
+async def list_jobs(session_id: Optional[str] = None, limit: int = 20):
+    session = _get_session(session_id)
+    return {"jobs": PROMPT_JOBS.session_jobs(session.session_id, limit)}
+
+
+def _get_job(job_id):
+    job = PROMPT_JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"job 을 찾을 수 없습니다: {job_id}")
+    return job
+
+
+def _get_remote_job(job_id):
+    """다른 worker 가 받은 job 의 snapshot (SHARED_STATE 일 때만)"""
+    snapshot = PROMPT_JOBS.snapshot(job_id)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail=f"job 을 찾을 수 없습니다: {job_id}")
+    return snapshot
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0):
+    """wait > 0 이면 job 이 끝날 때까지 최대 wait 초 대기 후 응답 (long-poll)"""
+    if PROMPT_JOBS.get(job_id) is None:
+        snapshot = _get_remote_job(job_id)
+        if wait > 0:
+            snapshot = await PROMPT_JOBS.wait_snapshot(job_id, min(wait, COMMAND_MAX_WAIT)) or snapshot
+        return snapshot
+    job = _get_job(job_id)
+    if wait > 0:
+        await PROMPT_JOBS.wait(job, min(wait, COMMAND_MAX_WAIT))
+    return PROMPT_JOBS.describe(job)
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(request: Request, job_id: str):
+    """job 상태가 바뀔 때마다 SSE 로 전송, 끝나면 event: done 후 종료"""
+    if PROMPT_JOBS.get(job_id) is None:
+        snapshot = _get_remote_job(job_id)
+
+        async def _remote_events(snapshot=snapshot):
+            # 다른 worker 의 job → snapshot 폴링
+            while snapshot is not None:
+                data = json.dumps(snapshot, ensure_ascii=False)
+                if snapshot["status"] in FINISHED_JOB_STATUSES:
+                    yield f"event: done\ndata: {data}\n\n"
+                    return
+                yield f"data: {data}\n\n"
+                previous = snapshot
+                while snapshot == previous:
+                    if await request.is_disconnected():
+                        return
+                    snapshot = await PROMPT_JOBS.wait_snapshot(job_id, COMMAND_STREAM_KEEPALIVE, since=previous)
+                    if snapshot == previous:
+                        yield ": keep-alive\n\n"
+
+        return StreamingResponse(_remote_events(), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    job = _get_job(job_id)
+
+    async def _events():
+        while True:
+            version = job.version
+            data = json.dumps(PROMPT_JOBS.describe(job), ensure_ascii=False)
+            if job.finished:
+                yield f"event: done\ndata: {data}\n\n"
+                return
+            yield f"data: {data}\n\n"
+            while not await PROMPT_JOBS.watch(job, version, COMMAND_STREAM_KEEPALIVE):
+                if await request.is_disconnected():
+                    return
+                yield ": keep-alive\n\n"
+
+    return StreamingResponse(_events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """대기 중인 job 취소 (이미 실행 중이거나 끝난 job, 다른 worker 가 받은 job 은 409)"""
+    if PROMPT_JOBS.get(job_id) is None:
+        snapshot = _get_remote_job(job_id)
+        raise HTTPException(status_code=409, detail=f"다른 worker 가 받은 job 은 취소할 수 없습니다. (status: {snapshot['status']})")
+    job = _get_job(job_id)
+    if not PROMPT_JOBS.cancel(job_id):
+        raise HTTPException(status_code=409, detail=f"대기 중인 job 만 취소할 수 있습니다. (status: {job.status})")
+    return PROMPT_JOBS.describe(job)
 
 
 class StateData(BaseModel):
     data: dict
+    session_id: Optional[str] = None
+    return_action: bool = False  # True 면 생성된 액션을 응답에 바로 포함 (GET /action 생략 가능)
+    plan: bool = False  # True 면 실행 웹이 plan(전체 액션 목록) 실행을 지원 → 모델이 get_plan 을 제공하면 plan 모드
+
+
+def _load_action_model():
+    if USE_MOCK_MODEL:# Mock 모드인데, 이거 나중에 지우고 그냥 아래 action_model_만 쓰면돼.
+        log.info("[State] Mock 모델 사용 (테스트 모드)")
+        import mock_action_model as action_model_2
+    else:
+        log.info("[State] 실제 모델 사용")
+        import action_model_2
+    return action_model_2
+
+
+def _import_action_model():
+    """모델 모듈이 load() / warm_up() 을 제공하면 import 와 함께 가중치 로드까지 미리 해둠"""
+    action_model_2 = _load_action_model()
+    if hasattr(action_model_2, "load"):
+        action_model_2.load()
+    return action_model_2
+
+
+def _warm_up_action_model(action_model_2):
+    if hasattr(action_model_2, "warm_up"):
+        action_model_2.warm_up()
+
+
+# ============================
+# 추가: 실제 모델 호출 기록 (replay.py 로 오프라인 재실행 / 회귀 비교용)
+# TRACE_RECORD_PATH=traces.jsonl(.gz) 이면 기록, TRACE_RECORD_SAMPLE 로 일부만
+# ============================
+TRACE_RECORDER = trace_recorder_from_env()
+
+
+# ============================
+# 추가: 모델 worker 프로세스 풀 (MODEL_WORKERS > 0 일 때, 기본은 이 프로세스 안에서 추론)
+# worker 프로세스들이 모델을 로드하고 Unix socket 으로 호출받음, session_id 로 항상 같은 worker 에 보냄
+# (MODEL_WORKER_CONCURRENCY: worker 당 동시 호출 수, MODEL_POOL_DIR: 이미 떠 있는 worker 에 연결만)
+# ============================
+ACTION_MODEL_MODULE = "mock_action_model" if USE_MOCK_MODEL else "action_model_2"
+MODEL_POOL = model_worker_pool_from_env(ACTION_MODEL_MODULE, max_queue=INFERENCE_EXECUTOR.max_queue)
+
+# ============================
+# 추가: 모델 로드 관리
+# 서버 시작 시 백그라운드 스레드에서 모델 import / 로드 / warm-up (첫 /state 가 로드 시간을 떠안지 않도록)
+# 로드가 MODEL_READY_TIMEOUT 초 안에 안 끝나면 /state 는 503
+# worker 풀을 쓰면 여기서는 worker 들이 로드 / warm-up 을 끝낼 때까지 대기
+# ============================
+MODEL_MANAGER = ModelManager()
+if MODEL_POOL is not None:
+    MODEL_MANAGER.register("action_model", MODEL_POOL.start)
+else:
+    MODEL_MANAGER.register("action_model", _import_action_model, _warm_up_action_model)
+MODEL_READY_TIMEOUT = float(os.environ.get("MODEL_READY_TIMEOUT", 120))
+
+
+def _generate_action(observations, prompt_text, session_id):
+    """추론 스레드에서 실행됨 - 모델이 준비될 때까지 기다렸다가 액션 생성"""
+    action_model_2 = MODEL_MANAGER.get("action_model", MODEL_READY_TIMEOUT)
+
+    return action_model_2.get_next_action(
+        observations=observations,
+        prompt_text=prompt_text,
+        session_id=session_id,
+        max_new_tokens=256
+    )
+
+
+def _generate_plan(observations, prompt_text, session_id, failure=None):
+    """추론 스레드에서 실행됨 - plan 모드 (모델에 get_plan 이 없으면 None → step 모드로 진행)"""
+    action_model_2 = MODEL_MANAGER.get("action_model", MODEL_READY_TIMEOUT)
+    if not hasattr(action_model_2, "get_plan"):
+        return None
+
+    return action_model_2.get_plan(
+        observations=observations,
+        prompt_text=prompt_text,
+        session_id=session_id,
+        failure=failure,
+        max_new_tokens=1024
+    )
+
+
+def _generate_action_batch(requests, params):
+    """배처 스레드에서 실행됨 - 여러 세션의 요청을 한 번에 처리"""
+    action_model_2 = MODEL_MANAGER.get("action_model", MODEL_READY_TIMEOUT)
+    if hasattr(action_model_2, "get_next_action_batch"):
+        return action_model_2.get_next_action_batch(requests, max_new_tokens=256)
+    return [action_model_2.get_next_action(**req, max_new_tokens=256) for req in requests]
+
+
+# ============================
+# 액션 생성 micro-batching (ACTION_BATCH_SIZE > 1 일 때만 사용)
+# 여러 세션의 /state 요청을 ACTION_BATCH_WAIT_MS 동안 모아서 한 번에 생성
+# (worker 풀을 쓰면 세션마다 worker 가 정해져 있어서 사용 안 함)
+# ============================
+ACTION_BATCH_SIZE = int(os.environ.get("ACTION_BATCH_SIZE", 1))
+ACTION_BATCHER = MicroBatcher(
+    _generate_action_batch,
+    max_batch_size=ACTION_BATCH_SIZE,
+    max_wait_ms=float(os.environ.get("ACTION_BATCH_WAIT_MS", 10)),
+    max_queue=INFERENCE_EXECUTOR.max_queue,
+    name="action-batcher",
+) if ACTION_BATCH_SIZE > 1 and MODEL_POOL is None else None
+
+
+async def _wait_model_pool():
+    """worker 들이 아직 로드 중이면 MODEL_READY_TIMEOUT 초까지 대기 (넘으면 ModelNotReady)"""
+    if not MODEL_MANAGER.ready:
+        await asyncio.to_thread(MODEL_MANAGER.get, "action_model", MODEL_READY_TIMEOUT)
+
+
+async def _run_action_model(**request):
+    """worker 풀, 배처 또는 executor 에서 액션 생성 → (result, timing)"""
+    if MODEL_POOL is not None:
+        await _wait_model_pool()
+        return await MODEL_POOL.call("get_next_action", request["session_id"], **request, max_new_tokens=256)
+    if ACTION_BATCHER is not None:
+        future = ACTION_BATCHER.submit(request)
+        result = await asyncio.wrap_future(future)
+        return result, future.timing
+    return await INFERENCE_EXECUTOR.run(_generate_action, **request)
+
+
+async def _run_plan_model(**request):
+    """worker 풀 또는 executor 에서 plan 생성 → (result, timing), 모델에 get_plan 이 없으면 result 가 None"""
+    if MODEL_POOL is not None:
+        await _wait_model_pool()
+        if not MODEL_POOL.supports("get_plan"):
+            return None, None
+        return await MODEL_POOL.call("get_plan", request["session_id"], **request, max_new_tokens=1024)
+    return await INFERENCE_EXECUTOR.run(_generate_plan, **request)
+
+
+async def _resolve_screenshot(session, value):
+    """
+    /state 의 screenshot 필드를 blob 참조로 바꿈
+    - base64 문자열 (기존 클라이언트): blob 저장소에 저장
+    - {"blob": digest} : 이미 /state/screenshot 으로 올린 것
+    - 없음 : 직전에 /state/screenshot 으로 올린 것이 있으면 그것
+    """
+    if isinstance(value, str) and value:
+        ref = await asyncio.to_thread(BLOB_STORE.put_base64, value, session.session_id)
+        log.debug("[State] base64 스크린샷 → blob %s (%s → %s bytes)", ref["blob"][:12], ref["original_size"], ref["size"])
+        return ref
+    if isinstance(value, dict) and value.get("blob"):
+        if not BLOB_STORE.owns(session.session_id, value["blob"]):
+            raise ValueError(f"스크린샷 blob 을 찾을 수 없습니다: {value['blob']}")
+        session.pending_screenshot = None
+        return value
+    ref, session.pending_screenshot = session.pending_screenshot, None
+    return ref
+
+
+@app.post("/state/screenshot")
+async def upload_screenshot(file: UploadFile = File(...), session_id: Optional[str] = Form(None)):
+    """
+    스크린샷을 multipart 바이너리로 업로드 (base64-in-JSON 대체)
+    업로드 후 /state 를 보내면 자동으로 붙고, {"screenshot": {"blob": digest}} 로 직접 지정해도 됨
+    """
+    session = _get_session(session_id)
+    ref = await asyncio.to_thread(BLOB_STORE.put_stream, file.file, session.session_id)
+    await file.close()
+    session.pending_screenshot = ref
+    log.debug("[Screenshot] 저장: %s (%s → %s bytes)", ref["blob"][:12], ref["original_size"], ref["size"])
+    url = f"/blobs/{ref['blob']}" if session.is_default else f"/blobs/{ref['blob']}?session_id={quote(session.session_id)}"
+    return {"ok": True, **ref, "url": url}
+
+
+@app.get("/blobs/{digest}")
+def get_blob(digest: str, session_id: Optional[str] = None):
+    """올린 세션의 스크린샷만 (학생 개인 정보라 다른 세션 / 공유 캐시에 남지 않게)"""
+    session = _get_session(session_id)
+    if not BLOB_STORE.owns(session.session_id, digest):
+        raise HTTPException(status_code=404, detail="blob 을 찾을 수 없습니다")
+    return FileResponse(
+        BLOB_STORE.path(digest),
+        media_type=BLOB_STORE.content_type(digest),
+        headers={"Cache-Control": "private, no-store"},
+    )
+
+
+async def _release_screenshots(session):
+    """테스크 종료 / 로그아웃 → 이 세션이 올린 스크린샷 삭제 (다른 세션도 올린 같은 내용은 유지)"""
+    session.pending_screenshot = None
+    removed = await asyncio.to_thread(BLOB_STORE.release, session.session_id)
+    if removed:
+        log.debug("[Screenshot] 스크린샷 %s개 삭제 (session: %s)", removed, session.session_id)
+
+
+async def _sweep_blobs():
+    interval = min(BLOB_TTL, 3600)
+    while True:
+        try:
+            removed = await asyncio.to_thread(BLOB_STORE.sweep, BLOB_TTL)
+            if removed:
+                log.info("[Screenshot] 오래된 스크린샷 %s개 삭제", removed)
+        except OSError as e:
+            log.warning("[Screenshot] 스크린샷 정리 실패: %s", e)
+        await asyncio.sleep(interval)
+
+
+def _retry_state(session):
+    """
+    액션을 만들지 못함 (429 / 503) → 실행 웹이 /state 를 다시 보내도록 STATE 로 되돌림
+    (/command 에서 이미 STATE → ACTION 으로 넘어가서 그대로 두면 /action 이 계속 404 이거나 이전 액션을 받음)
+    실행 웹은 Retry-After 초 뒤 /command 에서 다시 state 명령을 받음
+    """
+    try:
+        session.task.transition(TaskType.STATE, expect=TaskType.ACTION)
+    except InvalidTransition:
+        pass
+
 
 @app.post("/state")
 async def save_state(request: StateData):
-    global PROMPT_TEXT
-
-    
-    state_data_to_save = request.data.copy() # state.json에 저장할 데이터 준비
+    """
+    실행 웹의 현재 상태 저장 + (테스크 진행 중이면) 다음 액션 생성
+    data.ui_state 대신 data.ui_state_patch = {"base_version": 응답의 ui_state_version, "ops": [...]} 로 변경분만 보낼 수 있음
+    (버전이 다르면 409 {"resync": true} → 전체 ui_state 재전송)
+    plan=true 면 테스크 첫 액션 대신 전체 액션 목록(plan)을 생성, data.plan_failure 가 오면 그 step 부터 다시 계획
+    """
+    session = _get_session(request.session_id)
+    started = time.perf_counter()
+    span_attrs = {}
+
+    state_data_to_save = request.data.copy() # state 저장소에 저장할 데이터 준비
+
+    # ui_state 전체 또는 직전 버전에 대한 변경분(ui_state_patch) → 전체 ui_state 로 복원
+    # 버전은 아래에서 state 를 저장할 때 올림 (429 / 503 이면 그대로 → 실행 웹은 같은 base_version 으로 다시 보냄)
+    try:
+        ui_state, ui_state_kind = session.ui_state.resolve(request.data)
+    except UiStateConflict as e:
+        UI_STATE_UPDATES_TOTAL.inc(kind="resync")
+        log.info("[State] ui_state resync 필요 (session: %s): %s", session.session_id, e)
+        raise HTTPException(status_code=409, detail={"resync": True, "message": str(e), "ui_state_version": e.version})
+    if ui_state_kind is not None:
+        state_data_to_save.pop("ui_state_patch", None)
+        state_data_to_save["ui_state"] = ui_state
+
+    # 스크린샷은 blob 저장소로 옮기고 참조만 남김
+    try:
+        screenshot = await _resolve_screenshot(session, request.data.get("screenshot"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if screenshot is not None:
+        state_data_to_save["screenshot"] = screenshot
 
     # 프롬프트 필드로 첫 요청인지 판단
     is_first_request = "prompt" in request.data
 
-    if PROMPT_TEXT:
+    # plan 모드: 실행 웹이 checkpoint 실패를 보고 (plan 을 받은 뒤라 VERIFICATION 상태)
+    plan_failure = request.data.get("plan_failure")
+    if plan_failure is not None:
+        if not isinstance(plan_failure, dict) or not isinstance(plan_failure.get("step"), int):
+            raise HTTPException(status_code=400, detail='plan_failure 는 {"step": 번호, "reason": ...} 형식이어야 합니다.')
+        if session.prompt_text:
+            log.info("[Plan] checkpoint 실패 (step %s): %s", plan_failure["step"], plan_failure.get("reason"))
+            if session.plan_replans >= PLAN_MAX_REPLANS:
+                PLANS_TOTAL.inc(kind="aborted")
+                _finish_task(session, False, f"checkpoint 실패가 반복되어 중단했습니다. "
+                                             f"(step {plan_failure['step']}: {plan_failure.get('reason')})")
+
+    # VERIFICATION 상태에서는 replan 요청일 때만 액션 생성
+    if session.prompt_text and (plan_failure is not None or session.task.state != TaskType.VERIFICATION):
         if is_first_request:
-            print(f"[State] 첫 요청 - 프롬프트: {PROMPT_TEXT}")
+            log.info("[State] 첫 요청 - 프롬프트: %s", session.prompt_text)
         else:
-            print(f"[State] 후속 요청 - UI 상태 업데이트")
+            log.debug("[State] 후속 요청 - UI 상태 업데이트")
 
-        print(f"[State] 현재 UI 상태 수신됨")
-
-        has_ui_state = "ui_state" in request.data # UI 상태 확인
-        if has_ui_state:
-            print(f"[State] UI 상태 URL: {request.data['ui_state'].get('url', 'N/A')}")
+        if ui_state is not None: # UI 상태 확인
+            log.debug("[State] UI 상태 URL: %s (%s, v%s)", ui_state.get("url", "N/A"), ui_state_kind, session.ui_state.version + 1)
         else:
-            print(f"[State] 경고: UI 상태 없음")
+            log.warning("[State] UI 상태 없음 (session: %s)", session.session_id)
 
         try:# ========== 액션 생성 ==========
-            if USE_MOCK_MODEL:# Mock 모드인데, 이거 나중에 지우고 그냥 아래 action_model_만 쓰면돼.
-                print(f"[State] Mock 모델 사용 (테스트 모드)")
-                import mock_action_model as action_model_2
-            else:
-                print(f"[State] 실제 모델 사용")
-                import action_model_2
-
             # 첫 요청이면 observations=None, 아니면 UI 상태 전달
             observations = None
-            if not is_first_request and "ui_state" in request.data:
-                ui_state = request.data["ui_state"]
-                observations = {
-                    "current_url": ui_state.get("url"),
-                    "sidebar": ui_state.get("sidebar", [])
-                }
-                print(f"[State] Observations: {observations}")
-
-            action_result = action_model_2.get_next_action(
-                observations=observations,
-                prompt_text=PROMPT_TEXT,
-                max_new_tokens=256
-            )
-
-            if "error" in action_result:
-                raise Exception(action_result["error"])
-
-            generated_action = action_result.get("generated_action", {})
+            if not is_first_request and ui_state is not None:
+                observations = {"current_url": ui_state.get("url")}
+                if screenshot is not None:
+                    observations["screenshot_path"] = BLOB_STORE.path(screenshot["blob"])
+                if OBSERVATION_ENCODING in ("raw", "both"):
+                    observations["sidebar"] = ui_state.get("sidebar", [])
+                if OBSERVATION_ENCODING in ("compact", "both"):
+                    encoded = encode_ui_state(ui_state, prune_collapsed=OBSERVATION_PRUNE_COLLAPSED,
+                                              max_depth=OBSERVATION_MAX_DEPTH)
+                    observations["observation_text"] = encoded.text
+                    if log.isEnabledFor(logging.DEBUG):  # 토큰 수는 읽을 때 계산
+                        log.debug("[State] Observation 인코딩: %s → %s 토큰 (메뉴 %s개, 생략 %s개)",
+                                  encoded.raw_token_count, encoded.token_count, encoded.nodes, encoded.elided)
+                log.debug("[State] Observations: %s", observations)
+
+            generated_action = None
+            # 테스크의 첫 액션 생성일 때 plan, 이후에는 checkpoint 실패 보고가 올 때만 replan
+            if PLAN_MODE_ENABLED and (plan_failure is not None or (request.plan and not session.plan_cache_keys)):
+                planned = await _make_plan(session, observations, ui_state, is_first_request, plan_failure)
+                if planned is not None:
+                    generated_action, cache_key, span_attrs["source"] = planned
+
+            if generated_action is None:
+                cache_key = PLAN_CACHE.make_key(session.prompt_text, len(session.plan_cache_keys),
+                                                ui_state, is_first_request)
+                generated_action = PLAN_CACHE.get(cache_key) if PLAN_CACHE_ENABLED else None
+                if generated_action is not None:
+                    log.debug("[State] 캐시 hit - 모델 호출 생략")
+                    span_attrs["source"] = "cache"
+
+            if generated_action is None:
+                # 추론은 executor 스레드에서 실행하고 await (이벤트 루프 블로킹 방지)
+                inference_started = time.perf_counter()
+                action_result, timing = await _run_action_model(
+                    observations=observations,
+                    prompt_text=session.prompt_text,
+                    session_id=session.session_id,
+                )
+                log.debug("[State] 추론 완료 (대기 %sms, 실행 %sms, 배치 %s)",
+                          timing["queued_ms"], timing["run_ms"], timing.get("batch_size", 1))
+                _record_inference(session, inference_started, timing)
+                span_attrs["source"] = "model"
+
+                if "error" in action_result:
+                    raise Exception(action_result["error"])
+
+                generated_action = action_result.get("generated_action", {})
+                if TRACE_RECORDER is not None:
+                    TRACE_RECORDER.record(session.session_id, len(session.plan_cache_keys), session.prompt_text,
+                                          observations, generated_action, timing,
+                                          model="mock" if USE_MOCK_MODEL else "action_model_2")
+                if PLAN_CACHE_ENABLED:
+                    PLAN_CACHE.put(cache_key, generated_action)
+
+            session.plan_cache_keys = session.plan_cache_keys + [cache_key]
             state_data_to_save["generated_action"] = generated_action
 
             status = generated_action.get("status")
             current_step = generated_action.get("current_step", 1)
             total_steps = generated_action.get("total_steps", 1)
 
-            print(f"[State] 액션 생성 완료 (status: {status}, step: {current_step}/{total_steps})")
-
+            log.info("[State] 액션 생성 완료 (status: %s, step: %s/%s)", status, current_step, total_steps)
+            span_attrs.update(step=len(session.plan_cache_keys), status=status)
+
+            if plan_failure is not None and is_plan(generated_action):
+                # 새 plan 을 다시 /action 으로 가져가도록 (fused 면 아래에서 바로 전달)
+                # replan 횟수는 새 plan 을 만들었을 때만 증가 (429 / 503 으로 다시 보고하는 경우는 세지 않음)
+                session.plan_replans = generated_action["replan"]
+                session.task.transition(TaskType.ACTION, expect=TaskType.VERIFICATION)
+
+        except InferenceQueueFull as e:
+            log.warning("[State] 추론 대기열 초과: %s", e)
+            _retry_state(session)
+            raise HTTPException(status_code=429, detail="액션 생성 요청이 많습니다. 잠시 후 다시 시도하세요.",
+                                headers={"Retry-After": "1"})
+        except ModelNotReady as e:
+            log.warning("[State] 모델 준비 안 됨: %s", e)
+            _retry_state(session)
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
         except Exception as e:
-            print(f"[State] 오류 발생: {e}")
-            import traceback
-            traceback.print_exc()
-
-            print(f"[State] 폴백: 하드코딩된 trajectory 사용")
+            log.exception("[State] 오류 발생 → 폴백: 하드코딩된 trajectory 사용")
+            span_attrs.update(source="fallback", error=str(e))
             temp_action = {
                 "type": "trajectory",
                 "actions_file": "trajectory_student_check.json",
@@ -212,153 +775,307 @@ async def save_state(request: StateData):
             }
             state_data_to_save["generated_action"] = temp_action
 
-    # state.json 저장
-    save_path = os.path.join(os.path.dirname(__file__), "state.json")
-    with open(save_path, "w", encoding="utf-8") as f:
-        json.dump(state_data_to_save, f, ensure_ascii=False, indent=2)
+    if ui_state_kind is not None:
+        session.ui_state.commit(ui_state)
+        UI_STATE_UPDATES_TOTAL.inc(kind=ui_state_kind)
 
-    print(f"[State] state.json 저장 완료")
-
-    return {
+    # state 저장 (메모리, 파일 저장은 write-behind)
+    STATE_STORE.put(session.session_id, "state", state_data_to_save)
+    if "source" in span_attrs:
+        ACTIONS_TOTAL.inc(source=span_attrs["source"])
+    resp = {
         "ok": True,
-        "message": "state.json 저장 완료",
-        "path": save_path
+        "message": "state 저장 완료",
+        "path": STATE_STORE.location(session.session_id, "state"),
+        "ui_state_version": session.ui_state.version, # 다음 ui_state_patch 의 base_version
     }
 
+    if request.return_action:
+        # fused 모드: /action 과 같은 데이터 + 같은 TASK_TYPE 전이를 여기서 바로 적용
+        resp["action"] = None
+        if "generated_action" in state_data_to_save:
+            _apply_action_transition(session, state_data_to_save)
+            resp["action"] = state_data_to_save
+    else:
+        session.task.notify() # 새 액션 준비됨 → 대기 중인 long-poll / SSE 에 action 명령 전달
 
-from fastapi.responses import JSONResponse
-
-@app.get("/command")
-async def command(browser_running: str = "false", browser_count: int = 0):
-    global PROMPT_TEXT, PROMPT_EVENT, TASK_TYPE, LOGIN_EVENT, STUDENT_ID, PASSWORD, EXECUTION_WEB_CONNECTED, LAST_POLL_TIME, BROWSER_RUNNING, BROWSER_COUNT
-    import datetime
-
-    EXECUTION_WEB_CONNECTED = True
-    LAST_POLL_TIME = datetime.datetime.now()
+    TRACER.add_span(session.trace_id, "state", started, fused=request.return_action, **span_attrs)
+    return resp
 
-    BROWSER_RUNNING = browser_running.lower() == "true"
-    BROWSER_COUNT = browser_count
 
-    if TASK_TYPE == 0:
+async def _make_plan(session, observations, ui_state, is_first_request, failure):
+    """
+    plan 모드: 테스크 전체 (replan 이면 실패한 step 부터) 액션 목록 생성 (plan cache → 모델 get_plan)
+    Returns:
+        (plan, cache_key, source), 모델에 get_plan 이 없으면 None
+    """
+    first_step = max(failure["step"], 1) if failure is not None else 1
+    cache_key = PLAN_CACHE.make_key(session.prompt_text, ("plan", first_step), ui_state, is_first_request)
+    plan = PLAN_CACHE.get(cache_key) if PLAN_CACHE_ENABLED else None
+    source = "cache"
+
+    if plan is None:
+        # trace_recorder / replay.py 는 step 모드(get_next_action) 기준이라 plan 은 기록하지 않음
+        inference_started = time.perf_counter()
+        result, timing = await _run_plan_model(
+            observations=observations,
+            prompt_text=session.prompt_text,
+            session_id=session.session_id,
+            failure=failure,
+        )
+        if result is None:
+            return None
+        _record_inference(session, inference_started, timing)
+        if "error" in result:
+            raise Exception(result["error"])
+        plan = validate_plan(result.get("generated_plan"), first_step=first_step)
+        if PLAN_CACHE_ENABLED:
+            PLAN_CACHE.put(cache_key, plan)
+        source = "model"
+
+    plan["replan"] = session.plan_replans + 1 if failure is not None else session.plan_replans
+    PLANS_TOTAL.inc(kind="replan" if failure is not None else "plan")
+    log.info("[Plan] plan 생성 (%s, step %s~%s, replan %s)", source, first_step, plan["total_steps"], plan["replan"])
+    return plan, cache_key, source
+
+
+def _record_inference(session, started, timing):
+    """추론 대기 / 실행 시간을 메트릭과 trace 에 기록"""
+    for phase in ("queued", "run"):
+        if timing.get(phase + "_ms") is not None:
+            INFERENCE_SECONDS.observe(timing[phase + "_ms"] / 1000, phase=phase)
+    TRACER.add_span(session.trace_id, "inference", started, queued_ms=timing["queued_ms"],
+                    run_ms=timing["run_ms"], batch_size=timing.get("batch_size", 1))
+
+
+def _record_poll(session, web_id, browser_running, browser_count):
+    """실행 웹 heartbeat → 실행 웹 id (없으면 session_id)"""
+    web_id = web_id or session.session_id
+    PRESENCE.heartbeat(web_id, session.session_id, browser_running.lower() == "true", browser_count)
+    return web_id
+
+
+def _next_command(session):
+    """현재 테스크 상태로 실행웹에 보낼 명령을 만들고, 필요한 상태 전이를 적용"""
+    current_type = session.task.state
+    if current_type == TaskType.NONE:
         return {
             "has_task": False,
             "message": "대기 중인 테스크가 없습니다."
         }
-    current_type = TASK_TYPE
     resp = {
         "has_task": True,
-        "task_type": current_type,
+        "task_type": int(current_type),
     }
 
-    if current_type == 1:
+    if current_type == TaskType.LOGIN:
         resp["type"] = "login"
-        resp["student_id"] = STUDENT_ID
-        resp["password"] = PASSWORD
-        LOGIN_EVENT.set()
-        TASK_TYPE = 0
+        resp["student_id"] = session.student_id
+        resp["password"] = session.password
+        session.task.transition(TaskType.NONE, expect=TaskType.LOGIN)
+        session.password = None # 실행 웹에 전달했으면 더 이상 보관하지 않음
 
-    elif current_type == 2:
+    elif current_type == TaskType.STATE:
         resp["type"] = "state"
-        resp["prompt_text"] = PROMPT_TEXT
-        TASK_TYPE = 3
+        resp["prompt_text"] = session.prompt_text
+        session.task.transition(TaskType.ACTION, expect=TaskType.STATE)
 
-    elif current_type == 3:
+    elif current_type == TaskType.ACTION:
         resp["type"] = "action"
 
-    elif current_type == 4:
+    elif current_type == TaskType.SHUTDOWN:
         resp["type"] = "shutdown"
-        TASK_TYPE = 0
+        session.task.transition(TaskType.NONE, expect=TaskType.SHUTDOWN)
 
     # ============================
     # ⭐ 추가: TASK_TYPE == 5 → verification 단계
     # ============================
-    elif current_type == 5:
+    elif current_type == TaskType.VERIFICATION:
         resp["type"] = "verification"
     # ============================
 
-    elif TASK_TYPE == 99:
-        TASK_TYPE = 0
-        print("[Command] TASK_TYPE=99 → 실행웹에 shutdown 명령 전달")
+    elif current_type == TaskType.LOGOUT:
+        session.task.transition(TaskType.NONE, expect=TaskType.LOGOUT)
+        log.info("[Command] TASK_TYPE=99 → 실행웹에 shutdown 명령 전달 (session: %s)", session.session_id)
+        SESSIONS.remove(session.session_id) # 로그아웃된 세션 정리 (default 세션은 유지)
         return {"has_task": True, "type": "shutdown"}
 
     return resp
 
 
+@app.get("/command")
+async def command(request: Request, browser_running: str = "false", browser_count: int = 0,
+                  session_id: Optional[str] = None, wait: float = 0, execution_web_id: Optional[str] = None):
+    """
+    wait > 0 이면 long-poll: 테스크가 없을 때 보낼 명령이 있는 상태로 전이되거나 wait 초가 지날 때까지 응답을 보류
+    (wait=0 이면 기존처럼 바로 응답)
+    execution_web_id: 실행 웹 구분용 (한 세션에 실행 웹이 여러 개일 때, 없으면 session_id)
+    세션은 /login, /execution_web/init 에서만 만들어짐 (모르는 session_id 로 폴링하면 404)
+    """
+    session = _get_session(session_id)
+    web_id = _record_poll(session, execution_web_id, browser_running, browser_count)
+
+    resp = _next_command(session)
+    if resp["has_task"] or wait <= 0:
+        return resp
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + min(wait, COMMAND_MAX_WAIT)
+    PRESENCE.poll_started(web_id)
+    try:
+        while not resp["has_task"]:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            await session.task.wait_for(PENDING_STATES, timeout=remaining)
+            if await request.is_disconnected():
+                # 연결이 끊긴 요청이 명령을 소비하지 않도록 여기서 종료
+                return resp
+            resp = _next_command(session)
+    finally:
+        PRESENCE.poll_finished(web_id)
+        _record_poll(session, web_id, browser_running, browser_count)
+    return resp
+
+
+@app.get("/command/stream")
+async def command_stream(request: Request, browser_running: str = "false", browser_count: int = 0,
+                         session_id: Optional[str] = None, execution_web_id: Optional[str] = None):
+    """
+    SSE(Server-Sent Events) 로 명령 전달
+    /prompt, /state, /action 등으로 상태가 바뀌는 즉시 다음 명령을 push
+    """
+    session = _get_session(session_id)
+
+    async def _events():
+        web_id = _record_poll(session, execution_web_id, browser_running, browser_count)
+        PRESENCE.poll_started(web_id)
+        try:
+            while not await request.is_disconnected():
+                _record_poll(session, web_id, browser_running, browser_count)
+                resp = _next_command(session)
+                # 명령을 만들면서 생긴 상태 전이 이후부터 변경을 기다림
+                version = session.task.version
+                if resp["has_task"]:
+                    yield f"id: {version}\ndata: {json.dumps(resp, ensure_ascii=False)}\n\n"
+                    if resp["type"] == "shutdown" and session.session_id not in SESSIONS:
+                        break  # 로그아웃으로 세션이 정리됨
+                changed = await session.task.wait_for_change(version, timeout=COMMAND_STREAM_KEEPALIVE)
+                if not changed:
+                    yield ": keep-alive\n\n"
+        finally:
+            PRESENCE.poll_finished(web_id)
+
+    return StreamingResponse(_events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 @app.get("/action")
-def get_action():
-    global TASK_TYPE, PROMPT_EVENT, PROMPT_TEXT
-    state_path = os.path.join(os.path.dirname(__file__), "state.json")
-    if not os.path.exists(state_path):
-        raise HTTPException(status_code=404, detail="state.json 파일이 존재하지 않습니다.")
-    with open(state_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
+async def get_action(session_id: Optional[str] = None):
+    session = _get_session(session_id)
+    started = time.perf_counter()
+    data = STATE_STORE.get(session.session_id, "state")
+    if data is None:
+        raise HTTPException(status_code=404, detail="state가 존재하지 않습니다.")
+
+    _apply_action_transition(session, data)
+    TRACER.add_span(session.trace_id, "action", started)
+    return JSONResponse(content=data)
+
 
+def _apply_action_transition(session, data):
+    """
+    액션 전달 후 테스크 상태 전이 (GET /action, POST /state?return_action 공통)
+    ACTION 상태가 아니면 (같은 액션을 다시 가져가는 경우 등) 상태는 그대로 둠
+    """
     generated_action = data.get("generated_action", {})
     action = generated_action.get("action")
     action_status = action.get("status") if action else None
 
-    is_last_action = (action_status == "FINISH")
+    # plan 은 마지막 step 까지 실행 웹이 로컬에서 실행 → 다음은 verification (또는 replan 요청)
+    plan = is_plan(generated_action)
+    is_last_action = (action_status == "FINISH") or plan
 
     if is_last_action:
-        print(f"[Action] 마지막 액션 전달 (status: FINISH), 작업 완료")
+        log.info("[Action] 마지막 액션 전달 (status: FINISH), 작업 완료")
 
         # =======================================
         # ⭐ 기존: TASK_TYPE = 0
         # ⭐ 변경: verification 단계로 넘겨야 함
         # =======================================
-        TASK_TYPE = 5     # ★ 여기 변경됨 ★
+        next_state = TaskType.VERIFICATION     # ★ 여기 변경됨 ★
         # =======================================
-
-        PROMPT_TEXT = None
-        PROMPT_EVENT.set()
     else:
-        print(f"[Action] 중간 액션 전달, TASK_TYPE=2로 변경 (다음 액션 생성 위해 state 요청)")
-        TASK_TYPE = 2
+        log.debug("[Action] 중간 액션 전달, TASK_TYPE=2로 변경 (다음 액션 생성 위해 state 요청)")
+        next_state = TaskType.STATE
 
-    return JSONResponse(content=data)
+    try:
+        session.task.transition(next_state, expect=TaskType.ACTION)
+    except InvalidTransition as e:
+        log.warning("[Action] %s (session: %s)", e, session.session_id)
+        return
+    if next_state == TaskType.VERIFICATION and not plan:
+        session.prompt_text = None  # plan 은 replan 에 프롬프트가 필요하므로 /verification 에서 정리
+
+
+def _finish_task(session, success, message):
+    """테스크 결과 저장 후 NONE 으로 전이 (/verification, plan 모드 replan 횟수 초과 공통)"""
+    session.status_success = success
+    session.status_message = message
+    session.prompt_text = None
+    if not success and session.plan_cache_keys:
+        # 검증 실패 → 이번 테스크에서 쓴 프롬프트의 캐시 항목 무효화
+        removed = PLAN_CACHE.invalidate_prompts(key[0] for key in session.plan_cache_keys)
+        log.info("[Verification] 검증 실패 → 캐시 %s개 무효화", removed)
+    session.plan_cache_keys = []
+    if session.task.state != TaskType.NONE:
+        try:
+            session.task.transition(TaskType.NONE)  # 대기 중인 /prompt 가 여기서 깨어남
+        except InvalidTransition as e:
+            log.warning("[Verification] %s (session: %s)", e, session.session_id)
+    TRACER.end(session.trace_id, outcome="success" if success else "failed")
+    session.trace_id = None
 
 
 # ===========================================
 # ⭐ 추가된 엔드포인트: /verification
 # ===========================================
 @app.post("/verification")
-def update_verification(request: VerificationUpdate):
-    global STATUS_SUCCESS, STATUS_MESSAGE, PROMPT_EVENT, TASK_TYPE
-    STATUS_SUCCESS = request.success
-    STATUS_MESSAGE = request.message
+async def update_verification(request: VerificationUpdate):
+    session = _get_session(request.session_id)
+    started = time.perf_counter()
     STATE_DATA = {
         "action_success": request.success,
         "action_description": "검증 완료",
         "message": request.message
     }
-    PROMPT_EVENT.set()
-    TASK_TYPE = 0
+    VERIFICATIONS_TOTAL.inc(success=str(request.success).lower())
+    TRACER.add_span(session.trace_id, "verification", started, success=request.success)
+    _finish_task(session, request.success, request.message)
     return {
         "ok": True,
-        "stored_success": STATUS_SUCCESS,
-        "stored_message": STATUS_MESSAGE
+        "stored_success": session.status_success,
+        "stored_message": session.status_message
     }
 # ===========================================
 
 
 @app.get("/status")
-def get_status():
-    base_dir = os.path.dirname(__file__)
-    state_path = os.path.join(base_dir, "state.json")
-    login_path = os.path.join(base_dir, "login_state.json")
+async def get_status(session_id: Optional[str] = None):
+    session = _get_session(session_id)
+    login_info = STATE_STORE.get(session.session_id, "login_state")
+    data = STATE_STORE.get(session.session_id, "state")
 
-    if not os.path.exists(login_path):
-        print("[Status] 로그인 세션 없음 → 로그인 화면으로 복귀")
+    if login_info is None:
+        log.debug("[Status] 로그인 세션 없음 → 로그인 화면으로 복귀")
         return {
             "status": "waiting",
             "message": "로그인 세션이 없습니다. 다시 로그인하세요.",
             "data": {"loginSuccess": False},
         }
-    
-    if not os.path.exists(state_path):
-        print("[Status] 로그인됨 + 작업 없음 → idle 상태 유지")
-        with open(login_path, "r", encoding="utf-8") as f:
-            login_info = json.load(f)
+
+    if data is None:
+        log.debug("[Status] 로그인됨 + 작업 없음 → idle 상태 유지")
         return {
             "status": "idle",
             "message": "현재 실행할 작업이 없습니다.",
@@ -368,96 +1085,249 @@ def get_status():
             },
         }
 
+    if "action_success" in data:
+        STATE_STORE.delete(session.session_id, "state")
+        log.debug("[Status] 실행 완료 감지 → state 삭제")
+        return {"status": "completed", "data": data}
+
+    log.debug("[Status] 실행 중 → state 유지")
+    return {"status": "processing", "data": data}
+
+
+def _request_shutdown(session):
+    """
+    실행 웹에 shutdown 명령 설정
+    로그아웃 명령이 아직 전달되지 않았으면 그 명령이 shutdown 으로 전달되므로 그대로 둠 (세션 정리는 LOGOUT 에서)
+    """
     try:
-        with open(state_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-
-        if "action_success" in data:
-            try:
-                os.remove(state_path)
-                print("[Status] 실행 완료 감지 → state.json 삭제")
-            except Exception as e:
-                print(f"[Status] state.json 삭제 실패: {e}")
-            return {"status": "completed", "data": data}
-
-        print("[Status] 실행 중 → state.json 유지")
-        return {"status": "processing", "data": data}
-
-    except Exception as e:
-        print(f"[Status] 상태 파일 읽기 오류: {e}")
-        return {
-            "status": "error",
-            "message": f"state.json 읽기 중 오류: {str(e)}",
-            "data": {"loginSuccess": True},
-        }
+        session.task.transition(TaskType.SHUTDOWN)
+    except InvalidTransition as e:
+        if e.current != TaskType.LOGOUT:
+            raise HTTPException(status_code=409, detail=str(e))
+        log.debug("[백엔드] 로그아웃 대기 중 → shutdown 명령 생략 (session: %s)", session.session_id)
 
 
 @app.post("/execution_web/shutdown")
 async def execution_web_shutdown(request: dict):
-    global EXECUTION_WEB_CONNECTED, BROWSER_RUNNING, BROWSER_COUNT, TASK_TYPE
-    EXECUTION_WEB_CONNECTED = False
-    BROWSER_RUNNING = False
-    BROWSER_COUNT = 0
-    TASK_TYPE = 4
-    print("[백엔드] 실행 웹 종료 신호 수신")
+    session = _get_session(request.get("session_id"))
+    if request.get("execution_web_id"):
+        PRESENCE.remove(request["execution_web_id"])
+    else:
+        PRESENCE.remove_session(session.session_id)
+    _request_shutdown(session)
+    log.info("[백엔드] 실행 웹 종료 신호 수신 (session: %s)", session.session_id)
     return {"ok": True, "message": "실행 웹 종료 신호 수신됨"}
 
 
 @app.post("/logout")
-async def logout():
-    global STUDENT_ID, PASSWORD, PROMPT_TEXT, LOGIN_EVENT, PROMPT_EVENT, TASK_TYPE
-
-    STUDENT_ID = None
-    PASSWORD = None
-    PROMPT_TEXT = None
-    LOGIN_EVENT.set()
-    PROMPT_EVENT.set()
-
-    TASK_TYPE = 99
-    
-    base_dir = os.path.dirname(__file__)
-    for fname in ["login_state.json", "state.json"]:
-        path = os.path.join(base_dir, fname)
-        if os.path.exists(path):
-            os.remove(path)
-            print(f"[로그아웃] {fname} 삭제 완료")
-
-    print("[백엔드] 로그아웃 요청 - 상태 초기화 완료")
+async def logout(session_id: Optional[str] = None):
+    session = _get_session(session_id)
+
+    session.student_id = None
+    session.password = None
+    session.prompt_text = None
+    TRACER.end(session.trace_id, outcome="logout")
+    session.trace_id = None
+
+    session.task.transition(TaskType.LOGOUT)  # 실행 중인 프롬프트 job 도 깨어남
+    cancelled = PROMPT_JOBS.cancel_session(session.session_id)
+    if cancelled:
+        log.info("[로그아웃] 대기 중인 프롬프트 %s개 취소", cancelled)
+
+    for key in ["login_state", "state"]:
+        if STATE_STORE.delete(session.session_id, key):
+            log.debug("[로그아웃] %s 삭제 완료", key)
+    await _release_screenshots(session)
+
+    log.info("[백엔드] 로그아웃 요청 - 상태 초기화 완료 (session: %s)", session.session_id)
     return {"ok": True, "message": "로그아웃 처리됨"}
 
 
 @app.post("/browser/close")
-async def close_browser():
-    global TASK_TYPE
-    TASK_TYPE = 4
-    print("[백엔드] 브라우저 닫기 명령 설정")
+async def close_browser(session_id: Optional[str] = None):
+    session = _get_session(session_id)
+    _request_shutdown(session)
+    log.info("[백엔드] 브라우저 닫기 명령 설정 (session: %s)", session.session_id)
     return {"ok": True, "message": "브라우저 닫기 명령 전송"}
 
 
 @app.get("/execution_web/status")
-async def execution_web_status():
-    global EXECUTION_WEB_CONNECTED, LAST_POLL_TIME, BROWSER_RUNNING, BROWSER_COUNT
-    import datetime
+async def execution_web_status(session_id: Optional[str] = None):
+    """세션에 연결된 실행 웹 상태 (실행 웹이 여러 개면 합침, long-poll / SSE 대기 중이면 연결된 것으로 봄)"""
+    session = _get_session(session_id)
+    return PRESENCE.session_status(session.session_id)
 
-    if LAST_POLL_TIME:
-        elapsed = (datetime.datetime.now() - LAST_POLL_TIME).total_seconds()
-        if elapsed > 8:
-            EXECUTION_WEB_CONNECTED = False
-            BROWSER_RUNNING = False
-            BROWSER_COUNT = 0
 
+@app.get("/execution_webs")
+async def list_execution_webs(session_id: Optional[str] = None, limit: int = 100, offset: int = 0):
+    """연결된 실행 웹 전체 (모니터링용, 최근 폴링 순)"""
     return {
-        "connected": EXECUTION_WEB_CONNECTED,
-        "last_poll_time": LAST_POLL_TIME.isoformat() if LAST_POLL_TIME else None,
-        "browser_running": BROWSER_RUNNING,
-        "browser_count": BROWSER_COUNT
+        "stats": PRESENCE.stats(),
+        "execution_webs": list(PRESENCE.list(session_id, limit=limit, offset=offset)),
     }
 
 
+@app.get("/sessions")
+async def list_sessions():
+    connected = PRESENCE.connected_sessions()
+    return {
+        "count": len(SESSIONS),
+        "sessions": [
+            {
+                "session_id": s.session_id,
+                "student_id": s.student_id,
+                "task_type": s.task_type,
+                "execution_web_connected": s.session_id in connected,
+            }
+            for s in SESSIONS.values()
+        ],
+    }
+
+
+@app.on_event("startup")
+async def _start_model_loading():
+    MODEL_MANAGER.start()
+    if MODEL_POOL is not None:
+        MODEL_POOL.start_health_checks() # worker ping / 죽은 worker 재시작
+    PRESENCE.start()
+    if SHARED_STATE is not None:
+        SHARED_STATE.start() # 다른 worker 의 상태 전이를 받아 이 worker 의 대기자를 깨움
+    if BLOB_TTL > 0:
+        asyncio.get_running_loop().create_task(_sweep_blobs())
+
+
+@app.get("/ready")
+async def ready():
+    """모델 로드 + warm-up 이 끝났으면 200, 아니면 503"""
+    status = MODEL_MANAGER.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+
+@app.on_event("shutdown")
+async def _flush_state_store():
+    # write-behind 저장소에 남은 변경 반영
+    STATE_STORE.close()
+    if TRACE_RECORDER is not None:
+        TRACE_RECORDER.close()
+    if SHARED_STATE is not None:
+        await SHARED_STATE.close()
+    if MODEL_POOL is not None:
+        await MODEL_POOL.close()
+
+
+@app.get("/plan_cache/stats")
+async def plan_cache_stats():
+    return {"enabled": PLAN_CACHE_ENABLED, **PLAN_CACHE.stats()}
+
+
+def _collect_metrics():
+    """scrape 시점의 세션 / 브라우저 / 대기열 / 캐시 / 모델 상태"""
+    sessions = list(SESSIONS.values())
+    presence = PRESENCE.stats()
+    inference = INFERENCE_EXECUTOR.stats()
+    cache = PLAN_CACHE.stats()
+    task_states = Counter(s.task.state.name.lower() for s in sessions)
+    families = [
+        ("active_sessions", "gauge", "세션 수", len(sessions)),
+        ("sessions_by_task_state", "gauge", "테스크 상태별 세션 수",
+         [({"state": name}, n) for name, n in sorted(task_states.items())]),
+        ("execution_webs_connected", "gauge", "연결된 실행 웹 수", presence["connected"]),
+        ("execution_webs_polling", "gauge", "long-poll / SSE 로 대기 중인 실행 웹 수", presence["polling"]),
+        ("execution_webs_expired_total", "counter", "폴링이 끊겨 만료된 실행 웹 수", presence["expired_total"]),
+        ("browsers_running", "gauge", "실행 웹이 보고한 브라우저 수 (browser_count 합)", presence["browser_count"]),
+        ("inference_queue_depth", "gauge", "추론 대기열 길이", inference["queue_depth"]),
+        ("inference_running", "gauge", "실행 중인 추론 수", inference["running"]),
+        ("inference_rejected_total", "counter", "대기열 초과로 거절된 추론 수", inference["rejected"]),
+        ("plan_cache_hits_total", "counter", "액션 캐시 hit", cache["hits"]),
+        ("plan_cache_misses_total", "counter", "액션 캐시 miss", cache["misses"]),
+        ("plan_cache_hit_rate", "gauge", "액션 캐시 hit rate", cache["hit_rate"]),
+        ("model_ready", "gauge", "모델 준비 여부",
+         [({"model": name}, m["state"] == "ready") for name, m in MODEL_MANAGER.status()["models"].items()]),
+    ]
+    jobs = PROMPT_JOBS.stats()
+    families += [
+        ("prompt_jobs_queued", "gauge", "대기 중인 프롬프트 job 수", jobs["queued"]),
+        ("prompt_jobs_running", "gauge", "실행 중인 프롬프트 job 수", jobs["running"]),
+        ("prompt_jobs", "gauge", "보관 중인 job 수 (상태별)",
+         [({"status": status}, n) for status, n in sorted(jobs["by_status"].items())]),
+    ]
+    if ACTION_BATCHER is not None:
+        families.append(("action_batch_queue_depth", "gauge", "액션 배처 대기열 길이", ACTION_BATCHER.queue_depth))
+    if MODEL_POOL is not None:
+        pool = MODEL_POOL.stats()
+        families += [
+            ("model_workers_healthy", "gauge", "정상 모델 worker 수", sum(w["healthy"] for w in pool["workers"])),
+            ("model_worker_inflight", "gauge", "worker 별 실행 중인 모델 호출 수",
+             [({"worker": str(w["index"])}, w["inflight"]) for w in pool["workers"]]),
+            ("model_worker_pending", "gauge", "worker 풀 대기 + 실행 중인 호출 수", pool["pending"]),
+            ("model_worker_rejected_total", "counter", "대기열 초과로 거절된 모델 호출 수", pool["rejected"]),
+            ("model_worker_retried_total", "counter", "worker 연결이 끊겨 다른 worker 로 재시도한 호출 수", pool["retried"]),
+        ]
+        if MODEL_POOL.processes is not None:
+            families.append(("model_worker_restarts_total", "counter", "재시작된 모델 worker 수",
+                             [({"worker": str(w["index"])}, w["restarts"]) for w in pool["workers"]]))
+    return families
+
+
+REGISTRY.add_collector(_collect_metrics)
+
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+@app.get("/traces")
+async def list_traces(session_id: Optional[str] = None, limit: int = 20):
+    """최근 테스크 trace (session_id 로 필터)"""
+    filters = {"session_id": session_id} if session_id else {}
+    return {"traces": TRACER.recent(limit, **filters)}
+
+
+@app.get("/traces/{trace_id}")
+async def get_trace(trace_id: str):
+    trace = TRACER.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail=f"trace 를 찾을 수 없습니다: {trace_id}")
+    return trace
+
+
+@app.get("/inference/status")
+async def inference_status():
+    stats = INFERENCE_EXECUTOR.stats()
+    if ACTION_BATCHER is not None:
+        stats["batching"] = ACTION_BATCHER.stats()
+    if MODEL_POOL is not None:
+        stats["model_pool"] = MODEL_POOL.stats()
+    return stats
+
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+    if workers > 1:
+        # worker 끼리 세션 / 테스크 상태를 공유해야 함 → 지정이 없으면 SQLite 파일 사용 (worker 들이 환경 변수를 물려받음)
+        if not os.environ.get("SHARED_STATE"):
+            path = os.environ.get("SHARED_STATE_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "shared_state.db"))
+            os.environ["SHARED_STATE"] = "sqlite:///" + path
+        log.info("[서버] worker %s개로 시작 (SHARED_STATE=%s)", workers, os.environ["SHARED_STATE"])
+        reset_shared_state_from_env() # 이전 실행에서 남은 세션 / 테스크 상태 삭제 (worker 를 띄우기 전에 한 번)
+        # 모델 worker 는 uvicorn worker 마다 띄우지 않고 여기서 한 번만 → uvicorn worker 들은 MODEL_POOL_DIR 로 연결만
+        model_workers = None if os.environ.get("MODEL_POOL_DIR") else model_workers_from_env(ACTION_MODEL_MODULE)
+        if model_workers is not None:
+            model_workers.start()
+            model_workers.supervise_in_background()
+            os.environ["MODEL_POOL_DIR"] = model_workers.socket_dir
+        try:
+            uvicorn.run("Api:app", host="0.0.0.0", port=port, workers=workers)
+        finally:
+            if model_workers is not None:
+                model_workers.stop()
+    else:
+        if reset_shared_state_from_env():
+            SESSIONS.get_or_create(None) # 삭제된 default 세션 다시 생성
+        uvicorn.run(app, host="0.0.0.0", port=port)
 
 
 
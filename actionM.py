@@ -1,77 +1,95 @@
-import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer
+import json
+
+from model_manager import load_causal_lm, warm_up
 
 # ---------------------------------------------
 # 1. 모델 경로 설정
 # ---------------------------------------------
 MODEL_PATH = "Action_model_v1"  # 현재 폴더 기준 경로
 
-# ---------------------------------------------
-# 2. 모델 및 토크나이저 불러오기
-# ---------------------------------------------
-print("모델과 토크나이저 로드 중...")
-tokenizer = AutoTokenizer.from_pretrained(MODEL_PATH)
-model = AutoModelForCausalLM.from_pretrained(MODEL_PATH)
-model.to("cuda" if torch.cuda.is_available() else "cpu")
-model.eval()
-print("✅ 모델 로드 완료!")
+model = None
+tokenizer = None
 
 # ---------------------------------------------
-# 3. 사용자 입력 받기
-# ---------------------------------------------
-user_input = input("\n[User] 명령을 입력하세요: ")
+# 2. 모델 및 토크나이저 불러오기
+# import 시점에는 로드하지 않음 (load() 호출 시 1회만)
+# MODEL_DTYPE=fp32|bf16|int8 로 정밀도 선택, safetensors 는 mmap 으로 로드
+# ---------------------------------------------
+def load(dtype=None):
+    global model, tokenizer
+    if model is None:
+        print("모델과 토크나이저 로드 중...")
+        model, tokenizer = load_causal_lm(MODEL_PATH, dtype=dtype)
+        warm_up(model, tokenizer)
+        print("✅ 모델 로드 완료!")
+    return model, tokenizer
 
-# ---------------------------------------------
-# 4. 대화 템플릿 구성
-# ---------------------------------------------
-messages = [
-    {"role": "system", "content": "You are a helpful AI assistant developed by Kakao."},
-    {"role": "user", "content": user_input},
-]
 
-# ---------------------------------------------
-# 5. 입력을 모델 토큰 포맷으로 변환
-# ---------------------------------------------
-inputs = tokenizer.apply_chat_template(
-    messages,
-    tokenize=True,
-    add_generation_prompt=True
-)
+def generate_action(user_input, max_new_tokens=128):
+    import torch
 
-input_ids = torch.tensor([inputs]).to(model.device)
-input_length = input_ids.shape[1]
+    load()
+    # ---------------------------------------------
+    # 4. 대화 템플릿 구성
+    # ---------------------------------------------
+    messages = [
+        {"role": "system", "content": "You are a helpful AI assistant developed by Kakao."},
+        {"role": "user", "content": user_input},
+    ]
 
-# ---------------------------------------------
-# 6. 모델로부터 답변 생성
-# ---------------------------------------------
-with torch.no_grad():
-    output = model.generate(
-        input_ids,
-        max_new_tokens=128,
-        pad_token_id=tokenizer.eos_token_id,
-        do_sample=False  # True로 바꾸면 확률적 샘플링
+    # ---------------------------------------------
+    # 5. 입력을 모델 토큰 포맷으로 변환
+    # ---------------------------------------------
+    inputs = tokenizer.apply_chat_template(
+        messages,
+        tokenize=True,
+        add_generation_prompt=True
     )
 
-# ---------------------------------------------
-# 7. 새로 생성된 부분만 추출 (입력 제외)
-# ---------------------------------------------
-generated_tokens = output[0][input_length:]
-response = tokenizer.decode(generated_tokens, skip_special_tokens=True)
+    input_ids = torch.tensor([inputs]).to(model.device)
+    input_length = input_ids.shape[1]
 
-# ---------------------------------------------
-# 8. 출력 결과 표시
-# ---------------------------------------------
-print("\n--- [Action 데이터] ---")
-print(response)
-print("-----------------------")
+    # ---------------------------------------------
+    # 6. 모델로부터 답변 생성
+    # ---------------------------------------------
+    with torch.no_grad():
+        output = model.generate(
+            input_ids,
+            max_new_tokens=max_new_tokens,
+            pad_token_id=tokenizer.eos_token_id,
+            do_sample=False  # True로 바꾸면 확률적 샘플링
+        )
 
-# ---------------------------------------------
-# 9. (선택) JSON 형태로 자동 파싱 시도
-# ---------------------------------------------
-try:
-    import json
-    parsed = json.loads(response.replace("'", "\""))
-    print("\n--- [JSON 파싱 결과] ---")
-    print(json.dumps(parsed, indent=2, ensure_ascii=False))
-except Exception as e:
-    print("\n⚠️ JSON 형식이 완벽하지 않아 파싱하지 않았습니다.")
\ No newline at end of file
+    # ---------------------------------------------
+    # 7. 새로 생성된 부분만 추출 (입력 제외)
+    # ---------------------------------------------
+    generated_tokens = output[0][input_length:]
+    return tokenizer.decode(generated_tokens, skip_special_tokens=True)
+
+
+if __name__ == "__main__":
+    load()
+
+    # ---------------------------------------------
+    # 3. 사용자 입력 받기
+    # ---------------------------------------------
+    user_input = input("\n[User] 명령을 입력하세요: ")
+
+    response = generate_action(user_input)
+
+    # ---------------------------------------------
+    # 8. 출력 결과 표시
+    # ---------------------------------------------
+    print("\n--- [Action 데이터] ---")
+    print(response)
+    print("-----------------------")
+
+    # ---------------------------------------------
+    # 9. (선택) JSON 형태로 자동 파싱 시도
+    # ---------------------------------------------
+    try:
+        parsed = json.loads(response.replace("'", "\""))
+        print("\n--- [JSON 파싱 결과] ---")
+        print(json.dumps(parsed, indent=2, ensure_ascii=False))
+    except Exception as e:
+        print("\n⚠️ JSON 형식이 완벽하지 않아 파싱하지 않았습니다.")
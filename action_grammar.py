@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+Action Grammar
+모델이 액션 JSON 스키마에 맞는 텍스트만 생성하도록 logits 를 마스킹하는 constrained decoding
+
+스키마 (MODEL_INTEGRATION_GUIDE.md 의 액션 형식):
+    {"name": "click" | "type" | "select" | "sleep" | "wait_for_selector" | "goto",
+     "args": {"<key>": "<string>" | <int>, ...},
+     "status": "FINISH"}          # status 는 선택
+
+- ActionGrammarState: 글자 단위 상태 기계. 지금까지의 텍스트가 유효한 액션 JSON 의 앞부분인지 판별
+- make_action_logits_processor: 매 step 점수가 높은 토큰부터 검사해서 문법에 맞는 토큰만 남김
+  JSON 객체가 닫히면 EOS 만 허용 (닫는 괄호에서 바로 종료)
+- 공백은 토큰 사이 한 칸까지만 허용 (들여쓰기 / 줄바꿈 없는 compact JSON 만 생성)
+"""
+
+ACTION_NAMES = ("click", "type", "select", "sleep", "wait_for_selector", "goto")
+STATUS_VALUES = ("FINISH",)
+REQUIRED_KEYS = frozenset(("name", "args"))
+_TOP_KEYS = {"name": ACTION_NAMES, "args": None, "status": STATUS_VALUES}
+_WHITESPACE = " "          # 토큰 사이 공백은 스페이스 한 칸까지만 (compact JSON, 공백 루프 방지)
+_ESCAPES = '"\\/bfnrt'
+MAX_WHITESPACE_RUN = 1
+MAX_STRING_LENGTH = 256
+
+
+class ActionGrammarState:
+    __slots__ = ("mode", "buf", "key", "seen", "escape", "ws_run", "digits")
+
+    def __init__(self):
+        self.mode = "start"
+        self.buf = ""           # 읽는 중인 key / enum 문자열
+        self.key = None         # 값을 읽는 중인 최상위 key
+        self.seen = frozenset()
+        self.escape = False
+        self.ws_run = 0
+        self.digits = 0
+
+    def copy(self):
+        other = ActionGrammarState.__new__(ActionGrammarState)
+        for name in self.__slots__:
+            setattr(other, name, getattr(self, name))
+        return other
+
+    @property
+    def done(self):
+        return self.mode == "done"
+
+    def feed(self, text):
+        """text 를 이어 붙여도 유효하면 True (False 면 상태가 망가졌으므로 버려야 함)"""
+        for ch in text:
+            if not self._step(ch):
+                return False
+        return True
+
+    # ============================
+    # 글자 하나 처리
+    # ============================
+    def _whitespace(self, ch):
+        if ch in _WHITESPACE:
+            self.ws_run += 1
+            return self.ws_run <= MAX_WHITESPACE_RUN
+        return None
+
+    def _string_char(self, ch):
+        """자유 문자열 안의 글자. 닫는 따옴표면 "close", 유효하면 True"""
+        if self.escape:
+            self.escape = False
+            return ch in _ESCAPES
+        if ch == "\\":
+            self.escape = True
+            return True
+        if ch == '"':
+            return "close"
+        if ch < " ":
+            return False
+        self.buf += ch
+        return len(self.buf) <= MAX_STRING_LENGTH
+
+    def _step(self, ch):
+        mode = self.mode
+
+        if mode in ("top_key", "enum", "arg_key", "arg_str"):
+            self.ws_run = 0
+            return getattr(self, "_" + mode)(ch)
+
+        if mode == "arg_num":
+            if ch.isdigit() and ch.isascii():
+                self.digits += 1
+                return self.digits <= 18
+            if not self.digits:
+                return False
+            self.mode = "args_after"
+            return self._step(ch)
+
+        if mode == "done":
+            return False
+
+        ws = self._whitespace(ch)
+        if ws is not None:
+            return ws
+        self.ws_run = 0
+
+        if mode == "start":
+            return self._goto(ch == "{", "top_key_open")
+        if mode == "top_key_open":
+            return self._goto(ch == '"', "top_key", buf="")
+        if mode == "top_colon":
+            return self._goto(ch == ":", "top_value")
+        if mode == "top_value":
+            if self.key == "args":
+                return self._goto(ch == "{", "args_first")
+            return self._goto(ch == '"', "enum", buf="")
+        if mode == "top_after":
+            if ch == ",":
+                return self._goto(len(self.seen) < len(_TOP_KEYS), "top_key_open")
+            return self._goto(ch == "}" and REQUIRED_KEYS <= self.seen, "done")
+        if mode in ("args_first", "args_next"):
+            if ch == "}" and mode == "args_first":
+                self.mode = "top_after"
+                return True
+            return self._goto(ch == '"', "arg_key", buf="")
+        if mode == "arg_colon":
+            return self._goto(ch == ":", "arg_value")
+        if mode == "arg_value":
+            if ch == '"':
+                return self._goto(True, "arg_str", buf="")
+            if ch == "-" or (ch.isdigit() and ch.isascii()):
+                self.digits = 0 if ch == "-" else 1
+                return self._goto(True, "arg_num")
+            return False
+        if mode == "args_after":
+            if ch == ",":
+                return self._goto(True, "args_next")
+            return self._goto(ch == "}", "top_after")
+        return False
+
+    def _goto(self, ok, mode, buf=None):
+        if ok:
+            self.mode = mode
+            if buf is not None:
+                self.buf = buf
+        return ok
+
+    def _top_key(self, ch):
+        if ch == '"':
+            if self.buf not in _TOP_KEYS or self.buf in self.seen:
+                return False
+            self.key = self.buf
+            self.seen = self.seen | {self.buf}
+            self.mode = "top_colon"
+            return True
+        self.buf += ch
+        return any(k.startswith(self.buf) and k not in self.seen for k in _TOP_KEYS)
+
+    def _enum(self, ch):
+        values = _TOP_KEYS[self.key]
+        if ch == '"':
+            return self._goto(self.buf in values, "top_after")
+        self.buf += ch
+        return any(v.startswith(self.buf) for v in values)
+
+    def _arg_key(self, ch):
+        result = self._string_char(ch)
+        if result == "close":
+            return self._goto(bool(self.buf), "arg_colon")
+        return result
+
+    def _arg_str(self, ch):
+        result = self._string_char(ch)
+        if result == "close":
+            return self._goto(True, "args_after")
+        return result
+
+
+def make_action_logits_processor(tokenizer, prompt_length, batch_size=1, top_k=64, max_scan=4096):
+    """
+    매 step 점수 순으로 토큰을 검사해서 문법에 맞는 것만 남기는 LogitsProcessor
+    - 상위 top_k 중 유효한 토큰을 모두 허용, 하나도 없으면 max_scan 까지 찾아서 첫 유효 토큰 허용
+    - 그래도 없으면 그 행은 제약 해제 (생성이 멈추지 않도록)
+    """
+    import torch
+    from transformers import LogitsProcessor, LogitsProcessorList
+
+    eos_ids = tokenizer.eos_token_id
+    eos_ids = list(eos_ids) if isinstance(eos_ids, (list, tuple)) else [eos_ids]
+    special_ids = set(getattr(tokenizer, "all_special_ids", []))
+    token_text = {}
+
+    def _text(token_id):
+        text = token_text.get(token_id)
+        if text is None:
+            text = token_text[token_id] = tokenizer.decode([token_id])
+        return text
+
+    class _ActionJson(LogitsProcessor):
+        def __init__(self):
+            self.states = [ActionGrammarState() for _ in range(batch_size)]
+            self.seen = prompt_length
+
+        def __call__(self, input_ids, scores):
+            # 직전 step 에 뽑힌 토큰으로 상태 갱신
+            for row, token_ids in enumerate(input_ids[:, self.seen:].tolist()):
+                state = self.states[row]
+                for token_id in token_ids:
+                    if state is not None and not state.done and token_id not in special_ids:
+                        if not state.feed(_text(token_id)):
+                            state = None
+                self.states[row] = state
+            self.seen = input_ids.shape[1]
+
+            masked = torch.full_like(scores, float("-inf"))
+            for row, state in enumerate(self.states):
+                if state is None:
+                    masked[row] = scores[row]
+                    continue
+                if state.done:
+                    masked[row, eos_ids] = 0
+                    continue
+                allowed = []
+                ranked = torch.topk(scores[row], min(max_scan, scores.shape[-1])).indices.tolist()
+                for rank, token_id in enumerate(ranked):
+                    if rank >= top_k and allowed:
+                        break
+                    if token_id in special_ids:
+                        continue
+                    text = _text(token_id)
+                    if text and state.copy().feed(text):
+                        allowed.append(token_id)
+                if allowed:
+                    masked[row, allowed] = scores[row, allowed]
+                else:
+                    masked[row] = scores[row]
+                    self.states[row] = None
+            return masked
+
+    return LogitsProcessorList([_ActionJson()])
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Action Plan
+plan 모드: 첫 /state 에서 모델을 한 번만 호출해 테스크 전체 액션 목록(+ step 별 checkpoint)을 만들고
+실행 웹이 그 목록을 로컬에서 차례로 실행하는 방식 (기존: 클릭 한 번마다 /state → 모델 → /action)
+
+plan 형식 (generated_action 자리에 그대로 들어감):
+    {"type": "plan",
+     "steps": [{"step": 1, "action": {"name": "goto", "args": {...}}, "description": "...",
+                "checkpoint": {"url_contains": "main.clx"}},
+               ...
+               {"step": 3, "action": {..., "status": "FINISH"}, "description": "...", "checkpoint": null}],
+     "total_steps": 3,
+     "replan": 0}        # 이번 테스크에서 몇 번째 replan 인지 (서버가 붙임)
+step 번호는 테스크 전체 기준 (replan 한 plan 은 실패한 step 번호부터 시작)
+
+checkpoint: step 을 실행한 뒤 ui_state 가 만족해야 하는 조건 (없으면 검사 안 함, 조건이 여러 개면 모두 만족)
+    url_contains      : ui_state.url 에 이 문자열이 포함
+    sidebar_item      : 이 label 의 메뉴가 보임 (최상위이거나 부모가 모두 펼쳐져 있음)
+    sidebar_expanded  : 이 label 의 메뉴가 펼쳐져 있음
+    title             : current_page.title 이 같음
+실행 웹은 check_checkpoint 와 같은 규칙으로 검사하고, 실패하면 그 step 에서 멈추고
+/state 로 현재 ui_state + plan_failure = {"step": n, "reason": "..."} 를 보냄 → 서버가 그 지점부터 다시 계획 (replan)
+"""
+from action_grammar import ACTION_NAMES
+
+PLAN_TYPE = "plan"
+MAX_PLAN_STEPS = 50
+CHECKPOINT_KEYS = ("url_contains", "sidebar_item", "sidebar_expanded", "title")
+
+
+class PlanError(ValueError):
+    """모델이 만든 plan 형식이 잘못됨"""
+
+
+def is_plan(generated_action):
+    return isinstance(generated_action, dict) and generated_action.get("type") == PLAN_TYPE
+
+
+def validate_plan(plan, first_step=1):
+    """
+    모델 출력(generated_plan)을 검사하고 정리한 plan 반환
+    - step 번호는 first_step 부터 다시 매김 (replan 이면 실패한 step 부터 남은 step 만 들어 있음)
+    - 마지막 step 의 액션에는 status: "FINISH" (실행 웹이 끝난 뒤 verification 으로 넘어가는 기준)
+    Raises:
+        PlanError
+    """
+    if not isinstance(plan, dict):
+        raise PlanError("plan 이 객체가 아닙니다.")
+    steps = plan.get("steps")
+    if not isinstance(steps, list) or not steps:
+        raise PlanError("plan 에 steps 가 없습니다.")
+    if len(steps) > MAX_PLAN_STEPS:
+        raise PlanError(f"plan step 이 너무 많습니다. ({len(steps)} > {MAX_PLAN_STEPS})")
+
+    normalized = []
+    for i, step in enumerate(steps):
+        if not isinstance(step, dict):
+            raise PlanError(f"steps[{i}] 가 객체가 아닙니다.")
+        action = step.get("action")
+        if not isinstance(action, dict) or action.get("name") not in ACTION_NAMES:
+            raise PlanError(f"steps[{i}]: 알 수 없는 액션: {action!r}")
+        if not isinstance(action.get("args", {}), dict):
+            raise PlanError(f"steps[{i}]: args 가 객체가 아닙니다.")
+        checkpoint = step.get("checkpoint") or None
+        if checkpoint is not None:
+            if not isinstance(checkpoint, dict):
+                raise PlanError(f"steps[{i}]: checkpoint 가 객체가 아닙니다.")
+            unknown = set(checkpoint) - set(CHECKPOINT_KEYS)
+            if unknown:
+                raise PlanError(f"steps[{i}]: 지원하지 않는 checkpoint: {sorted(unknown)}")
+        action = {key: value for key, value in action.items() if key != "status"}
+        if i == len(steps) - 1:
+            action["status"] = "FINISH"
+        normalized.append({
+            "step": first_step + i,
+            "action": action,
+            "description": step.get("description"),
+            "checkpoint": checkpoint,
+        })
+
+    return {
+        "type": PLAN_TYPE,
+        "steps": normalized,
+        "total_steps": first_step - 1 + len(normalized),
+        "description": plan.get("description"),
+    }
+
+
+# ============================
+# checkpoint 검사 (실행 웹과 같은 규칙)
+# ============================
+def _find_item(items, label, visible=True):
+    """label 이 같은 사이드바 메뉴 (visible 이면 펼쳐진 부모 아래에서만 찾음)"""
+    for item in items or []:
+        if item.get("label") == label:
+            return item
+        if visible and not item.get("expanded"):
+            continue
+        found = _find_item(item.get("sub_items"), label, visible)
+        if found is not None:
+            return found
+    return None
+
+
+def check_checkpoint(checkpoint, ui_state):
+    """
+    Returns:
+        None 이면 통과, 아니면 실패 이유
+    """
+    if not checkpoint:
+        return None
+    ui_state = ui_state or {}
+    url = ui_state.get("url") or ""
+    sidebar = ui_state.get("sidebar")
+
+    if "url_contains" in checkpoint and checkpoint["url_contains"] not in url:
+        return f"url 에 {checkpoint['url_contains']!r} 가 없습니다. (현재 {url!r})"
+    if "sidebar_item" in checkpoint and _find_item(sidebar, checkpoint["sidebar_item"]) is None:
+        return f"메뉴 {checkpoint['sidebar_item']!r} 가 보이지 않습니다."
+    if "sidebar_expanded" in checkpoint:
+        item = _find_item(sidebar, checkpoint["sidebar_expanded"])
+        if item is None or not item.get("expanded"):
+            return f"메뉴 {checkpoint['sidebar_expanded']!r} 가 펼쳐지지 않았습니다."
+    if "title" in checkpoint:
+        title = (ui_state.get("current_page") or {}).get("title")
+        if title != checkpoint["title"]:
+            return f"화면 제목이 {checkpoint['title']!r} 가 아닙니다. (현재 {title!r})"
+    return None
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""
+Blob Store
+스크린샷 같은 큰 바이너리를 sha256 으로 주소를 매겨 디스크에 저장하고,
+/state 데이터에는 참조({"blob": digest, ...})만 남기기 위한 저장소
+
+- 업로드 스트림을 청크 단위로 임시 파일에 쓰면서 해시 (이미지 크기만큼 메모리에 올리지 않음)
+- 같은 내용은 한 번만 저장 (content-addressed)
+- 소유자(세션)별 참조는 owners/<세션 해시>/<digest> hardlink → 링크 수가 참조 수
+  (여러 worker 프로세스가 같은 디렉터리를 써도 디스크만 보고 판단)
+  release(owner) 로 참조를 지우면 아무도 참조하지 않는 blob 은 삭제, sweep(max_age) 는 오래된 참조 / blob 정리
+- Pillow 가 설치되어 있고 SCREENSHOT_MAX_SIDE / SCREENSHOT_JPEG_QUALITY 가 설정되면
+  축소 / JPEG 재인코딩 후 저장 (Pillow 가 없으면 원본 그대로 저장)
+"""
+import base64
+import binascii
+import hashlib
+import io
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+OWNERS_DIR = "owners"
+_DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+_DATA_URL_RE = re.compile(r"^data:[^;,]*;base64,")
+
+
+def sniff_content_type(head):
+    """파일 앞부분 매직 바이트로 이미지 형식 판별"""
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+
+class BlobStore:
+    def __init__(self, directory, max_side=None, jpeg_quality=None):
+        """
+        Args:
+            max_side: 긴 변이 이보다 크면 축소 (None 이면 축소 안 함)
+            jpeg_quality: 설정하면 JPEG 로 재인코딩 (None 이면 원본 형식 유지)
+        """
+        self.directory = directory
+        self.max_side = max_side
+        self.jpeg_quality = jpeg_quality
+        self._lock = threading.Lock()
+        self.stored = 0
+        self.deduplicated = 0
+        self.bytes_in = 0
+        self.bytes_stored = 0
+        self.removed = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def transcodes(self):
+        return self.max_side is not None or self.jpeg_quality is not None
+
+    def path(self, digest):
+        if not _DIGEST_RE.match(digest or ""):
+            return None
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def exists(self, digest):
+        path = self.path(digest)
+        return path is not None and os.path.exists(path)
+
+    def content_type(self, digest):
+        with open(self.path(digest), "rb") as f:
+            return sniff_content_type(f.read(16))
+
+    # ============================
+    # 소유자(세션) 참조
+    # ============================
+    def _owner_dir(self, owner):
+        return os.path.join(self.directory, OWNERS_DIR, hashlib.sha256(owner.encode("utf-8")).hexdigest()[:32])
+
+    def _link(self, digest, owner):
+        link = os.path.join(self._owner_dir(owner), digest)
+        if not os.path.exists(link):
+            os.makedirs(os.path.dirname(link), exist_ok=True)
+            os.link(self.path(digest), link)
+
+    def owns(self, owner, digest):
+        return self.path(digest) is not None and os.path.exists(os.path.join(self._owner_dir(owner), digest))
+
+    def _remove_unreferenced(self, digest, cutoff=None):
+        """owners 링크가 하나도 없으면 (cutoff 가 있으면 그보다 오래된 것만) blob 삭제"""
+        path = self.path(digest)
+        try:
+            st = os.stat(path)
+            if st.st_nlink > 1 or (cutoff is not None and st.st_mtime >= cutoff):
+                return False
+            os.remove(path)
+        except FileNotFoundError:
+            return False
+        self.removed += 1
+        return True
+
+    def release(self, owner):
+        """owner 의 참조를 모두 지우고 더 이상 참조되지 않는 blob 삭제 → 삭제한 blob 수"""
+        owner_dir = self._owner_dir(owner)
+        removed = 0
+        with self._lock:
+            try:
+                names = os.listdir(owner_dir)
+            except FileNotFoundError:
+                return 0
+            for name in names:
+                try:
+                    os.remove(os.path.join(owner_dir, name))
+                except FileNotFoundError:
+                    continue
+                removed += self._remove_unreferenced(name)
+            try:
+                os.rmdir(owner_dir)
+            except OSError:
+                pass
+        return removed
+
+    def sweep(self, max_age):
+        """
+        max_age 초보다 오래된 참조(끝나지 않은 테스크 등)와 참조 없는 blob 삭제 → 삭제한 blob 수
+        blob / 참조의 mtime 은 같은 내용이 다시 올라올 때마다 갱신됨
+        """
+        cutoff = time.time() - max_age
+        owners_root = os.path.join(self.directory, OWNERS_DIR)
+        removed = 0
+        with self._lock:
+            for root, _, names in os.walk(owners_root):
+                for name in names:
+                    link = os.path.join(root, name)
+                    try:
+                        if os.stat(link).st_mtime < cutoff:
+                            os.remove(link)
+                    except FileNotFoundError:
+                        pass
+            for entry in os.scandir(self.directory):
+                if entry.is_dir() and len(entry.name) == 2:
+                    for name in os.listdir(entry.path):
+                        if _DIGEST_RE.match(name):
+                            removed += self._remove_unreferenced(name, cutoff)
+        return removed
+
+    # ============================
+    # 저장
+    # ============================
+    def put_stream(self, fileobj, owner=None):
+        """
+        파일 객체를 청크 단위로 읽어 저장하고 참조 dict 를 돌려줌
+        {"blob": sha256, "content_type": ..., "size": 저장된 바이트, "original_size": 받은 바이트}
+        owner 가 있으면 그 소유자의 참조로 기록 (release(owner) 까지 유지)
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        original_size = 0
+        try:
+            with os.fdopen(fd, "wb") as out:
+                while True:
+                    chunk = fileobj.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+                    original_size += len(chunk)
+
+            if self.transcodes:
+                self._transcode(tmp_path)
+
+            sha = hashlib.sha256()
+            with open(tmp_path, "rb") as f:
+                head = f.read(16)
+                sha.update(head)
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                    sha.update(chunk)
+            digest = sha.hexdigest()
+            size = os.path.getsize(tmp_path)
+
+            final_path = self.path(digest)
+            with self._lock:
+                self.bytes_in += original_size
+                try:
+                    # 이미 있으면 참조만 추가하고 mtime 갱신 (다른 프로세스가 방금 지웠으면 아래에서 다시 저장)
+                    if owner is not None:
+                        self._link(digest, owner)
+                    os.utime(final_path)
+                    self.deduplicated += 1
+                    os.remove(tmp_path)
+                except FileNotFoundError:
+                    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                    os.replace(tmp_path, final_path)
+                    self.stored += 1
+                    self.bytes_stored += size
+                    if owner is not None:
+                        self._link(digest, owner)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        return {
+            "blob": digest,
+            "content_type": sniff_content_type(head),
+            "size": size,
+            "original_size": original_size,
+        }
+
+    def put_bytes(self, data, owner=None):
+        return self.put_stream(io.BytesIO(data), owner)
+
+    def put_base64(self, text, owner=None):
+        """
+        기존 클라이언트가 보내는 base64 (data URL 포함) 스크린샷 저장
+        Raises:
+            ValueError: base64 가 아니거나 비어 있음 (공백 / 줄바꿈 외의 문자는 무시하지 않음)
+        """
+        text = "".join(_DATA_URL_RE.sub("", text, count=1).split())
+        try:
+            data = base64.b64decode(text, validate=True)
+        except (binascii.Error, ValueError) as e:
+            raise ValueError(f"base64 디코딩 실패: {e}")
+        if not data:
+            raise ValueError("스크린샷이 비어 있습니다.")
+        return self.put_bytes(data, owner)
+
+    def _transcode(self, path):
+        """축소 / JPEG 재인코딩 (Pillow 가 없거나 이미지가 아니면 원본 유지)"""
+        try:
+            from PIL import Image
+        except ImportError:
+            return
+        try:
+            with Image.open(path) as img:
+                img.load()
+                if self.max_side and max(img.size) > self.max_side:
+                    img.thumbnail((self.max_side, self.max_side))
+                if self.jpeg_quality is not None:
+                    fmt, options = "JPEG", {"quality": self.jpeg_quality, "optimize": True}
+                    if img.mode not in ("RGB", "L"):
+                        img = img.convert("RGB")
+                else:
+                    fmt, options = img.format or "PNG", {}
+                with open(path, "wb") as out:
+                    img.save(out, format=fmt, **options)
+        except OSError as e:
+            log.warning("[BlobStore] 이미지 변환 실패, 원본 저장: %s", e)
+
+    # ============================
+    # 조회
+    # ============================
+    def open(self, digest):
+        path = self.path(digest)
+        if path is None or not os.path.exists(path):
+            return None
+        return open(path, "rb")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "directory": self.directory,
+                "max_side": self.max_side,
+                "jpeg_quality": self.jpeg_quality,
+                "stored": self.stored,
+                "deduplicated": self.deduplicated,
+                "bytes_in": self.bytes_in,
+                "bytes_stored": self.bytes_stored,
+                "removed": self.removed,
+            }
+
+
+def from_env():
+    """
+    BLOB_STORE_DIR          (기본 ./blob_store)
+    SCREENSHOT_MAX_SIDE     긴 변 최대 픽셀 (기본: 축소 안 함)
+    SCREENSHOT_JPEG_QUALITY JPEG 품질 1~95 (기본: 재인코딩 안 함)
+    """
+    max_side = os.environ.get("SCREENSHOT_MAX_SIDE")
+    quality = os.environ.get("SCREENSHOT_JPEG_QUALITY")
+    return BlobStore(
+        os.environ.get("BLOB_STORE_DIR", os.path.join(os.path.dirname(__file__), "blob_store")),
+        max_side=int(max_side) if max_side else None,
+        jpeg_quality=int(quality) if quality else None,
+    )
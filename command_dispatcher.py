@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Command Dispatcher
+main.py 의 _Store(command_queues / prompts / states / actions + 전역 Lock 하나)를 대체하는 명령 분배기
+
+- 세션별 deque: /command 에서 O(1) popleft
+- 세션 / command_id 해시로 나눈 shard 마다 Lock (다른 세션끼리는 경합하지 않음)
+- await get(session_id, timeout): 명령이 없으면 들어올 때까지 대기 (long-poll)
+- command 기록(prompt, states, action)은 LRU + 유휴 TTL 로 제거, state 는 command 당 최근 N 개만 보관
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class CommandQueueFull(Exception):
+    """세션의 대기 명령이 max_pending 을 넘음"""
+
+
+class _CommandRecord:
+    __slots__ = ("prompt", "states", "action", "touched_at")
+
+    def __init__(self, prompt, max_states):
+        self.prompt = prompt
+        self.states = deque(maxlen=max_states)
+        self.action = None
+        self.touched_at = time.monotonic()
+
+
+class _Shard:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queues = {}              # session_id -> deque[command dict]
+        self.waiters = {}             # session_id -> list[(loop, asyncio.Future)]
+        self.records = OrderedDict()  # command_id -> _CommandRecord (오래 안 쓰인 순)
+
+
+class CommandDispatcher:
+    def __init__(self, shards=16, max_pending=100, max_commands=4096, idle_ttl=3600, max_states=20):
+        """
+        Args:
+            max_pending: 세션당 아직 안 가져간 명령 최대 개수
+            max_commands: 보관할 command 기록 최대 개수 (전체, shard 별로 나눔)
+            idle_ttl: 마지막 state/action 이후 이 시간(초)이 지난 command 기록은 제거
+            max_states: command 당 보관할 최근 state 개수
+        """
+        self._shards = [_Shard() for _ in range(max(1, shards))]
+        self.max_pending = max_pending
+        self.max_commands_per_shard = max(1, max_commands // len(self._shards))
+        self.idle_ttl = idle_ttl
+        self.max_states = max_states
+        self._sessions = {}  # session_id -> username (dict 단일 연산은 GIL 로 원자적)
+        self.evicted = 0
+
+    def _shard(self, key):
+        return self._shards[hash(key) % len(self._shards)]
+
+    # ============================
+    # 세션
+    # ============================
+    def add_session(self, session_id, username):
+        self._sessions[session_id] = username
+
+    def has_session(self, session_id):
+        return session_id in self._sessions
+
+    # ============================
+    # 명령 큐
+    # ============================
+    def enqueue(self, session_id, command):
+        """command: {"command_id", "prompt", "created_at"}"""
+        record_shard = self._shard(command["command_id"])
+        with record_shard.lock:
+            record_shard.records[command["command_id"]] = _CommandRecord(command["prompt"], self.max_states)
+            self._evict(record_shard)
+
+        shard = self._shard(session_id)
+        with shard.lock:
+            q = shard.queues.setdefault(session_id, deque())
+            full = len(q) >= self.max_pending
+            if not full:
+                q.append(command)
+                waiters = shard.waiters.pop(session_id, [])
+        if full:
+            with record_shard.lock:
+                record_shard.records.pop(command["command_id"], None)
+            raise CommandQueueFull(f"대기 중인 명령이 너무 많습니다. (max_pending={self.max_pending})")
+
+        # 기다리던 get() 을 깨움 (명령은 깨어난 쪽이 직접 pop)
+        for loop, fut in waiters:
+            loop.call_soon_threadsafe(_wake, fut)
+
+    def pop(self, session_id):
+        shard = self._shard(session_id)
+        with shard.lock:
+            q = shard.queues.get(session_id)
+            return q.popleft() if q else None
+
+    async def get(self, session_id, timeout):
+        """명령이 있으면 바로, 없으면 timeout 초까지 기다렸다가 반환 (없으면 None)"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            shard = self._shard(session_id)
+            with shard.lock:
+                q = shard.queues.get(session_id)
+                if q:
+                    return q.popleft()
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return None
+                fut = loop.create_future()
+                shard.waiters.setdefault(session_id, []).append((loop, fut))
+            try:
+                await asyncio.wait_for(fut, remaining)
+            except asyncio.TimeoutError:
+                with shard.lock:
+                    waiters = shard.waiters.get(session_id)
+                    if waiters and (loop, fut) in waiters:
+                        waiters.remove((loop, fut))
+                        if not waiters:
+                            del shard.waiters[session_id]
+
+    def pending(self, session_id):
+        shard = self._shard(session_id)
+        with shard.lock:
+            return len(shard.queues.get(session_id) or ())
+
+    # ============================
+    # command 기록 (prompt / states / action)
+    # ============================
+    def _touch(self, shard, command_id):
+        """기록을 최근 사용으로 갱신 (/prompt 없이 들어온 command_id 도 기존처럼 받아줌)"""
+        record = shard.records.get(command_id)
+        if record is None:
+            record = shard.records[command_id] = _CommandRecord("", self.max_states)
+        else:
+            record.touched_at = time.monotonic()
+            shard.records.move_to_end(command_id)
+        return record
+
+    def _evict(self, shard):
+        """shard.lock 을 잡은 상태에서 호출"""
+        expire_before = time.monotonic() - self.idle_ttl
+        while shard.records:
+            command_id, record = next(iter(shard.records.items()))
+            if len(shard.records) <= self.max_commands_per_shard and record.touched_at >= expire_before:
+                break
+            del shard.records[command_id]
+            self.evicted += 1
+
+    def prompt(self, command_id):
+        shard = self._shard(command_id)
+        with shard.lock:
+            record = shard.records.get(command_id)
+            return record.prompt if record is not None else None
+
+    def add_state(self, command_id, state):
+        shard = self._shard(command_id)
+        with shard.lock:
+            self._touch(shard, command_id).states.append(state)
+            self._evict(shard)
+
+    def set_action(self, command_id, action):
+        shard = self._shard(command_id)
+        with shard.lock:
+            self._touch(shard, command_id).action = action
+            self._evict(shard)
+
+    def get_action(self, command_id):
+        shard = self._shard(command_id)
+        with shard.lock:
+            record = shard.records.get(command_id)
+            return record.action if record is not None else None
+
+    def stats(self):
+        commands = pending = waiters = 0
+        for shard in self._shards:
+            with shard.lock:
+                commands += len(shard.records)
+                pending += sum(len(q) for q in shard.queues.values())
+                waiters += sum(len(w) for w in shard.waiters.values())
+        return {
+            "shards": len(self._shards),
+            "sessions": len(self._sessions),
+            "commands": commands,
+            "pending": pending,
+            "waiters": waiters,
+            "evicted": self.evicted,
+        }
+
+
+def _wake(fut):
+    if not fut.done():
+        fut.set_result(True)
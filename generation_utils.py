@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+Generation Utils
+HF transformers 모델(model, tokenizer)을 직접 다루는 생성 헬퍼 모음
+torch 는 실제로 생성할 때만 import (Mock 모드에서는 필요 없음)
+
+- format_prompt / format_prompt_parts: QwenGenerator.generate 와 같은 프롬프트 형식 (모델을 직접 호출하는 경로용)
+- batch_generate: 여러 프롬프트를 한 번에 generate
+- stream_generate: 토큰이 나오는 대로 텍스트 조각을 yield (SSE 용)
+- stream_into: 이 스레드에서 generate 하면서 streamer 로 조각을 보냄 (배처 스레드에서 스트리밍할 때)
+- JsonObjectTracker / json_stopping_criteria: 액션 JSON 객체가 닫히면 바로 디코딩 중단
+- GenerationTimer: prefill(첫 토큰까지) / decode 시간, 생성 토큰 수를 /metrics 에 기록
+"""
+import json
+import threading
+import time
+
+from metrics import REGISTRY
+
+GENERATED_TOKENS = REGISTRY.counter("generated_tokens_total", "생성된 토큰 수", ("path",))
+PREFILL_SECONDS = REGISTRY.histogram("generation_prefill_seconds", "prefill 시간 (첫 토큰이 나올 때까지)", ("path",))
+DECODE_SECONDS = REGISTRY.histogram("generation_decode_seconds", "첫 토큰 이후 decode 시간", ("path",))
+
+
+def hf_parts(generator):
+    """generator 가 HF model/tokenizer 를 들고 있으면 (model, tokenizer), 아니면 None"""
+    model = getattr(generator, "model", None)
+    tokenizer = getattr(generator, "tokenizer", None)
+    if model is None or tokenizer is None:
+        return None
+    return model, tokenizer
+
+
+def format_prompt(generator, prompt):
+    """
+    generator.generate 가 모델에 넣는 것과 같은 형식의 프롬프트
+    (batch_generate / prefix KV-cache / 스트리밍 / speculative 처럼 모델을 직접 호출할 때 그대로 쓰면 형식이 빠짐)
+
+    generator.format_prompt 가 있으면 그것, 없으면 tokenizer 의 chat template (user 메시지 + assistant 시작),
+    chat template 도 없으면 프롬프트 그대로
+    """
+    custom = getattr(generator, "format_prompt", None)
+    if custom is not None:
+        return custom(prompt)
+    tokenizer = getattr(generator, "tokenizer", None)
+    if getattr(tokenizer, "chat_template", None):
+        return tokenizer.apply_chat_template([{"role": "user", "content": prompt}],
+                                             tokenize=False, add_generation_prompt=True)
+    return prompt
+
+
+def format_prompt_parts(generator, prefix, suffix):
+    """
+    format_prompt(prefix + suffix) 를 (prefix 까지, 나머지) 로 나눔 (prefix KV-cache 용)
+    형식이 프롬프트를 그대로 감싸지 않아서 나눌 수 없으면 ("", 전체)
+    """
+    text = format_prompt(generator, prefix + suffix)
+    start = text.find(prefix + suffix)
+    if start < 0:
+        return "", text
+    cut = start + len(prefix)
+    return text[:cut], text[cut:]
+
+
+class JsonObjectTracker:
+    """
+    텍스트를 조각 단위로 받아서 첫 번째 최상위 JSON 객체가 닫혔는지 추적
+    (문자열 안의 괄호 / 이스케이프 처리, 객체 앞의 잡음 텍스트는 무시)
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.started = False
+        self.complete = False
+
+    def feed(self, text):
+        if self.complete:
+            return True
+        for ch in text:
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == "{":
+                self.depth += 1
+                self.started = True
+            elif not self.started:
+                continue
+            elif ch == '"':
+                self.in_string = True
+            elif ch == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    self.complete = True
+                    return True
+        return False
+
+
+def truncate_after_json(text):
+    """첫 JSON 객체가 닫힌 위치까지만 남김 (닫히지 않았으면 그대로)"""
+    tracker = JsonObjectTracker()
+    for i, ch in enumerate(text):
+        if tracker.feed(ch):
+            return text[:i + 1]
+    return text
+
+
+def extract_json_object(text):
+    """text 에서 첫 번째 완성된 JSON 객체를 dict 로 (없거나 파싱 실패면 None)"""
+    start = text.find("{")
+    if start < 0:
+        return None
+    tracker = JsonObjectTracker()
+    for i, ch in enumerate(text[start:], start):
+        if tracker.feed(ch):
+            try:
+                parsed = json.loads(text[start:i + 1])
+            except ValueError:
+                return None
+            return parsed if isinstance(parsed, dict) else None
+    return None
+
+
+class GenerationTimer:
+    """
+    생성 한 번의 prefill / decode 시간 측정
+    path: 메트릭 label (batch | stream | prefix_cache | speculative | draft_model)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.started = time.perf_counter()
+        self.first_token_at = None
+
+    def mark_first_token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+
+    def attach(self, gen_kwargs):
+        """
+        generate kwargs 의 stopping_criteria 에 첫 토큰 시각 기록용 criteria 를 추가
+        (StoppingCriteria 는 토큰이 하나 생성될 때마다 불림, 생성을 멈추지는 않음)
+        """
+        import torch
+        from transformers import StoppingCriteria, StoppingCriteriaList
+
+        timer = self
+
+        class _FirstToken(StoppingCriteria):
+            def __call__(self, input_ids, scores, **kwargs):
+                timer.mark_first_token()
+                return torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+
+        criteria = gen_kwargs.get("stopping_criteria") or StoppingCriteriaList()
+        criteria.append(_FirstToken())
+        gen_kwargs["stopping_criteria"] = criteria
+        return gen_kwargs
+
+    def finish(self, tokens):
+        ended = time.perf_counter()
+        first = self.first_token_at or ended
+        PREFILL_SECONDS.observe(first - self.started, path=self.path)
+        DECODE_SECONDS.observe(ended - first, path=self.path)
+        GENERATED_TOKENS.inc(int(tokens), path=self.path)
+
+
+def json_stopping_criteria(tokenizer, prompt_length, batch_size=1):
+    """
+    행마다 새로 생성된 토큰을 JsonObjectTracker 에 넣고, JSON 객체가 닫힌 행은 생성 종료
+    (행별 bool 텐서를 돌려주므로 batch_generate 에서도 행마다 따로 멈춤)
+    """
+    import torch
+    from transformers import StoppingCriteria, StoppingCriteriaList
+
+    class _JsonStop(StoppingCriteria):
+        def __init__(self):
+            self.trackers = [JsonObjectTracker() for _ in range(batch_size)]
+            self.seen = prompt_length
+
+        def __call__(self, input_ids, scores, **kwargs):
+            new_tokens = input_ids[:, self.seen:]
+            self.seen = input_ids.shape[1]
+            done = [
+                tracker.feed(tokenizer.decode(row, skip_special_tokens=True))
+                for tracker, row in zip(self.trackers, new_tokens)
+            ]
+            return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+    return StoppingCriteriaList([_JsonStop()])
+
+
+def stream_generate(model, tokenizer, prompt, max_new_tokens=128, temperature=0.7, top_p=0.95, stop_at_json=False):
+    """
+    generate 를 백그라운드 스레드에서 돌리고 디코딩된 텍스트 조각을 나오는 대로 yield
+    stop_at_json=True 면 첫 JSON 객체가 닫히는 순간 생성 종료
+    """
+    from transformers import TextIteratorStreamer
+
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+    error = []
+
+    def _run():
+        try:
+            stream_into(model, tokenizer, prompt, streamer, max_new_tokens, temperature, top_p, stop_at_json)
+        except BaseException as e:
+            error.append(e)
+            streamer.end()
+
+    thread = threading.Thread(target=_run, name="stream-generate", daemon=True)
+    thread.start()
+    for chunk in streamer:
+        if chunk:
+            yield chunk
+    thread.join()
+    if error:
+        raise error[0]
+
+
+def stream_into(model, tokenizer, prompt, streamer, max_new_tokens=128, temperature=0.7, top_p=0.95,
+                stop_at_json=False):
+    """
+    이 스레드에서 generate 하면서 텍스트 조각을 streamer(TextIteratorStreamer)로 보냄 → 생성된 전체 텍스트
+    조각은 다른 스레드에서 streamer 를 순회해서 받음 (오류가 나면 streamer.end() 는 호출한 쪽에서)
+    """
+    import torch
+
+    enc = tokenizer(prompt, return_tensors="pt").to(model.device)
+    do_sample = temperature > 0
+    gen_kwargs = {"temperature": temperature, "top_p": top_p} if do_sample else {}
+    if stop_at_json:
+        gen_kwargs["stopping_criteria"] = json_stopping_criteria(tokenizer, enc["input_ids"].shape[1])
+    timer = GenerationTimer("stream")
+    timer.attach(gen_kwargs)
+    with torch.no_grad():
+        output = model.generate(
+            input_ids=enc["input_ids"],
+            attention_mask=enc["attention_mask"],
+            max_new_tokens=max_new_tokens,
+            do_sample=do_sample,
+            pad_token_id=tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id,
+            streamer=streamer,
+            **gen_kwargs,
+        )
+    input_length = enc["input_ids"].shape[1]
+    timer.finish(output.shape[1] - input_length)
+    return tokenizer.decode(output[0][input_length:], skip_special_tokens=True)
+
+
+def batch_generate(model, tokenizer, prompts, max_new_tokens, temperature=0.7, top_p=0.95, stop_at_json=False,
+                   constrain_action=False):
+    """
+    여러 프롬프트를 왼쪽 패딩해서 generate 한 번으로 처리
+
+    Args:
+        max_new_tokens: 요청별 최대 토큰 수 리스트. 배치는 최댓값으로 돌리고 요청별로 잘라냄
+        stop_at_json: True 면 행마다 첫 JSON 객체가 닫히는 즉시 그 행은 생성 종료
+        constrain_action: True 면 action_grammar 로 액션 JSON 스키마에 맞는 토큰만 생성
+    Returns:
+        list[str] - 프롬프트 순서대로 새로 생성된 텍스트
+    """
+    import torch
+
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+
+    padding_side = tokenizer.padding_side
+    tokenizer.padding_side = "left"  # decoder-only 모델은 왼쪽 패딩이어야 이어서 생성됨
+    try:
+        enc = tokenizer(prompts, return_tensors="pt", padding=True).to(model.device)
+    finally:
+        tokenizer.padding_side = padding_side
+
+    do_sample = temperature > 0
+    gen_kwargs = {"temperature": temperature, "top_p": top_p} if do_sample else {}
+    if stop_at_json:
+        gen_kwargs["stopping_criteria"] = json_stopping_criteria(tokenizer, enc["input_ids"].shape[1], len(prompts))
+    if constrain_action:
+        from action_grammar import make_action_logits_processor
+        gen_kwargs["logits_processor"] = make_action_logits_processor(tokenizer, enc["input_ids"].shape[1], len(prompts))
+    timer = GenerationTimer("batch")
+    timer.attach(gen_kwargs)
+    with torch.no_grad():
+        output = model.generate(
+            input_ids=enc["input_ids"],
+            attention_mask=enc["attention_mask"],
+            max_new_tokens=max(max_new_tokens),
+            do_sample=do_sample,
+            pad_token_id=tokenizer.pad_token_id,
+            **gen_kwargs,
+        )
+
+    input_length = enc["input_ids"].shape[1]
+    timer.finish((output[:, input_length:] != tokenizer.pad_token_id).sum().item())
+    return [
+        tokenizer.decode(row[input_length:input_length + n], skip_special_tokens=True)
+        for row, n in zip(output, max_new_tokens)
+    ]
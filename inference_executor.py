@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Inference Executor
+/state 의 액션 생성(모델 추론)을 이벤트 루프 밖 전용 스레드 풀에서 실행하기 위한 모듈
+
+- 워커 수 / 대기열 길이 설정 가능 (INFERENCE_WORKERS, INFERENCE_QUEUE_SIZE)
+- 대기열이 가득 차면 InferenceQueueFull 예외 → Api.py 에서 429 로 응답
+- 작업별 대기 시간(queued_ms) / 실행 시간(run_ms) 기록
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class InferenceQueueFull(Exception):
+    """추론 대기열이 가득 찼을 때 (→ 429)"""
+
+
+class InferenceExecutor:
+    def __init__(self, max_workers=1, max_queue=8):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference")
+        self._lock = threading.Lock()
+        self._pending = 0      # 대기 + 실행 중인 작업 수
+        self._running = 0      # 실행 중인 작업 수
+        self._job_seq = 0
+        self._completed = 0
+        self._rejected = 0
+        self.recent_jobs = deque(maxlen=100)  # 최근 작업 타이밍
+
+    @property
+    def queue_depth(self):
+        with self._lock:
+            return self._pending - self._running
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        fn(*args, **kwargs) 를 추론 스레드에서 실행하고 끝날 때까지 await
+
+        Returns:
+            (result, timing) - timing: {"job_id", "queued_ms", "run_ms"}
+        Raises:
+            InferenceQueueFull: 실행 중 + 대기 작업이 workers + queue_size 이상일 때
+        """
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise InferenceQueueFull(
+                    f"추론 대기열이 가득 찼습니다. (pending={self._pending}, queue_size={self.max_queue})"
+                )
+            self._pending += 1
+            self._job_seq += 1
+            job_id = self._job_seq
+
+        timing = {"job_id": job_id, "queued_ms": None, "run_ms": None}
+        submitted_at = time.perf_counter()
+
+        def _job():
+            started_at = time.perf_counter()
+            timing["queued_ms"] = round((started_at - submitted_at) * 1000, 2)
+            with self._lock:
+                self._running += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                timing["run_ms"] = round((time.perf_counter() - started_at) * 1000, 2)
+                with self._lock:
+                    self._running -= 1
+
+        def _done(_future):
+            # 완료/취소 모두 여기서 정리 (요청이 끊겨도 카운트가 어긋나지 않게)
+            with self._lock:
+                self._pending -= 1
+                self._completed += 1
+            self.recent_jobs.append(dict(timing))
+
+        future = self._pool.submit(_job)
+        future.add_done_callback(_done)
+        result = await asyncio.wrap_future(future)
+        return result, timing
+
+    def stats(self):
+        with self._lock:
+            pending, running = self._pending, self._running
+            completed, rejected = self._completed, self._rejected
+        jobs = [j for j in list(self.recent_jobs) if j["run_ms"] is not None]
+        return {
+            "workers": self.max_workers,
+            "queue_size": self.max_queue,
+            "running": running,
+            "queue_depth": pending - running,
+            "completed": completed,
+            "rejected": rejected,
+            "avg_queued_ms": round(sum(j["queued_ms"] for j in jobs) / len(jobs), 2) if jobs else None,
+            "avg_run_ms": round(sum(j["run_ms"] for j in jobs) / len(jobs), 2) if jobs else None,
+        }
+
+    def shutdown(self, wait=False):
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+
+
+def from_env():
+    """환경변수(INFERENCE_WORKERS, INFERENCE_QUEUE_SIZE)로 executor 생성"""
+    return InferenceExecutor(
+        max_workers=int(os.environ.get("INFERENCE_WORKERS", 1)),
+        max_queue=int(os.environ.get("INFERENCE_QUEUE_SIZE", 8)),
+    )
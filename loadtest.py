@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+"""
+Load Test
+prompt → command → state → action 루프를 프로세스 안에서 N 개 세션으로 동시에 돌려보는 부하 테스트
+(httpx.ASGITransport 로 Api.py / main.py 앱을 직접 호출, 실제 서버 / 네트워크 없음)
+
+- 모델은 Mock (MOCK_LATENCY_MS 로 가짜 추론 시간 설정)
+- 엔드포인트별 p50/p95/p99, steps/sec, 테스크별 time-to-FINISH, 이벤트 루프 지연 측정
+- 결과를 JSON 으로 저장, --compare 로 이전 결과와 비교 (p95 가 --threshold 이상 나빠지면 exit 1)
+- --plan --checkpoint-failure-rate 0.2: plan step 일부가 반영되지 않은 것으로 보고 checkpoint 를 검사해서 replan 경로도 측정
+
+사용 예:
+    python loadtest.py --target api --sessions 20 --tasks 3 --mock-latency-ms 50 --out bench_api.json
+    python loadtest.py --target main --sessions 20 --tasks 3 --compare bench_main.json
+    python loadtest.py --plan --checkpoint-failure-rate 0.2 --out bench_plan.json
+"""
+import argparse
+import asyncio
+import copy
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from action_plan import check_checkpoint
+from ui_state_patch import make_patch
+
+SAMPLE_UI_STATE = {
+    "url": "https://ndrims.dongguk.edu/main/main.clx",
+    "sidebar": [
+        {"label": "학적/확인서", "expanded": True, "checked": False, "sub_items": [
+            {"label": "학적부열람", "expanded": False, "checked": False, "sub_items": []},
+            {"label": "증명서발급", "expanded": False, "checked": False, "sub_items": []},
+        ]},
+        {"label": "수업/성적", "expanded": False, "checked": False, "sub_items": [
+            {"label": "성적조회", "expanded": False, "checked": False, "sub_items": []},
+        ]},
+    ],
+    "current_page": {"title": "메인", "form_fields": []},
+}
+
+# --checkpoint-failure-rate: plan step 이 반영되지 않았을 때 (페이지 로드 실패 등) 의 화면
+FAILED_UI_STATE = {
+    "url": "https://ndrims.dongguk.edu/error.clx",
+    "sidebar": [],
+    "current_page": {"title": "오류", "form_fields": []},
+}
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    lo, hi = int(k), min(int(k) + 1, len(values) - 1)
+    return round(values[lo] + (values[hi] - values[lo]) * (k - lo), 2)
+
+
+def summarize(values):
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "mean": round(sum(values) / len(values), 2) if values else None,
+        "max": round(max(values), 2) if values else None,
+    }
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)  # endpoint -> [ms]
+        self.task_times = []                # time-to-FINISH [ms]
+        self.steps = 0
+        self.plan_failures = 0              # 보고한 checkpoint 실패 (--checkpoint-failure-rate)
+        self.errors = defaultdict(int)
+
+    async def call(self, client, method, url, label=None, **kwargs):
+        started = time.perf_counter()
+        resp = await client.request(method, url, **kwargs)
+        self.latencies[label or url].append((time.perf_counter() - started) * 1000)
+        if resp.status_code >= 400:
+            self.errors[f"{label or url} {resp.status_code}"] += 1
+        return resp
+
+
+async def measure_loop_lag(samples, stop, interval=0.01):
+    """interval 마다 깨어나서 예정보다 늦게 깬 시간(ms)을 기록"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, (loop.time() - expected) * 1000))
+
+
+# ============================
+# Api.py: 실행 웹 + 프롬프트 웹 시뮬레이션
+# ============================
+async def api_session(client, rec, index, args):
+    session_id = f"load-{index}"
+    q = {"session_id": session_id}
+    await rec.call(client, "POST", "/login", json={"student_id": f"2025{index:04d}", "password": "pw", **q})
+
+    verified = asyncio.Event()
+    ui = {"state": None, "version": None}  # --ui-patch: 서버가 마지막으로 받은 ui_state / 버전
+    plan_failure = {}                      # 마지막 plan 실행 중 checkpoint 실패 (다음 verification 명령 때 보고)
+    rng = random.Random(index)             # 세션마다 같은 위치에서 실패하도록
+
+    def ui_state_body():
+        """(data, 보내는 ui_state) - ui 에는 서버가 200 으로 받았을 때만 반영"""
+        if not args.ui_patch or ui["version"] is None:
+            return {"ui_state": SAMPLE_UI_STATE}, SAMPLE_UI_STATE
+        # 클릭 한 번 = 메뉴 체크 하나가 바뀌는 정도의 변경
+        new = copy.deepcopy(ui["state"])
+        item = new["sidebar"][0]["sub_items"][0]
+        item["checked"] = not item["checked"]
+        return {"ui_state_patch": {"base_version": ui["version"], "ops": make_patch(ui["state"], new)}}, new
+
+    def action_steps(data):
+        # --plan: plan 의 step 을 로컬에서 차례로 실행했다고 봄
+        # --checkpoint-failure-rate 확률로 step 이 반영되지 않은 화면에서 checkpoint 를 검사, 실패하면 그 step 에서 멈춤
+        generated = data.get("generated_action") or {}
+        if generated.get("type") != "plan":
+            return 1
+        for executed, step in enumerate(generated["steps"]):
+            if rng.random() < args.checkpoint_failure_rate:
+                reason = check_checkpoint(step.get("checkpoint"), FAILED_UI_STATE)
+                if reason is not None:
+                    plan_failure.update(step=step["step"], reason=reason)
+                    return executed
+        return len(generated["steps"])
+
+    async def report_plan_failure():
+        # 실패한 화면 그대로 보고 → 서버가 그 step 부터 replan (fused 면 새 plan 을 응답으로 받음)
+        ui["version"] = None
+        data = {"ui_state": FAILED_UI_STATE, "plan_failure": dict(plan_failure)}
+        body = {"data": data, "return_action": args.fused, "plan": True, **q}
+        resp = await rec.call(client, "POST", "/state", json=body, label="/state (plan_failure)")
+        if resp.status_code in (429, 503):  # 상태는 VERIFICATION 그대로 → 다음 verification 명령 때 다시 보고
+            await asyncio.sleep(float(resp.headers.get("Retry-After", 1)))
+            return
+        plan_failure.clear()
+        rec.plan_failures += 1
+        if args.fused and resp.status_code == 200 and resp.json().get("action"):
+            rec.steps += action_steps(resp.json()["action"])
+
+    async def exec_web(stop):
+        while not stop.is_set():
+            cmd = (await rec.call(client, "GET", "/command", params={**q, "wait": args.long_poll})).json()
+            kind = cmd.get("type")
+            if kind == "state":
+                data, sent = ui_state_body()
+                body = {"data": data, "return_action": args.fused, "plan": args.plan, **q}
+                resp = await rec.call(client, "POST", "/state", json=body)
+                if resp.status_code == 409:  # 버전 불일치 → 전체 ui_state 로 resync
+                    ui["version"] = None
+                    body["data"], sent = ui_state_body()
+                    resp = await rec.call(client, "POST", "/state", json=body)
+                if resp.status_code in (429, 503):  # 서버가 STATE 로 되돌림 (ui_state 버전은 그대로) → Retry-After 뒤 다시 /command
+                    await asyncio.sleep(float(resp.headers.get("Retry-After", 1)))
+                if resp.status_code == 200:
+                    ui["state"], ui["version"] = sent, resp.json().get("ui_state_version")
+                if args.fused and resp.status_code == 200 and resp.json().get("action"):
+                    rec.steps += action_steps(resp.json()["action"])
+            elif kind == "action":
+                resp = await rec.call(client, "GET", "/action", params=q)
+                if resp.status_code == 200:
+                    rec.steps += action_steps(resp.json())
+            elif kind == "verification" and plan_failure:
+                await report_plan_failure()
+            elif kind == "verification":
+                await rec.call(client, "POST", "/verification", json={"success": True, "message": "ok", **q})
+                verified.set()
+            elif not cmd.get("has_task") and args.long_poll <= 0:
+                await asyncio.sleep(args.poll_interval)
+
+    stop = asyncio.Event()
+    worker = asyncio.create_task(exec_web(stop))
+    try:
+        for task in range(args.tasks):
+            verified.clear()
+            started = time.perf_counter()
+            resp = await rec.call(client, "POST", "/prompt", json={"text": args.prompt, **q})
+            if resp.status_code != 200:
+                continue
+            rec.task_times.append((time.perf_counter() - started) * 1000)
+            if resp.json().get("success") is False:  # checkpoint 실패가 반복되어 서버가 중단 (verification 없음)
+                rec.errors["task failed"] += 1
+                continue
+            # 실행 웹이 verification 을 보내서 TASK_TYPE 이 0 으로 돌아올 때까지 대기
+            await verified.wait()
+    finally:
+        stop.set()
+        await rec.call(client, "POST", "/logout", params=q)
+        await worker
+
+
+def setup_api(args):
+    import Api
+    return Api.app, None
+
+
+# ============================
+# main.py: /prompt → /command → (/state → /action) x steps
+# ============================
+class _MockQwenGenerator:
+    """main.py 용 Mock 생성기 (mock_action_model 의 액션을 JSON 으로 돌려줌)"""
+
+    def __init__(self, latency_ms):
+        import mock_action_model
+        self.actions = mock_action_model._mock_actions
+        self.latency = latency_ms / 1000
+        self.calls = 0
+
+    def generate(self, prompt, max_new_tokens=128, temperature=0.7, top_p=0.95):
+        time.sleep(self.latency)
+        self.calls += 1
+        return json.dumps(self.actions[self.calls % len(self.actions)], ensure_ascii=False)
+
+
+async def main_session(client, rec, index, args):
+    import main
+    session_id = f"load-{index}"
+    await rec.call(client, "POST", "/login", json={"username": session_id, "password": "pw"})
+    main.DISPATCHER.add_session(session_id, session_id)  # main.py 의 /login 은 세션을 등록하지 않음
+
+    for task in range(args.tasks):
+        started = time.perf_counter()
+        await rec.call(client, "POST", "/prompt", json={"session_id": session_id, "prompt": args.prompt})
+        cmd = (await rec.call(client, "GET", "/command",
+                              params={"session_id": session_id, "wait": max(args.long_poll, 1)})).json()
+        if not cmd:
+            rec.errors["/command empty"] += 1
+            continue
+        for step in range(args.steps):
+            body = {"session_id": session_id, "command_id": cmd["command_id"], "state": {"ui_state": SAMPLE_UI_STATE}}
+            await rec.call(client, "POST", "/state", json=body)
+            resp = await rec.call(client, "GET", "/action", params={"command_id": cmd["command_id"]})
+            if resp.status_code == 200 and resp.json():
+                rec.steps += 1
+        rec.task_times.append((time.perf_counter() - started) * 1000)
+
+
+def setup_main(args):
+    import main
+    generator = _MockQwenGenerator(args.mock_latency_ms)
+    main.MODEL_MANAGER.register("qwen", lambda: generator)
+    return main.app, generator
+
+
+# ============================
+# 실행 / 결과
+# ============================
+async def run(args):
+    import httpx
+
+    app, _ = (setup_api if args.target == "api" else setup_main)(args)
+    session_fn = api_session if args.target == "api" else main_session
+    rec = Recorder()
+    lag = []
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(lag, stop))
+
+    transport = httpx.ASGITransport(app=app)
+    timeout = httpx.Timeout(args.long_poll + 90)
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=timeout, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(session_fn(client, rec, i, args) for i in range(args.sessions)))
+        elapsed = time.perf_counter() - started
+
+    stop.set()
+    await lag_task
+    return {
+        "target": args.target,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "config": {
+            "sessions": args.sessions,
+            "tasks": args.tasks,
+            "steps": args.steps if args.target == "main" else None,
+            "mock_latency_ms": args.mock_latency_ms,
+            "long_poll": args.long_poll,
+            "fused": args.fused,
+            "ui_patch": args.ui_patch,
+            "plan": args.plan,
+            "checkpoint_failure_rate": args.checkpoint_failure_rate,
+        },
+        "elapsed_sec": round(elapsed, 3),
+        "steps": rec.steps,
+        "steps_per_sec": round(rec.steps / elapsed, 2) if elapsed else None,
+        "plan_failures": rec.plan_failures,
+        "time_to_finish_ms": summarize(rec.task_times),
+        "event_loop_lag_ms": summarize(lag),
+        "endpoints": {name: summarize(values) for name, values in sorted(rec.latencies.items())},
+        "errors": dict(rec.errors),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(result, baseline, threshold):
+    """엔드포인트별 / time-to-FINISH p95 비교. 하나라도 threshold(%) 이상 느려지면 False"""
+    ok = True
+    rows = [("time_to_finish", baseline.get("time_to_finish_ms", {}), result["time_to_finish_ms"])]
+    rows += [(name, baseline.get("endpoints", {}).get(name, {}), stats) for name, stats in result["endpoints"].items()]
+    print(f"\n{'metric':<24}{'base p95':>12}{'now p95':>12}{'diff':>10}")
+    for name, old, new in rows:
+        before, after = old.get("p95"), new.get("p95")
+        if not before or after is None:
+            continue
+        diff = (after - before) / before * 100
+        flag = ""
+        if diff > threshold:
+            ok, flag = False, "  <-- regression"
+        print(f"{name:<24}{before:>12.2f}{after:>12.2f}{diff:>9.1f}%{flag}")
+    before, after = baseline.get("steps_per_sec"), result["steps_per_sec"]
+    if before and after is not None:
+        print(f"{'steps_per_sec':<24}{before:>12.2f}{after:>12.2f}{(after - before) / before * 100:>9.1f}%")
+    return ok
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="prompt→command→state→action 부하 테스트")
+    parser.add_argument("--target", choices=["api", "main"], default="api")
+    parser.add_argument("--sessions", type=int, default=10, help="동시에 돌릴 실행 웹 / 프롬프트 웹 쌍 개수")
+    parser.add_argument("--tasks", type=int, default=3, help="세션당 보낼 프롬프트 수")
+    parser.add_argument("--steps", type=int, default=3, help="main: 테스크당 state/action 반복 횟수")
+    parser.add_argument("--mock-latency-ms", type=float, default=20.0, help="Mock 모델 추론 시간")
+    parser.add_argument("--long-poll", type=float, default=5.0, help="/command wait 값 (0 이면 짧은 폴링)")
+    parser.add_argument("--poll-interval", type=float, default=0.05, help="짧은 폴링일 때 간격(초)")
+    parser.add_argument("--fused", action="store_true", help="api: /state 응답으로 액션 받기 (return_action)")
+    parser.add_argument("--ui-patch", action="store_true", help="api: 두 번째 /state 부터 ui_state_patch (변경분) 만 전송")
+    parser.add_argument("--plan", action="store_true", help="api: plan 모드 (첫 /state 에서 전체 액션 목록을 받아 로컬 실행)")
+    parser.add_argument("--checkpoint-failure-rate", type=float, default=0.0,
+                        help="api --plan: step 마다 반영되지 않은 것으로 보고 checkpoint 를 검사할 확률 (replan 측정)")
+    parser.add_argument("--prompt", default="학적부 조회")
+    parser.add_argument("--out", help="결과 JSON 저장 경로")
+    parser.add_argument("--compare", help="비교할 이전 결과 JSON")
+    parser.add_argument("--threshold", type=float, default=20.0, help="p95 회귀 허용치(%%)")
+    parser.add_argument("--verbose", action="store_true", help="서버 로그 보기 (기본은 WARNING 이상만)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Api / main import 전에 설정
+    os.environ["MOCK_LATENCY_MS"] = str(args.mock_latency_ms)
+    if not args.verbose:
+        os.environ["LOG_LEVEL"] = "WARNING"
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    result = asyncio.run(run(args))
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if not compare(result, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
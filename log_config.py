@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Logging
+핸들러마다 있던 print 대신 쓰는 레벨별 로깅 설정
+
+- root 에는 QueueHandler 하나만 붙임 → 요청 처리 중에는 큐에 넣기만 하고
+  실제 stdout 쓰기는 QueueListener 스레드가 처리 (이벤트 루프에서 동기 I/O 없음)
+- LOG_LEVEL: DEBUG | INFO (기본) | WARNING ... (운영에서는 WARNING 으로 디버그 / 진행 로그 끄기)
+- LOG_FORMAT: text (기본) | json (한 줄에 JSON 하나, extra= 로 넘긴 필드 포함)
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(level=None, fmt=None, stream=None):
+    """
+    처음 한 번만 설정 (다시 부르면 레벨만 바꿈)
+    level / fmt 가 None 이면 LOG_LEVEL / LOG_FORMAT 환경변수
+    """
+    global _listener
+    level = (level or os.environ.get("LOG_LEVEL", "INFO")).upper()
+    root = logging.getLogger()
+    root.setLevel(level)
+    if _listener is not None:
+        return
+
+    handler = logging.StreamHandler(stream or sys.stdout)
+    if (fmt or os.environ.get("LOG_FORMAT", "text")) == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    log_queue = queue.SimpleQueue()
+    for old in list(root.handlers):
+        root.removeHandler(old)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_stop)
+
+
+def _stop():
+    """종료 시 큐에 남은 로그를 모두 내보냄"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,38 +1,335 @@
 # main.py
 from fastapi import FastAPI, HTTPException, Depends, Query
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, Field
 from typing import Dict, List, Any, Optional
 from uuid import uuid4
 from datetime import datetime
-from threading import Lock
+import os
+import copy
+import asyncio
 
-from model_qwen import QwenGenerator
+from inference_executor import InferenceQueueFull
+from log_config import setup_logging
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY, instrument_app
+from model_manager import ModelManager, ModelNotReady, apply_precision, load_causal_lm, warm_up as warm_up_causal_lm
+from command_dispatcher import CommandDispatcher, CommandQueueFull
+from micro_batcher import MicroBatcher
+from model_worker_pool import from_env as model_worker_pool_from_env
+from generation_utils import hf_parts, format_prompt, format_prompt_parts, batch_generate, stream_into, truncate_after_json, extract_json_object, json_stopping_criteria
+from prefix_cache import PrefixKVCache, generate_with_prefix_cache, prefill_prefix
+from speculative import ActionHistory, NgramDrafter, SpeculativeStats, speculative_generate, draft_model_generate
+from observation_encoder import encode_state_for_prompt
 
 app = FastAPI(title="Qwen 0.5B Text API", version="1.1.0")
 
+# -----------------------------
+# Logging / metrics (LOG_LEVEL, LOG_FORMAT / route 별 지연 시간은 /metrics)
+# -----------------------------
+setup_logging()
+instrument_app(app)
+
 # -----------------------------
 # In‑memory store (demo purpose)
+# 세션별 deque + shard 별 Lock 으로 명령 분배, 오래된 command 기록은 자동 제거
+# -----------------------------
+DISPATCHER = CommandDispatcher(
+    shards=int(os.environ.get("DISPATCHER_SHARDS", 16)),
+    max_pending=int(os.environ.get("DISPATCHER_MAX_PENDING", 100)),
+    max_commands=int(os.environ.get("DISPATCHER_MAX_COMMANDS", 4096)),
+    idle_ttl=float(os.environ.get("DISPATCHER_IDLE_TTL", 3600)),
+    max_states=int(os.environ.get("DISPATCHER_MAX_STATES", 20)),
+)
+COMMAND_MAX_WAIT = 30  # /command long-poll 최대 대기 시간 (초)
+
+# -----------------------------
+# Model manager (서버 시작 시 백그라운드에서 로드 + warm-up, /ready 로 상태 확인)
+# MODEL_DTYPE=fp32|bf16|int8 : 로드 후 정밀도 적용 (int8 은 CPU 동적 양자화)
+# -----------------------------
+MODEL_DTYPE = os.environ.get("MODEL_DTYPE", "fp32")
+MODEL_READY_TIMEOUT = float(os.environ.get("MODEL_READY_TIMEOUT", 120))
+
+def _load_qwen():
+    from model_qwen import QwenGenerator  # torch / transformers import 도 로드 스레드에서
+    generator = QwenGenerator.get()
+    parts = hf_parts(generator)
+    if parts is not None and MODEL_DTYPE != "fp32":
+        generator.model = apply_precision(parts[0], MODEL_DTYPE)
+    return generator
+
+def _warm_up_qwen(generator):
+    parts = hf_parts(generator)
+    if parts is not None:
+        warm_up_causal_lm(*parts)
+    else:
+        generator.generate(prompt="warm up", max_new_tokens=4, temperature=0.7, top_p=0.95)
+
 # -----------------------------
-class _Store:
-    def __init__(self) -> None:
-        self.sessions: Dict[str, str] = {}                 # session_id -> username
-        self.command_queues: Dict[str, List[dict]] = {}    # session_id -> list[Command dict]
-        self.prompts: Dict[str, str] = {}                  # command_id -> prompt
-        self.states: Dict[str, List[dict]] = {}            # command_id -> list[state]
-        self.actions: Dict[str, dict] = {}                 # command_id -> action
-        self._lock = Lock()
+# Model worker pool (MODEL_WORKERS > 0 일 때, 기본은 이 프로세스 안에서 생성)
+# QwenGenerator 는 worker 프로세스들이 로드하고, 이 프로세스는 생성 요청을 Unix socket 으로 보냄
+# worker 는 이 파일을 그대로 import 해서 아래의 배처 / prefix KV-cache / speculative 경로로 생성 (worker 마다 배처 하나)
+# /state 는 session_id 로 항상 같은 worker → 그 세션의 prefix KV-cache 를 계속 사용
+# (MODEL_WORKER_CONCURRENCY 기본값은 BATCH_MAX_SIZE: worker 안에서도 요청을 모아 배치로)
+# (uvicorn --workers N 이면 python model_worker_pool.py --module main --workers M 으로 따로 띄우고 MODEL_POOL_DIR 로 연결)
+# -----------------------------
+MODEL_POOL = model_worker_pool_from_env(
+    "main", max_queue=int(os.environ.get("BATCH_QUEUE_SIZE", 64)), concurrency=int(os.environ.get("BATCH_MAX_SIZE", 8)),
+)
+_LOOP = None  # startup 에서 저장, 동기 핸들러 스레드에서 풀을 호출할 때 사용
+
+MODEL_MANAGER = ModelManager()
+if MODEL_POOL is not None:
+    MODEL_MANAGER.register("qwen", MODEL_POOL.start)
+else:
+    MODEL_MANAGER.register("qwen", _load_qwen, _warm_up_qwen if os.environ.get("MODEL_WARMUP", "1") == "1" else None)
+
+def _generator():
+    """준비된 QwenGenerator (로드 중이면 MODEL_READY_TIMEOUT 초까지 대기, 넘으면 ModelNotReady)"""
+    return MODEL_MANAGER.get("qwen", MODEL_READY_TIMEOUT)
+
+async def _next_chunk(chunks):
+    """비동기 조각 iterator 의 다음 조각, 끝나면 None"""
+    try:
+        return await chunks.__anext__()
+    except StopAsyncIteration:
+        return None
+
+def _pool_call(method: str, key: Optional[str], **kwargs):
+    """worker 풀의 method 호출 (key 가 없으면 아무 worker), 풀이 준비될 때까지 MODEL_READY_TIMEOUT 초 대기"""
+    _generator()
+    result, _ = asyncio.run_coroutine_threadsafe(MODEL_POOL.call(method, key or uuid4().hex, **kwargs), _LOOP).result()
+    return result
+
+def _pool_stream(method: str, key: Optional[str], **kwargs):
+    """
+    worker 풀의 스트리밍 호출 → 텍스트 조각 iterator
+    첫 조각까지는 여기서 기다림 → 대기열 초과(InferenceQueueFull) 등은 응답을 시작하기 전에 예외
+    """
+    _generator()
+    chunks = MODEL_POOL.stream(method, key or uuid4().hex, **kwargs)
+    first = asyncio.run_coroutine_threadsafe(_next_chunk(chunks), _LOOP).result()
+
+    def rest():
+        try:
+            chunk = first
+            while chunk is not None:
+                yield chunk
+                chunk = asyncio.run_coroutine_threadsafe(_next_chunk(chunks), _LOOP).result()
+        finally:
+            asyncio.run_coroutine_threadsafe(chunks.aclose(), _LOOP).result()  # 중간에 끊기면 worker 연결 정리
+
+    return rest()
+
+# -----------------------------
+# Micro-batching (여러 요청을 모아 generate 한 번에 처리)
+# 요청의 모델 호출(일반 / prefix KV-cache / 스트리밍 / speculative)은 모두 배처 스레드 하나에서만 실행
+# → generate 가 동시에 돌지 않고, 전부 같은 대기열 제한(BATCH_QUEUE_SIZE, 넘으면 429)을 받음
+# (warm-up 은 로드 스레드에서 돌지만 끝나야 모델이 준비되므로 요청과 겹치지 않음)
+# -----------------------------
+def _generate_batch(prompts: List[str], params: List[dict]) -> List[str]:
+    """
+    mode="stream" 이면 _stream_batch, "speculative" 면 _speculative_batch, 아니면 아래처럼 생성
+    HF 모델이면 배치 크기와 상관없이 batch_generate 한 경로로 (같은 요청이 몇 개와 묶이든 같은 토큰화)
+    프롬프트는 format_prompt 로 generator.generate 와 같은 형식으로 바꿔서 넣음
+    HF model/tokenizer 가 없는 generator 만 요청마다 generator.generate
+    prefix_length > 0 인 요청(같은 그룹)은 prefix KV-cache 로 한 건씩 (요청마다 cache 길이가 달라 한 배치로 못 묶음)
+    """
+    if params[0]["mode"] == "stream":
+        try:
+            return _stream_batch(prompts, params)
+        except BaseException:
+            for kw in params:  # 조각을 기다리는 요청 스레드가 멈추지 않도록
+                kw["streamer"].end()
+            raise
+    if params[0]["mode"] == "speculative":
+        return _speculative_batch(prompts, params)
+    generator = _generator()
+    parts = hf_parts(generator)
+    stop_at_json = params[0]["stop_at_json"]
+    constrain_action = params[0]["constrain_action"]
+    if parts is not None and params[0]["prefix_length"] > 0:
+        model, tokenizer = parts
+        texts = []
+        for p, kw in zip(prompts, params):
+            prefix, suffix = format_prompt_parts(generator, p[:kw["prefix_length"]], p[kw["prefix_length"]:])
+            if not prefix:  # 형식 때문에 prefix 를 나눌 수 없음 → 캐시 없이
+                texts += batch_generate(model, tokenizer, [suffix], max_new_tokens=[kw["max_new_tokens"]],
+                                        temperature=kw["temperature"], top_p=kw["top_p"],
+                                        stop_at_json=stop_at_json, constrain_action=constrain_action)
+                continue
+            texts.append(generate_with_prefix_cache(
+                model, tokenizer, PREFIX_CACHE, prefix, suffix,
+                max_new_tokens=kw["max_new_tokens"], temperature=kw["temperature"], top_p=kw["top_p"],
+                stop_at_json=stop_at_json, constrain_action=constrain_action,
+            ))
+        return texts
+    if parts is None:
+        texts = [
+            generator.generate(prompt=p, max_new_tokens=kw["max_new_tokens"], temperature=kw["temperature"], top_p=kw["top_p"])
+            for p, kw in zip(prompts, params)
+        ]
+        return [truncate_after_json(t) for t in texts] if stop_at_json else texts
+    model, tokenizer = parts
+    # 같은 배치는 temperature/top_p/stop_at_json/constrain_action 이 같음 (group_key), max_new_tokens 만 요청별로 다름
+    return batch_generate(
+        model, tokenizer, [format_prompt(generator, p) for p in prompts],
+        max_new_tokens=[kw["max_new_tokens"] for kw in params],
+        temperature=params[0]["temperature"],
+        top_p=params[0]["top_p"],
+        stop_at_json=stop_at_json,
+        constrain_action=constrain_action,
+    )
+
+def _stream_batch(prompts: List[str], params: List[dict]) -> List[str]:
+    """스트리밍 요청은 요청마다 streamer 가 있어서 한 건씩 (조각은 요청 스레드가 streamer 에서 읽음)"""
+    generator = _generator()
+    model, tokenizer = hf_parts(generator)
+    return [
+        stream_into(model, tokenizer, format_prompt(generator, p), kw["streamer"],
+                    max_new_tokens=kw["max_new_tokens"], temperature=kw["temperature"], top_p=kw["top_p"],
+                    stop_at_json=kw["stop_at_json"])
+        for p, kw in zip(prompts, params)
+    ]
+
+GENERATE_BATCHER = MicroBatcher(
+    _generate_batch,
+    max_batch_size=int(os.environ.get("BATCH_MAX_SIZE", 8)),
+    max_wait_ms=float(os.environ.get("BATCH_MAX_WAIT_MS", 10)),
+    max_queue=int(os.environ.get("BATCH_QUEUE_SIZE", 64)),
+    group_key=lambda kw: (kw["mode"], kw["temperature"], kw["top_p"], kw["stop_at_json"], kw["constrain_action"],
+                          kw["prefix_length"] > 0),
+    name="qwen-batcher",
+)
+
+def _generate(prompt: str, max_new_tokens: int, temperature: float, top_p: float, stop_at_json: bool = False,
+              constrain_action: bool = False, prefix_length: int = 0, key: Optional[str] = None) -> str:
+    """
+    prefix_length > 0 이면 prompt[:prefix_length] 를 prefix KV-cache 로 재사용
+    worker 풀이 있으면 key (session_id) 의 worker 에서 같은 경로로 생성
+    """
+    if MODEL_POOL is not None:
+        return _pool_call("generate", key, prompt=prompt, max_new_tokens=max_new_tokens, temperature=temperature,
+                          top_p=top_p, stop_at_json=stop_at_json, constrain_action=constrain_action,
+                          prefix_length=prefix_length)
+    return GENERATE_BATCHER.submit(
+        prompt, max_new_tokens=max_new_tokens, temperature=temperature, top_p=top_p,
+        stop_at_json=stop_at_json, constrain_action=constrain_action, prefix_length=prefix_length, mode="generate",
+    ).result()
+
+def _start_stream(prompt: str, max_new_tokens: int, temperature: float, top_p: float, stop_at_json: bool = False):
+    """
+    스트리밍 생성을 배처에 넣고 텍스트 조각 iterator 를 반환 (HF 모델이 없으면 전체 결과를 한 조각으로)
+    생성은 다른 요청과 같은 배처 스레드에서, 대기열이 가득 차면 응답을 시작하기 전에 여기서 InferenceQueueFull
+    """
+    if MODEL_POOL is not None:
+        return _pool_stream("stream", None, prompt=prompt, max_new_tokens=max_new_tokens, temperature=temperature,
+                            top_p=top_p, stop_at_json=stop_at_json)
+    parts = hf_parts(_generator())
+    params = dict(max_new_tokens=max_new_tokens, temperature=temperature, top_p=top_p, stop_at_json=stop_at_json,
+                  constrain_action=False, prefix_length=0)
+    if parts is None:
+        streamer = None
+        future = GENERATE_BATCHER.submit(prompt, mode="generate", **params)
+    else:
+        from transformers import TextIteratorStreamer
+        streamer = TextIteratorStreamer(parts[1], skip_prompt=True, skip_special_tokens=True)
+        future = GENERATE_BATCHER.submit(prompt, mode="stream", streamer=streamer, **params)
+
+    def chunks():
+        if streamer is None:
+            yield future.result()
+            return
+        for chunk in streamer:
+            if chunk:
+                yield chunk
+        future.result()  # 생성 중 오류가 있었으면 여기서
+
+    return chunks()
+
+# -----------------------------
+# Prefix KV-cache (같은 command 의 step 들은 시스템 문구 + 프롬프트 부분을 재사용)
+# -----------------------------
+PREFIX_CACHE_ENABLED = os.environ.get("PREFIX_CACHE_ENABLED", "1") == "1"
+PREFIX_CACHE = PrefixKVCache(
+    max_entries=int(os.environ.get("PREFIX_CACHE_MAX_ENTRIES", 16)),
+    max_bytes=int(os.environ.get("PREFIX_CACHE_MAX_MB", 256)) * 1024 * 1024,
+)
+
+def _generate_with_prefix(prefix: str, suffix: str, max_new_tokens: int, temperature: float, top_p: float,
+                          stop_at_json: bool = False, constrain_action: bool = False, key: Optional[str] = None) -> str:
+    """
+    배처를 통해 생성: prefix 캐시를 쓸 수 있으면 배처 스레드에서 suffix 만 prefill, 아니면 전체 프롬프트를 배치로
+    (PREFIX_CACHE_ENABLED=0 이면 /state 요청들도 다른 요청과 한 배치로 묶임)
+    """
+    return _generate(prompt=prefix + suffix, max_new_tokens=max_new_tokens, temperature=temperature, top_p=top_p,
+                     stop_at_json=stop_at_json, constrain_action=constrain_action,
+                     prefix_length=len(prefix) if PREFIX_CACHE_ENABLED else 0, key=key)
+
+# -----------------------------
+# Speculative decoding (액션 생성, greedy 일 때만)
+# SPECULATIVE_DECODING=off|ngram|draft
+#   ngram: 프롬프트(observation 의 사이드바 라벨) + 최근 액션에서 draft 를 찾음 (추가 모델 없음)
+#   draft: DRAFT_MODEL_PATH 의 작은 모델을 assistant_model 로 사용 (같은 tokenizer 여야 함)
+# 출력이 일반 greedy 와 같으려면 greedy 여야 하므로 켜면 ACTION_TEMPERATURE 기본값이 0
+# -----------------------------
+SPECULATIVE_DECODING = os.environ.get("SPECULATIVE_DECODING", "off")
+ACTION_TEMPERATURE = float(os.environ.get("ACTION_TEMPERATURE", 0 if SPECULATIVE_DECODING != "off" else 0.2))
+SPEC_NUM_DRAFT = int(os.environ.get("SPECULATIVE_NUM_DRAFT", 8))
+SPEC_HISTORY = ActionHistory(max_items=int(os.environ.get("SPECULATIVE_HISTORY", 32)))
+SPEC_STATS = SpeculativeStats()
+
+if SPECULATIVE_DECODING == "draft" and MODEL_POOL is None:  # 풀이 있으면 worker 가 로드
+    MODEL_MANAGER.register("draft", lambda: load_causal_lm(os.environ["DRAFT_MODEL_PATH"])[0])
+
+def _speculative_action(prefix: str, suffix: str, max_new_tokens: int, key: Optional[str] = None) -> Optional[str]:
+    """
+    greedy speculative 로 액션 생성 (첫 JSON 객체에서 종료). HF 모델이 없으면 None
+    생성은 배처 스레드에서 (대기열이 가득 차면 InferenceQueueFull), draft 모델 로드 대기만 요청 스레드에서
+    worker 풀이 있으면 key (session_id) 의 worker 에서
+    """
+    if MODEL_POOL is not None:
+        return _pool_call("speculative_action", key, prefix=prefix, suffix=suffix, max_new_tokens=max_new_tokens)
+    if hf_parts(_generator()) is None:
+        return None
+    draft = MODEL_MANAGER.get("draft", MODEL_READY_TIMEOUT) if SPECULATIVE_DECODING == "draft" else None
+    return GENERATE_BATCHER.submit(
+        prefix + suffix, mode="speculative", draft=draft, max_new_tokens=max_new_tokens, temperature=0, top_p=1.0,
+        stop_at_json=True, constrain_action=False, prefix_length=len(prefix),
+    ).result()
 
-    def with_lock(self):
-        class _Ctx:
-            def __init__(self, lock: Lock):
-                self.lock = lock
-            def __enter__(self):
-                self.lock.acquire()
-            def __exit__(self, exc_type, exc, tb):
-                self.lock.release()
-        return _Ctx(self._lock)
+def _speculative_batch(prompts: List[str], params: List[dict]) -> List[str]:
+    """speculative 는 요청마다 draft 를 따로 검증하므로 한 건씩 (배처 스레드)"""
+    generator = _generator()
+    model, tokenizer = hf_parts(generator)
+    texts = []
+    for p, kw in zip(prompts, params):
+        prefix, suffix = format_prompt_parts(generator, p[:kw["prefix_length"]], p[kw["prefix_length"]:])
+        max_new_tokens = kw["max_new_tokens"]
 
-STORE = _Store()
+        if kw["draft"] is not None:
+            input_ids = tokenizer(prefix + suffix, return_tensors="pt").input_ids.to(model.device)
+            tokens = draft_model_generate(
+                model, tokenizer, kw["draft"], input_ids, max_new_tokens,
+                stopping_criteria=json_stopping_criteria(tokenizer, input_ids.shape[1]),
+            )
+            texts.append(tokenizer.decode(tokens, skip_special_tokens=True))
+            continue
+
+        if PREFIX_CACHE_ENABLED and prefix:
+            input_ids, past = prefill_prefix(model, tokenizer, PREFIX_CACHE, prefix, suffix)
+            past, past_length = copy.deepcopy(past), past.get_seq_length()
+        else:
+            input_ids = tokenizer(prefix + suffix, return_tensors="pt").input_ids.to(model.device)
+            past, past_length = None, 0
+        drafter = NgramDrafter(SPEC_HISTORY.snapshot(), num_draft=SPEC_NUM_DRAFT)
+        tokens, stats = speculative_generate(
+            model, tokenizer, input_ids, max_new_tokens, drafter,
+            past_key_values=past, past_length=past_length, stop_at_json=True,
+        )
+        SPEC_STATS.record(len(tokens), stats)
+        SPEC_HISTORY.add(tokens)
+        texts.append(tokenizer.decode(tokens, skip_special_tokens=True))
+    return texts
 
 # -----------------------------
 # Schemas
@@ -42,6 +339,8 @@ class GenerateRequest(BaseModel):
     max_new_tokens: int = Field(128, ge=1, le=1024)
     temperature: float = Field(0.7, gt=0.0, le=2.0)
     top_p: float = Field(0.95, gt=0.0, le=1.0)
+    stream: bool = Field(False, description="True 면 SSE 로 토큰이 나오는 대로 전송")
+    stop_at_json: bool = Field(False, description="True 면 첫 JSON 객체가 닫히는 즉시 생성 종료")
 
 class GenerateResponse(BaseModel):
     text: str
@@ -83,23 +382,49 @@ class ActionPayload(BaseModel):
 # -----------------------------
 
 def _require_session(session_id: str) -> None:
-    if session_id not in STORE.sessions:
+    if not DISPATCHER.has_session(session_id):
         raise HTTPException(status_code=401, detail="invalid session")
 
 # -----------------------------
 # Basic text generation (kept)
 # -----------------------------
+def _sse_stream(chunks):
+    """data: {"text": 조각} ... 마지막에 event: done (전체 텍스트), 오류면 event: error"""
+    import json
+    pieces = []
+    try:
+        for chunk in chunks:
+            pieces.append(chunk)
+            yield f"data: {json.dumps({'text': chunk}, ensure_ascii=False)}\n\n"
+    except Exception as e:
+        yield f"event: error\ndata: {json.dumps({'detail': str(e)}, ensure_ascii=False)}\n\n"
+        return
+    yield f"event: done\ndata: {json.dumps({'text': ''.join(pieces)}, ensure_ascii=False)}\n\n"
+
 @app.post("/generate", response_model=GenerateResponse)
 def generate_text(req: GenerateRequest):
+    if req.stream:
+        try:
+            chunks = _start_stream(req.prompt, req.max_new_tokens, req.temperature, req.top_p, req.stop_at_json)
+        except InferenceQueueFull as e:
+            raise HTTPException(status_code=429, detail=str(e))
+        except ModelNotReady as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+        return StreamingResponse(_sse_stream(chunks), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
     try:
-        generator = QwenGenerator.get()
-        text = generator.generate(
+        text = _generate(
             prompt=req.prompt,
             max_new_tokens=req.max_new_tokens,
             temperature=req.temperature,
             top_p=req.top_p,
+            stop_at_json=req.stop_at_json,
         )
         return GenerateResponse(text=text)
+    except InferenceQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except ModelNotReady as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
         # 모델/메모리 오류 등 방어
         raise HTTPException(status_code=500, detail=str(e))
@@ -124,65 +449,96 @@ def post_prompt(body: PromptRequest):
     _require_session(body.session_id)
     command_id = str(uuid4())
     cmd = CommandPayload(command_id=command_id, prompt=body.prompt, created_at=datetime.utcnow())
-    with STORE.with_lock():
-        STORE.prompts[command_id] = body.prompt
-        STORE.command_queues.setdefault(body.session_id, []).append(cmd.model_dump())
+    try:
+        DISPATCHER.enqueue(body.session_id, cmd.model_dump())
+    except CommandQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
     return PromptResponse(command_id=command_id, enqueued_at=cmd.created_at)
 
 # -----------------------------
 # Exec Web: /command (polling)
 # -----------------------------
 @app.get("/command", response_model=Optional[CommandPayload])
-def get_next_command(session_id: str = Query(..., description="/login 으로 받은 세션")):
+async def get_next_command(
+    session_id: str = Query(..., description="/login 으로 받은 세션"),
+    wait: float = Query(0, ge=0, le=COMMAND_MAX_WAIT, description="명령이 없을 때 기다릴 최대 시간(초), 0 이면 바로 반환"),
+):
     _require_session(session_id)
-    with STORE.with_lock():
-        q = STORE.command_queues.get(session_id, [])
-        if not q:
-            return None  # FastAPI -> 200 with null or set 204 below
-        cmd = q.pop(0)
+    cmd = await DISPATCHER.get(session_id, wait) if wait > 0 else DISPATCHER.pop(session_id)
+    if cmd is None:
+        return None  # FastAPI -> 200 with null or set 204 below
     return CommandPayload(**cmd)
 
 # -----------------------------
 # Exec Web: /state
+# state 는 repr 대신 observation_encoder 로 줄인 텍스트를 프롬프트에 넣음
+# STATE_PROMPT_ENCODING=raw 이면 기존처럼 repr
+# (Api.py 의 OBSERVATION_ENCODING 은 action_model 입력 형식이라 기본값이 다름 → 변수 이름을 나눔)
 # -----------------------------
+STATE_PROMPT_ENCODING = os.environ.get("STATE_PROMPT_ENCODING", "compact")
+
+# CONSTRAINED_DECODING=1 이면 action_grammar 로 {name, args, status} 액션 JSON 만 생성되도록 logits 마스킹
+# (HF model/tokenizer 가 있을 때만 적용, 기본은 꺼짐)
+CONSTRAINED_DECODING = os.environ.get("CONSTRAINED_DECODING", "0") == "1"
+
+
+def _state_text(state: Dict[str, Any]) -> str:
+    if STATE_PROMPT_ENCODING == "raw":
+        return str(state)
+    return encode_state_for_prompt(state)
+
+
 @app.post("/state", response_model=Ack)
 def post_state(body: StatePost):
     _require_session(body.session_id)
-    with STORE.with_lock():
-        STORE.states.setdefault(body.command_id, []).append({
-            "time": datetime.utcnow().isoformat(),
-            "state": body.state,
-        })
+    DISPATCHER.add_state(body.command_id, {
+        "time": datetime.utcnow().isoformat(),
+        "state": body.state,
+    })
 
     # 간단 규칙: state가 들어오면 Qwen으로 액션을 생성해 /action 에서 제공
     try:
-        prompt = STORE.prompts.get(body.command_id, "")
-        generator = QwenGenerator.get()
-        composed = (
+        prompt = DISPATCHER.prompt(body.command_id) or ""
+        # step 마다 바뀌지 않는 앞부분(prefix)과 바뀌는 state 부분(suffix)을 나눠서 prefix KV-cache 재사용
+        action_fields = (
+            "{name, args, status} (name: click|type|select|sleep|wait_for_selector|goto, status: FINISH on the last action)"
+            if CONSTRAINED_DECODING else "{type, target, params}"
+        )
+        prefix = (
             "You are an execution agent. Given the user's prompt and current UI state, "
-            "return a single JSON action with fields {type, target, params}.\n\n"
-            f"USER_PROMPT: {prompt}\nCURRENT_STATE: {body.state}\n"
+            f"return a single JSON action with fields {action_fields}.\n\n"
+            f"USER_PROMPT: {prompt}\n"
+        )
+        suffix = (
+            f"CURRENT_STATE: {_state_text(body.state)}\n"
             "ACTION_JSON:"
         )
-        action_text = generator.generate(prompt=composed, max_new_tokens=256, temperature=0.2, top_p=0.9)
+        # 액션 JSON 객체가 닫히면 바로 디코딩 중단 (256 토큰을 다 채우지 않음)
+        action_text = None
+        if SPECULATIVE_DECODING != "off" and ACTION_TEMPERATURE == 0 and not CONSTRAINED_DECODING:
+            action_text = _speculative_action(prefix, suffix, max_new_tokens=256, key=body.session_id)
+        if action_text is None:
+            action_text = _generate_with_prefix(prefix, suffix, max_new_tokens=256, temperature=ACTION_TEMPERATURE,
+                                                top_p=0.9, stop_at_json=True, constrain_action=CONSTRAINED_DECODING,
+                                                key=body.session_id)
+    except InferenceQueueFull as e:
+        # 액션 대신 429 → 실행 웹이 잠시 뒤 같은 state 를 다시 보냄
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except ModelNotReady as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
         # 액션 생성 실패시 에러를 액션으로 래핑
         action_text = f"{{\"type\": \"error\", \"target\": null, \"params\": {{\"message\": \"{str(e)}\"}}}}"
 
     # 가능하면 JSON으로 파싱, 실패하면 raw 텍스트로 래핑
     action_obj: Dict[str, Any]
-    try:
-        import json
-        parsed = json.loads(action_text)
-        if isinstance(parsed, dict):
-            action_obj = parsed
-        else:
-            action_obj = {"type": "raw", "target": None, "params": {"text": action_text}}
-    except Exception:
+    parsed = extract_json_object(action_text)  # 앞뒤 잡음 텍스트가 있어도 첫 JSON 객체만
+    if parsed is not None:
+        action_obj = parsed
+    else:
         action_obj = {"type": "raw", "target": None, "params": {"text": action_text}}
 
-    with STORE.with_lock():
-        STORE.actions[body.command_id] = {"command_id": body.command_id, "action": action_obj}
+    DISPATCHER.set_action(body.command_id, {"command_id": body.command_id, "action": action_obj})
 
     return Ack()
 
@@ -191,12 +547,102 @@ def post_state(body: StatePost):
 # -----------------------------
 @app.get("/action", response_model=Optional[ActionPayload])
 def get_action(command_id: str = Query(...)):
-    with STORE.with_lock():
-        item = STORE.actions.get(command_id)
-        if not item:
-            return None
+    item = DISPATCHER.get_action(command_id)
+    if not item:
+        return None
     return ActionPayload(**item)
 
+@app.get("/dispatcher/stats")
+def dispatcher_stats():
+    return DISPATCHER.stats()
+
+@app.get("/prefix_cache/stats")
+def prefix_cache_stats():
+    return PREFIX_CACHE.stats()
+
+@app.get("/speculative/stats")
+def speculative_stats():
+    return {"mode": SPECULATIVE_DECODING, "action_temperature": ACTION_TEMPERATURE, **SPEC_STATS.snapshot()}
+
+@app.get("/model_pool/stats")
+def model_pool_stats():
+    """worker 풀 상태 (풀을 쓰지 않으면 null). 배처 / prefix 캐시 / speculative 통계는 각 worker 안에 있음"""
+    return MODEL_POOL.stats() if MODEL_POOL is not None else None
+
+# -----------------------------
+# Metrics (Prometheus text 형식)
+# 토큰 수 / prefill / decode 시간은 generation_utils 가 생성할 때마다 기록
+# -----------------------------
+def _collect_metrics():
+    dispatcher = DISPATCHER.stats()
+    batcher = GENERATE_BATCHER.stats()
+    prefix = PREFIX_CACHE.stats()
+    spec = SPEC_STATS.snapshot()
+    return [
+        ("dispatcher_sessions", "gauge", "등록된 세션 수", dispatcher["sessions"]),
+        ("dispatcher_pending_commands", "gauge", "실행 웹이 아직 안 가져간 명령 수", dispatcher["pending"]),
+        ("dispatcher_waiters", "gauge", "/command long-poll 대기 수", dispatcher["waiters"]),
+        ("dispatcher_evicted_total", "counter", "제거된 command 기록 수", dispatcher["evicted"]),
+        ("generate_queue_depth", "gauge", "생성 배처 대기열 길이", batcher["queue_depth"]),
+        ("generate_batches_total", "counter", "처리한 배치 수", batcher["batches"]),
+        ("prefix_cache_hits_total", "counter", "prefix KV-cache hit", prefix["hits"]),
+        ("prefix_cache_misses_total", "counter", "prefix KV-cache miss", prefix["misses"]),
+        ("prefix_cache_hit_rate", "gauge", "prefix KV-cache hit rate", prefix["hit_rate"]),
+        ("prefix_cache_bytes", "gauge", "prefix KV-cache 메모리 사용량", prefix["bytes"]),
+        ("speculative_acceptance_rate", "gauge", "draft 토큰 채택 비율", spec["acceptance_rate"]),
+        ("speculative_tokens_per_forward", "gauge", "forward 한 번당 생성 토큰 수", spec["tokens_per_forward"]),
+        ("model_ready", "gauge", "모델 준비 여부",
+         [({"model": name}, m["state"] == "ready") for name, m in MODEL_MANAGER.status()["models"].items()]),
+    ]
+
+REGISTRY.add_collector(_collect_metrics)
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
+# -----------------------------
+# Model loading: startup / readiness
+# -----------------------------
+@app.on_event("startup")
+async def _start_model_loading():
+    global _LOOP
+    _LOOP = asyncio.get_running_loop()
+    MODEL_MANAGER.start()
+    if MODEL_POOL is not None:
+        MODEL_POOL.start_health_checks()  # worker ping / 죽은 worker 재시작
+
+@app.on_event("shutdown")
+async def _stop_model_pool():
+    if MODEL_POOL is not None:
+        await MODEL_POOL.close()
+
+@app.get("/ready")
+def ready():
+    """모델 로드 + warm-up 이 끝났으면 200, 아니면 503"""
+    status = MODEL_MANAGER.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+# -----------------------------
+# model_worker_pool 의 worker 프로세스에서 호출하는 함수 (worker 안에서는 MODEL_POOL 이 None → 이 프로세스의 배처에서 생성)
+# -----------------------------
+WORKER_METHODS = ("generate", "stream", "speculative_action")
+
+def load():
+    """worker 시작: QwenGenerator (+ draft 모델) 로드 / warm-up 이 끝날 때까지 대기 (warm-up 도 여기서, 따로 warm_up() 없음)"""
+    MODEL_MANAGER.start()
+    for name in MODEL_MANAGER.status()["models"]:
+        MODEL_MANAGER.get(name)
+
+def generate(**params) -> str:
+    return _generate(**params)
+
+def stream(**params):
+    return _start_stream(**params)
+
+def speculative_action(**params) -> Optional[str]:
+    return _speculative_action(**params)
+
 # -----------------------------
 # Root
 # -----------------------------
@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+Metrics
+/metrics (Prometheus text 형식) 용 카운터 / 게이지 / 히스토그램 + 테스크 단위 trace
+prometheus_client 없이 필요한 만큼만 구현
+
+- REGISTRY.counter / gauge / histogram: 이름 + label 로 값 기록 (요청 처리 중에는 Lock 잡고 더하기만)
+- REGISTRY.add_collector(fn): scrape 할 때마다 기존 stats() (대기열 길이, 캐시 hit rate 등)를 읽어서 내보냄
+- instrument_app(app): route 별 요청 수 / 지연 시간 히스토그램
+- Tracer: /prompt → /state, /action 각 step → /verification 을 trace 하나로 묶어 최근 N 개 보관
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# ============================
+# 메트릭 타입
+# ============================
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}  # label 값 tuple -> 값
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def samples(self):
+        """[(이름, [(label, 값), ...], 값)]"""
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, list(zip(self.label_names, key)), value) for key, value in items]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]  # 구간별 개수, 합, 전체 개수
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def time(self, **labels):
+        """with 블록 실행 시간(초)을 기록"""
+        return _Timer(self, labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(counts), total, count) for key, (counts, total, count) in self._values.items()]
+        result = []
+        for key, counts, total, count in items:
+            labels = list(zip(self.label_names, key))
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                result.append((self.name + "_bucket", labels + [("le", _format_value(float(bound)))], cumulative))
+            result.append((self.name + "_bucket", labels + [("le", "+Inf")], count))
+            result.append((self.name + "_sum", labels, round(total, 6)))
+            result.append((self.name + "_count", labels, count))
+        return result
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+# ============================
+# 레지스트리
+# ============================
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = OrderedDict()
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, help, labels, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labels, **kwargs)
+            return metric
+
+    def counter(self, name, help, labels=()):
+        return self._register(Counter, name, help, labels)
+
+    def gauge(self, name, help, labels=()):
+        return self._register(Gauge, name, help, labels)
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, help, labels, buckets=buckets)
+
+    def add_collector(self, fn):
+        """
+        fn() -> [(이름, "gauge" | "counter", 설명, 값 또는 [(label dict, 값), ...]), ...]
+        값이 None 이면 건너뜀 (아직 측정값이 없는 hit rate 등)
+        """
+        self._collectors.append(fn)
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for fn in self._collectors:
+            try:
+                families = list(fn())
+            except Exception as e:
+                lines.append(f"# collector {getattr(fn, '__name__', fn)} 실패: {_escape(e)}")
+                continue
+            for name, kind, help, samples in families:
+                if not isinstance(samples, list):
+                    samples = [({}, samples)]
+                samples = [(labels, value) for labels, value in samples if value is not None]
+                if not samples:
+                    continue
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(sorted(labels.items()))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+def instrument_app(app, registry=REGISTRY):
+    """
+    route 별 요청 수 / 지연 시간 기록 (label 은 /blobs/{digest} 같은 route 템플릿, 경로 값 그대로 쓰지 않음)
+    SSE / StreamingResponse 는 응답 헤더가 나갈 때까지만 측정됨
+    """
+    latency = registry.histogram("http_request_duration_seconds", "HTTP 요청 처리 시간", ("method", "route"))
+    requests = registry.counter("http_requests_total", "HTTP 요청 수", ("method", "route", "status"))
+
+    @app.middleware("http")
+    async def _record_request(request, call_next):
+        started = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            route = request.scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            latency.observe(time.perf_counter() - started, method=request.method, route=path)
+            requests.inc(method=request.method, route=path, status=status)
+
+
+# ============================
+# 테스크 trace
+# ============================
+class Tracer:
+    def __init__(self, max_traces=200, registry=REGISTRY):
+        self.max_traces = max_traces
+        self._traces = OrderedDict()  # trace_id -> trace dict (오래된 순)
+        self._lock = threading.Lock()
+        self._span_seconds = registry.histogram("task_span_seconds", "테스크 step(span) 처리 시간", ("span",))
+        self._task_seconds = registry.histogram("task_duration_seconds", "프롬프트부터 검증까지 걸린 시간", ("outcome",))
+
+    def start(self, name="task", **attrs):
+        """새 trace 시작 → trace_id"""
+        trace_id = uuid.uuid4().hex[:16]
+        trace = {
+            "trace_id": trace_id,
+            "name": name,
+            "attrs": attrs,
+            "started_at": datetime.now().isoformat(timespec="milliseconds"),
+            "duration_ms": None,
+            "outcome": None,
+            "spans": [],
+            "_t0": time.perf_counter(),
+        }
+        with self._lock:
+            self._traces[trace_id] = trace
+            while len(self._traces) > self.max_traces:
+                self._traces.popitem(last=False)
+        return trace_id
+
+    def add_span(self, trace_id, name, started, ended=None, **attrs):
+        """
+        started / ended: time.perf_counter() 값
+        trace_id 가 None 이거나 이미 밀려난 trace 여도 span 시간 히스토그램에는 기록
+        """
+        ended = time.perf_counter() if ended is None else ended
+        self._span_seconds.observe(ended - started, span=name)
+        if trace_id is None:
+            return
+        with self._lock:
+            trace = self._traces.get(trace_id)
+            if trace is None:
+                return
+            trace["spans"].append({
+                "name": name,
+                "offset_ms": round((started - trace["_t0"]) * 1000, 2),
+                "duration_ms": round((ended - started) * 1000, 2),
+                "attrs": attrs,
+            })
+
+    def end(self, trace_id, outcome="ok", **attrs):
+        if trace_id is None:
+            return
+        with self._lock:
+            trace = self._traces.get(trace_id)
+            if trace is None or trace["outcome"] is not None:
+                return
+            elapsed = time.perf_counter() - trace["_t0"]
+            trace["duration_ms"] = round(elapsed * 1000, 2)
+            trace["outcome"] = outcome
+            trace["attrs"].update(attrs)
+        self._task_seconds.observe(elapsed, outcome=outcome)
+
+    def get(self, trace_id):
+        with self._lock:
+            trace = self._traces.get(trace_id)
+            return _public(trace) if trace is not None else None
+
+    def recent(self, limit=20, **attrs):
+        """최근 trace (attrs 로 필터, 예: session_id="...")"""
+        with self._lock:
+            traces = [t for t in reversed(self._traces.values())
+                      if all(t["attrs"].get(k) == v for k, v in attrs.items())]
+            return [_public(t) for t in traces[:limit]]
+
+
+def _public(trace):
+    result = {k: v for k, v in trace.items() if not k.startswith("_")}
+    result["attrs"] = dict(trace["attrs"])
+    result["spans"] = list(trace["spans"])
+    return result
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Micro Batcher
+여러 세션/요청에서 들어온 생성 요청을 짧은 시간(max_wait_ms) 동안 모아서
+모델 generate 를 한 번에 돌리고, 결과를 각 요청에 다시 나눠주는 스케줄러
+
+- 최대 배치 크기(max_batch_size), 최대 대기 시간(max_wait_ms) 설정 가능
+- 요청마다 파라미터가 다를 수 있음. group_key 가 같은 요청끼리만 한 배치로 묶음
+  (예: temperature/top_p 가 같은 것끼리, max_new_tokens 는 최댓값으로 돌리고 요청별로 잘라냄)
+- 대기열이 가득 차면 InferenceQueueFull
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from inference_executor import InferenceQueueFull
+
+
+class _Pending:
+    __slots__ = ("payload", "params", "key", "future", "submitted_at")
+
+    def __init__(self, payload, params, key):
+        self.payload = payload
+        self.params = params
+        self.key = key
+        self.future = Future()
+        self.submitted_at = time.perf_counter()
+
+
+class MicroBatcher:
+    def __init__(self, batch_fn, max_batch_size=8, max_wait_ms=10, max_queue=64,
+                 group_key=None, name="batcher"):
+        """
+        Args:
+            batch_fn: batch_fn(payloads: list, params: list[dict]) -> list (payloads 와 같은 길이)
+            group_key: group_key(params) -> hashable. 같은 값끼리만 한 배치로 묶음 (기본: 전부 한 그룹)
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue = max_queue
+        self.group_key = group_key or (lambda params: None)
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._batch_seq = 0
+        self._batches = 0
+        self._batched_items = 0
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, payload, **params):
+        """
+        요청 하나를 넣고 concurrent.futures.Future 를 돌려줌
+        future.timing = {"batch_id", "batch_size", "queued_ms", "run_ms"}
+        """
+        item = _Pending(payload, params, self.group_key(params))
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                raise InferenceQueueFull(f"배치 대기열이 가득 찼습니다. (queue_size={self.max_queue})")
+            self._queue.append(item)
+            self._cond.notify()
+        return item.future
+
+    def _take_batch(self):
+        """첫 요청이 들어오면 max_wait 동안 더 모은 뒤, 같은 그룹 요청을 최대 max_batch_size 개 꺼냄"""
+        with self._cond:
+            while not self._queue and not self._closed:
+                self._cond.wait()
+            if self._closed and not self._queue:
+                return None
+
+            key = self._queue[0].key
+            deadline = self._queue[0].submitted_at + self.max_wait
+            while True:
+                same_group = sum(1 for p in self._queue if p.key == key)
+                remaining = deadline - time.perf_counter()
+                if same_group >= self.max_batch_size or remaining <= 0 or self._closed:
+                    break
+                self._cond.wait(remaining)
+
+            batch, rest = [], deque()
+            while self._queue:
+                p = self._queue.popleft()
+                if p.key == key and len(batch) < self.max_batch_size:
+                    batch.append(p)
+                else:
+                    rest.append(p)
+            self._queue = rest
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+            self._batch_seq += 1
+            started_at = time.perf_counter()
+            live = [p for p in batch if p.future.set_running_or_notify_cancel()]
+            if not live:
+                continue
+            try:
+                results = self.batch_fn([p.payload for p in live], [p.params for p in live])
+                if len(results) != len(live):
+                    raise RuntimeError(f"batch_fn 결과 개수 불일치: {len(results)} != {len(live)}")
+                error = None
+            except BaseException as e:
+                results, error = None, e
+
+            run_ms = round((time.perf_counter() - started_at) * 1000, 2)
+            self._batches += 1
+            self._batched_items += len(live)
+            for i, p in enumerate(live):
+                p.future.timing = {
+                    "batch_id": self._batch_seq,
+                    "batch_size": len(live),
+                    "queued_ms": round((started_at - p.submitted_at) * 1000, 2),
+                    "run_ms": run_ms,
+                }
+                if error is not None:
+                    p.future.set_exception(error)
+                else:
+                    p.future.set_result(results[i])
+
+    @property
+    def queue_depth(self):
+        with self._cond:
+            return len(self._queue)
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": round(self.max_wait * 1000, 2),
+            "queue_depth": self.queue_depth,
+            "batches": self._batches,
+            "avg_batch_size": round(self._batched_items / self._batches, 2) if self._batches else None,
+        }
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout=5)
@@ -2,16 +2,33 @@
 """
 Mock Action Model for Testing
 모델 없이 One-Action-at-a-Time 흐름을 테스트하기 위한 Mock 모듈
+
+MOCK_LATENCY_MS: 액션 생성마다 넣을 가짜 추론 시간 (부하 테스트용, 기본 0)
+get_plan: plan 모드용 - 3단계 전체를 checkpoint 와 함께 한 번에 반환
 """
+import logging
+import os
+import time
+
+log = logging.getLogger(__name__)
+
+MOCK_LATENCY_MS = float(os.environ.get("MOCK_LATENCY_MS", 0))
+
+# ========== 세션 상태 ==========
+# session_id 별로 step 진행 상황을 따로 관리 (여러 실행 웹이 동시에 돌 수 있음)
+# session_id 없이 호출하면 None 키 하나를 공유 (기존 동작과 동일)
+class _MockSession:
+    def __init__(self):
+        self.current_step_index = 0
 
-# ========== 전역 세션 상태 ==========
-_current_step_index = 0
+        # ========== 수정 추가 (2025-11-19) ==========
+        # 문제: Render 서버가 재시작하지 않으면 current_step_index가 초기화 안 됨
+        # 해결: 마지막 프롬프트를 저장해서 새 프롬프트 감지 시 초기화
+        self.last_prompt = None  # ← 추가: 프롬프트 변경 감지용
+        # ========== 수정 끝 ==========
 
-# ========== 수정 추가 (2025-11-19) ==========
-# 문제: Render 서버가 재시작하지 않으면 _current_step_index가 초기화 안 됨
-# 해결: 마지막 프롬프트를 저장해서 새 프롬프트 감지 시 초기화
-_last_prompt = None  # ← 추가: 프롬프트 변경 감지용
-# ========== 수정 끝 ==========
+
+_sessions = {}
 
 # Mock plan: 3단계
 _mock_steps = [
@@ -39,8 +56,15 @@ _mock_actions = [
     }
 ]
 
+# plan 모드: 각 step 실행 후 확인할 조건 (action_plan.check_checkpoint 형식)
+_mock_checkpoints = [
+    {"url_contains": "main.clx"},          # Step 1 후: 메인 페이지
+    {"sidebar_item": "학적부열람"},          # Step 2 후: 학적 메뉴가 펼쳐져 하위 메뉴가 보임
+    None,                                  # Step 3: 마지막 (verification 에서 확인)
+]
+
 
-def get_next_action(observations=None, prompt_text=None, **kwargs):
+def get_next_action(observations=None, prompt_text=None, session_id=None, **kwargs):
     """
     Mock: 다음 액션 생성
     미리 정의된 액션을 순차적으로 반환
@@ -50,75 +74,111 @@ def get_next_action(observations=None, prompt_text=None, **kwargs):
     - 새 프롬프트 감지를 위해 추가
     - 프롬프트가 바뀌면 step_index 초기화
     ========================================
+    session_id: 세션별로 step_index 를 따로 관리
     """
-    global _current_step_index, _last_prompt
+    state = _sessions.setdefault(session_id, _MockSession())
+    if MOCK_LATENCY_MS and not kwargs.get("_batched"):
+        time.sleep(MOCK_LATENCY_MS / 1000)
 
     # ========== 디버그 로깅 추가 (2025-11-19) ==========
-    print(f"[Mock DEBUG] 함수 시작 - _current_step_index: {_current_step_index}, _last_prompt: {_last_prompt}")
-    print(f"[Mock DEBUG] 받은 prompt_text: {prompt_text}")
+    log.debug("[Mock DEBUG] 함수 시작 - state.current_step_index: %s, state.last_prompt: %s", state.current_step_index, state.last_prompt)
+    log.debug("[Mock DEBUG] 받은 prompt_text: %s", prompt_text)
     # ========== 디버그 끝 ==========
 
     # ========== 수정 시작 (2025-11-19) ==========
-    # 문제 1: 이전 실행이 완료된 상태(_current_step_index >= len)에서 새 요청이 오면 리셋 필요
+    # 문제 1: 이전 실행이 완료된 상태(state.current_step_index >= len)에서 새 요청이 오면 리셋 필요
     # 해결: 완료 상태에서 새 prompt_text가 오면 무조건 리셋
-    if _current_step_index >= len(_mock_steps) and prompt_text:
-        print(f"[Mock] 이전 실행 완료 상태에서 새 프롬프트 감지 → 강제 리셋")
-        _current_step_index = 0
-        _last_prompt = prompt_text
-        print(f"[Mock DEBUG] 강제 리셋 후 - _current_step_index: {_current_step_index}")
+    if state.current_step_index >= len(_mock_steps) and prompt_text:
+        log.debug("[Mock] 이전 실행 완료 상태에서 새 프롬프트 감지 → 강제 리셋")
+        state.current_step_index = 0
+        state.last_prompt = prompt_text
+        log.debug("[Mock DEBUG] 강제 리셋 후 - state.current_step_index: %s", state.current_step_index)
 
     # 문제 2: observations로 첫 요청 감지가 불완전함 (첫 요청도 UI 상태 포함 가능)
     # 해결: prompt_text 변경으로 새 세션 감지
-    elif prompt_text and prompt_text != _last_prompt:
-        print(f"[Mock] 새 프롬프트 감지: '{prompt_text}', step_index 초기화")
-        _current_step_index = 0
-        _last_prompt = prompt_text
-        print(f"[Mock DEBUG] 초기화 후 - _current_step_index: {_current_step_index}")
+    elif prompt_text and prompt_text != state.last_prompt:
+        log.debug("[Mock] 새 프롬프트 감지: '%s', step_index 초기화", prompt_text)
+        state.current_step_index = 0
+        state.last_prompt = prompt_text
+        log.debug("[Mock DEBUG] 초기화 후 - state.current_step_index: %s", state.current_step_index)
     # ========== 수정 끝 ==========
 
     # 모든 step 완료 (리셋 후에는 여기 안 옴)
-    if _current_step_index >= len(_mock_steps):
-        print(f"[Mock DEBUG] 모든 step 완료 (_current_step_index={_current_step_index} >= {len(_mock_steps)})")
+    if state.current_step_index >= len(_mock_steps):
+        log.debug("[Mock DEBUG] 모든 step 완료 (state.current_step_index=%s >= %s)", state.current_step_index, len(_mock_steps))
         return {
             "generated_action": {
                 "type": "trajectory",
                 "action": None,
                 "description": "All steps completed",
-                "current_step": _current_step_index,
+                "current_step": state.current_step_index,
                 "total_steps": len(_mock_steps)
             }
         }
 
     # 현재 step 정보
-    sid, tplan = _mock_steps[_current_step_index]
-    is_last_action = (_current_step_index == len(_mock_steps) - 1)
+    sid, tplan = _mock_steps[state.current_step_index]
+    is_last_action = (state.current_step_index == len(_mock_steps) - 1)
 
-    print(f"[Mock DEBUG] 액션 생성 전 - _current_step_index: {_current_step_index}, is_last_action: {is_last_action}")
+    log.debug("[Mock DEBUG] 액션 생성 전 - state.current_step_index: %s, is_last_action: %s", state.current_step_index, is_last_action)
 
-    action = _mock_actions[_current_step_index].copy()
+    action = _mock_actions[state.current_step_index].copy()
 
     # 마지막 액션이면 status: "FINISH" 추가
     if is_last_action:
         action["status"] = "FINISH"
-        print(f"[Mock] 마지막 액션에 status='FINISH' 추가")
+        log.debug("[Mock] 마지막 액션에 status='FINISH' 추가")
 
-    print(f"[Mock] 액션 생성: step {_current_step_index + 1}/{len(_mock_steps)} - {tplan}")
+    log.debug("[Mock] 액션 생성: step %s/%s - %s", state.current_step_index + 1, len(_mock_steps), tplan)
     if observations:
-        print(f"[Mock] Observations 수신: {observations}")
+        log.debug("[Mock] Observations 수신: %s", observations)
 
     result = {
         "generated_action": {
             "type": "trajectory",
             "action": action,
             "description": tplan,
-            "current_step": _current_step_index + 1,
+            "current_step": state.current_step_index + 1,
             "total_steps": len(_mock_steps)
         }
     }
 
     # step index 증가
-    print(f"[Mock DEBUG] 증가 전 - _current_step_index: {_current_step_index}")
-    _current_step_index += 1
-    print(f"[Mock DEBUG] 증가 후 - _current_step_index: {_current_step_index}")
+    log.debug("[Mock DEBUG] 증가 전 - state.current_step_index: %s", state.current_step_index)
+    state.current_step_index += 1
+    log.debug("[Mock DEBUG] 증가 후 - state.current_step_index: %s", state.current_step_index)
 
     return result
+
+
+def get_next_action_batch(requests, **kwargs):
+    """
+    Mock: 여러 세션의 요청을 한 번에 처리 (배치 인터페이스 예시)
+    requests: [{"observations", "prompt_text", "session_id"}, ...]
+    실제 모델은 여기서 프롬프트들을 패딩해서 generate 한 번으로 처리하면 됨
+    """
+    if MOCK_LATENCY_MS:
+        time.sleep(MOCK_LATENCY_MS / 1000)  # 배치 전체에 한 번 (generate 한 번으로 처리하는 것처럼)
+    return [get_next_action(**req, _batched=True, **kwargs) for req in requests]
+
+
+def get_plan(observations=None, prompt_text=None, session_id=None, failure=None, **kwargs):
+    """
+    Mock: 테스크 전체 액션 목록을 한 번에 생성 (plan 모드)
+    failure: 실행 웹이 보고한 checkpoint 실패 {"step": n, "reason": ...} → 실패한 step 부터 다시 계획
+    step 모드의 세션별 step 카운터와는 상관없음
+    """
+    if MOCK_LATENCY_MS:
+        time.sleep(MOCK_LATENCY_MS / 1000)
+
+    start = 0
+    if failure:
+        start = min(max(int(failure.get("step", 1)) - 1, 0), len(_mock_steps) - 1)
+        log.debug("[Mock] plan 재생성: step %s 부터 (이유: %s)", start + 1, failure.get("reason"))
+
+    steps = [
+        {"action": dict(action), "description": tplan, "checkpoint": checkpoint}
+        for (_, tplan), action, checkpoint in zip(_mock_steps[start:], _mock_actions[start:], _mock_checkpoints[start:])
+    ]
+    log.debug("[Mock] plan 생성: %s단계", len(steps))
+    return {"generated_plan": {"steps": steps, "description": prompt_text}}
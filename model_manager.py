@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Model Manager
+서버 시작 시 모델을 백그라운드 스레드에서 미리 로드 + warm-up 해두고, 준비 상태를 알려주는 관리자
+(첫 /state, /generate 요청이 모델 로드 시간을 떠안지 않도록)
+
+- register(name, loader, warmup): 로드 함수 등록, start() 로 백그라운드 로드 시작
+- get(name, timeout): 준비될 때까지 최대 timeout 초 대기, 아니면 ModelNotReady
+- load_causal_lm: safetensors(mmap) + low_cpu_mem_usage 로 로드, fp32 / bf16 / int8(동적 양자화) 선택
+  torch / transformers 는 실제로 로드할 때만 import
+"""
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class ModelNotReady(Exception):
+    """모델이 아직 로드 중이거나 로드에 실패함"""
+
+
+def _rss_mb():
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return round(psutil.Process().memory_info().rss / (1024 * 1024), 1)
+
+
+# ============================
+# HF 모델 로드 / 정밀도 / warm-up
+# ============================
+def apply_precision(model, dtype):
+    """
+    이미 로드된 모델에 정밀도 적용
+    dtype: "fp32" | "bf16" | "int8" (int8 은 CPU 전용 동적 양자화, nn.Linear 만)
+    """
+    import torch
+
+    if dtype == "bf16":
+        return model.to(torch.bfloat16)
+    if dtype == "int8":
+        if model.device.type != "cpu":
+            log.warning("[ModelManager] int8 동적 양자화는 CPU 전용이라 건너뜀 (device=%s)", model.device)
+            return model
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+def load_causal_lm(path, dtype=None, device=None):
+    """
+    AutoModelForCausalLM + AutoTokenizer 로드
+    - safetensors 파일이 있으면 safetensors 로 (mmap 으로 읽어서 fp32 사본을 한 번 더 만들지 않음)
+    - dtype=None 이면 MODEL_DTYPE 환경변수 (기본 fp32)
+    """
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    dtype = dtype or os.environ.get("MODEL_DTYPE", "fp32")
+    device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+    use_safetensors = os.path.isdir(path) and any(f.endswith(".safetensors") for f in os.listdir(path))
+
+    tokenizer = AutoTokenizer.from_pretrained(path)
+    model = AutoModelForCausalLM.from_pretrained(
+        path,
+        torch_dtype=torch.bfloat16 if dtype == "bf16" else torch.float32,
+        low_cpu_mem_usage=True,
+        use_safetensors=use_safetensors or None,
+    )
+    model.to(device)
+    model.eval()
+    if dtype == "int8":
+        model = apply_precision(model, "int8")
+    return model, tokenizer
+
+
+def warm_up(model, tokenizer, prompt="warm up", max_new_tokens=4):
+    """짧은 generate 한 번 (커널 선택 / 메모리 할당을 첫 요청 전에 끝내둠)"""
+    import torch
+
+    enc = tokenizer(prompt, return_tensors="pt").to(model.device)
+    with torch.no_grad():
+        model.generate(
+            input_ids=enc["input_ids"],
+            attention_mask=enc["attention_mask"],
+            max_new_tokens=max_new_tokens,
+            do_sample=False,
+            pad_token_id=tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id,
+        )
+
+
+# ============================
+# 백그라운드 로드 관리
+# ============================
+class _ModelEntry:
+    def __init__(self, name, loader, warmup):
+        self.name = name
+        self.loader = loader
+        self.warmup = warmup
+        self.state = "pending"  # pending → loading → warming_up → ready | failed
+        self.value = None
+        self.error = None
+        self.load_ms = None
+        self.warmup_ms = None
+        self.ready_event = threading.Event()
+
+
+class ModelManager:
+    def __init__(self):
+        self._entries = {}
+        self._thread = None
+        self._lock = threading.Lock()
+        self.rss_before_mb = None
+        self.rss_after_mb = None
+
+    def register(self, name, loader, warmup=None):
+        """
+        Args:
+            loader: loader() -> 모델 객체 (get() 이 돌려줄 값)
+            warmup: warmup(모델 객체) (선택)
+        """
+        self._entries[name] = _ModelEntry(name, loader, warmup)
+
+    def start(self):
+        """등록된 모델을 백그라운드 스레드에서 순서대로 로드 (이미 시작했으면 무시)"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._load_all, name="model-loader", daemon=True)
+            self._thread.start()
+
+    def _load_all(self):
+        self.rss_before_mb = _rss_mb()
+        for entry in self._entries.values():
+            self._load(entry)
+        self.rss_after_mb = _rss_mb()
+
+    def _load(self, entry):
+        try:
+            entry.state = "loading"
+            started = time.perf_counter()
+            entry.value = entry.loader()
+            entry.load_ms = round((time.perf_counter() - started) * 1000, 1)
+            log.info("[ModelManager] %s 로드 완료 (%sms)", entry.name, entry.load_ms)
+
+            if entry.warmup is not None:
+                entry.state = "warming_up"
+                started = time.perf_counter()
+                entry.warmup(entry.value)
+                entry.warmup_ms = round((time.perf_counter() - started) * 1000, 1)
+                log.info("[ModelManager] %s warm-up 완료 (%sms)", entry.name, entry.warmup_ms)
+            entry.state = "ready"
+        except Exception as e:
+            entry.state = "failed"
+            entry.error = str(e)
+            log.exception("[ModelManager] %s 로드 실패: %s", entry.name, e)
+        finally:
+            entry.ready_event.set()
+
+    def get(self, name, timeout=None):
+        """
+        준비된 모델 반환. 아직 start() 전이면 바로 시작
+        timeout 초 안에 준비되지 않거나 로드에 실패하면 ModelNotReady
+        """
+        entry = self._entries[name]
+        self.start()
+        if not entry.ready_event.wait(timeout):
+            raise ModelNotReady(f"{name} 모델 로드 중입니다. (state={entry.state})")
+        if entry.state != "ready":
+            raise ModelNotReady(f"{name} 모델 로드 실패: {entry.error}")
+        return entry.value
+
+    @property
+    def ready(self):
+        return all(entry.state == "ready" for entry in self._entries.values())
+
+    def status(self):
+        return {
+            "ready": self.ready,
+            "rss_before_mb": self.rss_before_mb,
+            "rss_after_mb": self.rss_after_mb,
+            "models": {
+                name: {
+                    "state": entry.state,
+                    "load_ms": entry.load_ms,
+                    "warmup_ms": entry.warmup_ms,
+                    "error": entry.error,
+                }
+                for name, entry in self._entries.items()
+            },
+        }
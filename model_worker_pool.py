@@ -0,0 +1,712 @@
+# -*- coding: utf-8 -*-
+"""
+Model Worker Pool
+액션 모델 추론을 API 프로세스 밖의 worker 프로세스들에서 실행 (Unix socket IPC)
+(기존: API 프로세스 안에서 import 한 모델을 추론 스레드로 호출 → GIL / 메모리 / HTTP 처리가 서로 경쟁,
+ 모델이 죽으면 API 도 같이 죽음)
+
+- worker: 모델 모듈을 import → load() / warm_up() 후 socket 에서 get_next_action / get_next_action_batch / get_plan 처리
+  (모듈에 WORKER_METHODS 가 있으면 그 함수들, 예: main.py 의 generate / stream / speculative_action)
+  요청은 4바이트 길이 + JSON 프레임, 연결마다 스레드 하나, 모델 호출은 worker 당 concurrency 개까지만 동시에
+  함수가 generator 를 반환하면 {"chunk"} 프레임을 나오는 대로 보내고 마지막에 {"result": null} (stream() 으로 받음)
+- 라우팅: session_id 로 rendezvous hashing → 같은 세션의 step 은 항상 같은 worker (세션별 step 카운터 / KV cache 유지)
+  worker 가 빠지면 그 worker 의 세션만 다른 worker 로 옮겨감
+- health check: health_interval 마다 ping (모델 호출과 별도 연결이라 추론 중에도 응답)
+  프로세스가 죽었으면 재시작 (연달아 죽으면 대기 시간을 늘림), 살아 있는데 ping 이 계속 실패하면 kill 후 재시작
+- 요청 중 연결이 끊기면 (worker 죽음) 그 worker 를 빼고 한 번만 다른 worker 로 재시도
+- 대기 + 실행 중인 요청이 capacity(worker 수 x concurrency) + max_queue 를 넘으면 InferenceQueueFull (→ 429)
+
+MODEL_WORKERS=N 이면 Api.py 가 worker N개를 직접 띄움
+MODEL_POOL_DIR 가 있으면 이미 떠 있는 worker(worker-0.sock ...)에 연결만 함 (WEB_CONCURRENCY 로 uvicorn worker 가 여럿일 때,
+또는 따로 띄운 풀: python model_worker_pool.py --module action_model_2 --workers 4 --socket-dir /tmp/model-workers)
+"""
+import argparse
+import asyncio
+import atexit
+import hashlib
+import importlib
+import inspect
+import json
+import logging
+import os
+import shutil
+import signal
+import socket
+import socketserver
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+
+from inference_executor import InferenceQueueFull
+from model_manager import ModelNotReady
+
+log = logging.getLogger(__name__)
+
+METHODS = ("get_next_action", "get_next_action_batch", "get_plan")
+WORKER_ENV = "MODEL_WORKER_PROCESS"  # worker 프로세스에서 1 → 모델 모듈이 다시 풀을 만들지 않음 (from_env 가 None)
+_HEADER = struct.Struct(">I")
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+
+
+class ModelWorkerError(Exception):
+    """worker 가 죽었거나 응답이 없거나, 모델 함수가 예외를 냄"""
+
+
+def socket_paths(socket_dir, workers):
+    return [os.path.join(socket_dir, f"worker-{i}.sock") for i in range(workers)]
+
+
+# ============================
+# 프레임: 4바이트 길이(big-endian) + JSON
+# ============================
+def _encode(obj):
+    body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+    return _HEADER.pack(len(body)) + body
+
+
+def _recv_exact(sock, size):
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            raise ConnectionError("연결이 끊겼습니다.")
+        buf += chunk
+    return bytes(buf)
+
+
+def _recv_frame(sock):
+    (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    if size > MAX_FRAME_BYTES:
+        raise ConnectionError(f"프레임이 너무 큽니다. ({size} bytes)")
+    return json.loads(_recv_exact(sock, size))
+
+
+async def _read_frame(reader):
+    (size,) = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    if size > MAX_FRAME_BYTES:
+        raise ConnectionError(f"프레임이 너무 큽니다. ({size} bytes)")
+    return json.loads(await reader.readexactly(size))
+
+
+def ping(path, timeout=2.0):
+    """동기 ping → worker 정보 (pid, methods, inflight, handled)"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall(_encode({"method": "ping"}))
+        return _recv_frame(sock)["result"]
+
+
+# ============================
+# worker 프로세스
+# ============================
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                request = _recv_frame(self.request)
+            except (ConnectionError, OSError, ValueError):
+                return
+            responses = self.server.dispatch(request)
+            try:
+                for response in responses:
+                    try:
+                        frame = _encode(response)
+                    except (TypeError, ValueError) as e:
+                        frame = _encode({"error": f"결과를 JSON 으로 보낼 수 없습니다: {e}"})
+                    self.request.sendall(frame)
+            except OSError:
+                return
+            finally:
+                responses.close()  # 스트리밍 중 연결이 끊기면 모델 함수의 generator 도 정리
+
+
+class _WorkerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, module, concurrency):
+        self.module = module
+        self.methods = [name for name in getattr(module, "WORKER_METHODS", METHODS) if hasattr(module, name)]
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._lock = threading.Lock()
+        self.inflight = 0
+        self.handled = 0
+        super().__init__(path, _Handler)
+
+    def dispatch(self, request):
+        """응답 프레임들: {"result"} 또는 {"error"} 하나 (스트리밍이면 앞에 {"chunk"} 들)"""
+        method = request.get("method")
+        if method == "ping":
+            yield {"result": {"pid": os.getpid(), "methods": self.methods,
+                              "inflight": self.inflight, "handled": self.handled}}
+            return
+        if method not in self.methods:
+            yield {"error": f"지원하지 않는 메서드: {method}"}
+            return
+
+        with self._slots:  # 모델 호출은 concurrency 개까지만 동시에 (ping 은 제한 없음, 스트리밍은 끝날 때까지)
+            with self._lock:
+                self.inflight += 1
+            try:
+                result = getattr(self.module, method)(**request.get("kwargs", {}))
+                if inspect.isgenerator(result):
+                    for chunk in result:
+                        yield {"chunk": chunk}
+                    result = None
+                response = {"result": result}
+            except Exception as e:
+                log.exception("[ModelWorker] %s 실패", method)
+                response = {"error": f"{type(e).__name__}: {e}"}
+            finally:
+                with self._lock:
+                    self.inflight -= 1
+                    self.handled += 1
+        yield response
+
+
+def _exit_with_parent(parent_pid, interval=1.0):
+    """부모(API / 감시 프로세스)가 죽으면 같이 종료 (고아 worker 가 모델 메모리를 잡고 남지 않도록)"""
+    while True:
+        time.sleep(interval)
+        if os.getppid() != parent_pid:
+            log.warning("[ModelWorker] 부모 프로세스 종료 → worker 종료 (pid %s)", os.getpid())
+            os._exit(0)
+
+
+def serve(module_name, path, concurrency=1, parent_pid=None):
+    """worker 프로세스 본체: 모델 로드 / warm-up 이 끝난 뒤에 socket 을 열어서 ping 이 되면 준비된 것"""
+    if parent_pid:
+        threading.Thread(target=_exit_with_parent, args=(parent_pid,), name="parent-watch", daemon=True).start()
+
+    os.environ[WORKER_ENV] = "1"
+    started = time.perf_counter()
+    module = importlib.import_module(module_name)
+    if hasattr(module, "load"):
+        module.load()
+    if hasattr(module, "warm_up"):
+        module.warm_up()
+
+    if os.path.exists(path):
+        os.unlink(path)
+    server = _WorkerServer(path, module, concurrency)
+    log.info("[ModelWorker] %s 준비 완료 (pid %s, %sms, %s)", module_name, os.getpid(),
+             round((time.perf_counter() - started) * 1000, 1), path)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+# ============================
+# worker 프로세스 실행 / 감시 / 재시작
+# ============================
+class WorkerProcesses:
+    """
+    worker 프로세스들을 띄우고 죽으면 다시 띄움
+    Api.py (MODEL_WORKERS) 또는 WEB_CONCURRENCY 일 때 uvicorn 부모 프로세스, 또는 이 파일을 직접 실행한 감시 프로세스에서 사용
+    """
+
+    def __init__(self, module, workers, socket_dir=None, concurrency=1, restart_backoff=1.0, max_backoff=30.0):
+        self.module = module
+        self.concurrency = concurrency
+        self.restart_backoff = restart_backoff
+        self.max_backoff = max_backoff
+        self._own_dir = socket_dir is None
+        # 디렉터리는 start() 에서 만듦 (import 만 하고 안 쓰는 프로세스에 흔적이 남지 않게)
+        self.socket_dir = socket_dir or os.path.join(tempfile.gettempdir(), f"model-workers-{uuid.uuid4().hex[:8]}")
+        self.paths = socket_paths(self.socket_dir, workers)
+        self._procs = [None] * workers
+        self._started_at = [0.0] * workers
+        self._crashes = [0] * workers      # 금방 죽은 횟수 (재시작 대기 시간 계산용)
+        self._next_start = [0.0] * workers
+        self.restarts = [0] * workers
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _spawn(self, index):
+        path = self.paths[index]
+        if os.path.exists(path):
+            os.unlink(path)
+        command = [sys.executable, os.path.abspath(__file__), "--module", self.module, "--socket", path,
+                   "--concurrency", str(self.concurrency), "--parent-pid", str(os.getpid())]
+        self._procs[index] = subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)))
+        self._started_at[index] = time.monotonic()
+        log.info("[ModelWorkers] worker %s 시작 (pid %s)", index, self._procs[index].pid)
+
+    def alive(self, index):
+        proc = self._procs[index]
+        return proc is not None and proc.poll() is None
+
+    def pid(self, index):
+        proc = self._procs[index]
+        return proc.pid if proc is not None else None
+
+    def start(self, timeout=None):
+        """전부 띄우고, timeout 이 있으면 모두 ping 에 응답할 때까지 대기"""
+        if not os.path.isdir(self.socket_dir):
+            os.makedirs(self.socket_dir)
+            atexit.register(self.stop)  # shutdown 이벤트 없이 끝나도 worker / socket 디렉터리 정리
+        with self._lock:
+            for index in range(len(self.paths)):
+                if not self.alive(index):
+                    self._spawn(index)
+        if timeout is not None:
+            return wait_ready(self.paths, timeout, alive=self.alive)
+        return None
+
+    def check(self):
+        """죽은 worker 재시작 (시작 후 금방 죽기를 반복하면 재시작 간격을 2배씩 늘림)"""
+        now = time.monotonic()
+        with self._lock:
+            for index, proc in enumerate(self._procs):
+                if proc is None or self.alive(index) or self._stop.is_set():
+                    continue
+                if self._next_start[index] == 0.0:
+                    quick = now - self._started_at[index] < 10.0
+                    self._crashes[index] = self._crashes[index] + 1 if quick else 0
+                    delay = min(self.restart_backoff * (2 ** self._crashes[index]), self.max_backoff) if quick else 0.0
+                    self._next_start[index] = now + delay
+                    log.warning("[ModelWorkers] worker %s 종료 (exit %s) → %.1fs 후 재시작", index, proc.returncode, delay)
+                if now >= self._next_start[index]:
+                    self._next_start[index] = 0.0
+                    self.restarts[index] += 1
+                    self._spawn(index)
+
+    def restart(self, index):
+        """응답 없는 worker 강제 종료 → 다음 check() 에서 재시작"""
+        proc = self._procs[index]
+        if proc is not None and proc.poll() is None:
+            log.warning("[ModelWorkers] worker %s 응답 없음 → 강제 종료 (pid %s)", index, proc.pid)
+            proc.kill()
+            proc.wait()
+
+    def supervise(self, interval=1.0):
+        """stop() 까지 check() 반복 (별도 감시 프로세스 / 스레드용)"""
+        while not self._stop.wait(interval):
+            self.check()
+
+    def supervise_in_background(self, interval=1.0):
+        threading.Thread(target=self.supervise, args=(interval,), name="model-workers", daemon=True).start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        with self._lock:
+            for proc in self._procs:
+                if proc is not None and proc.poll() is None:
+                    proc.terminate()
+            for proc in self._procs:
+                if proc is None:
+                    continue
+                try:
+                    proc.wait(timeout)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+        if self._own_dir:
+            shutil.rmtree(self.socket_dir, ignore_errors=True)
+            return
+        for path in self.paths:
+            if os.path.exists(path):
+                os.unlink(path)
+
+
+def wait_ready(paths, timeout, alive=None, interval=0.1):
+    """
+    모든 worker 가 ping 에 응답할 때까지 대기 → [ping 결과 또는 None]
+    하나도 준비되지 않으면 ModelNotReady
+    """
+    deadline = time.monotonic() + timeout
+    infos = [None] * len(paths)
+    while True:
+        for index, path in enumerate(paths):
+            if infos[index] is None:
+                try:
+                    infos[index] = ping(path)
+                except (OSError, ConnectionError, ValueError):
+                    pass
+        pending = [i for i, info in enumerate(infos) if info is None]
+        if not pending:
+            return infos
+        if alive is not None and not any(alive(i) for i in pending):
+            if any(infos):
+                return infos  # 나머지는 죽었음 → 재시작은 health check 에 맡김
+            raise ModelNotReady("모델 worker 가 시작되지 못하고 종료되었습니다.")
+        if time.monotonic() >= deadline:
+            if any(infos):
+                log.warning("[ModelWorkers] 준비되지 않은 worker: %s", pending)
+                return infos
+            raise ModelNotReady(f"모델 worker 가 {timeout}초 안에 준비되지 않았습니다.")
+        time.sleep(interval)
+
+
+# ============================
+# API 쪽: 라우팅 / 동시 실행 제한 / health check
+# ============================
+class _Worker:
+    def __init__(self, index, path, concurrency):
+        self.index = index
+        self.path = path
+        self.healthy = False
+        self.failures = 0
+        self.methods = ()
+        self.pid = None
+        self.generation = 0    # pid 가 바뀌면 증가 → 이전 프로세스에 붙어 있던 연결은 버림
+        self.inflight = 0
+        self.completed = 0
+        self._slots = asyncio.Queue()
+        for _ in range(concurrency):
+            self._slots.put_nowait(None)
+
+    def update(self, info):
+        if info["pid"] != self.pid:
+            self.generation += 1
+        self.pid = info["pid"]
+        self.methods = tuple(info.get("methods", ()))
+        self.failures = 0
+        self.healthy = True
+
+    async def acquire(self):
+        """동시 실행 슬롯 하나 (연결은 재사용, 없거나 오래된 것이면 새로 연결)"""
+        conn = await self._slots.get()
+        if conn is not None and conn[2] == self.generation:
+            return conn
+        _close(conn)
+        try:
+            reader, writer = await asyncio.open_unix_connection(self.path)
+        except BaseException:
+            self._slots.put_nowait(None)
+            raise
+        return reader, writer, self.generation
+
+    def release(self, conn):
+        self._slots.put_nowait(conn)
+
+
+def _close(conn):
+    if conn is not None:
+        conn[1].close()
+    return None
+
+
+def _score(key, index):
+    digest = hashlib.blake2b(f"{key}:{index}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+class ModelWorkerPool:
+    def __init__(self, paths, concurrency=1, max_queue=8, request_timeout=120.0, start_timeout=600.0,
+                 health_interval=1.0, ping_timeout=2.0, max_ping_failures=5, processes=None):
+        """
+        Args:
+            paths: worker socket 경로 목록
+            processes: WorkerProcesses (이 프로세스가 worker 를 띄우고 재시작할 때, 연결만 할 때는 None)
+            max_ping_failures: 살아 있는데 ping 이 이만큼 연속 실패하면 강제 재시작
+        """
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.request_timeout = request_timeout
+        self.start_timeout = start_timeout
+        self.health_interval = health_interval
+        self.ping_timeout = ping_timeout
+        self.max_ping_failures = max_ping_failures
+        self.processes = processes
+        self._workers = [_Worker(i, path, concurrency) for i, path in enumerate(paths)]
+        self._pending = 0
+        self._job_seq = 0
+        self._completed = 0
+        self._rejected = 0
+        self._retried = 0
+        self.recent_jobs = deque(maxlen=100)
+        self._task = None
+
+    @property
+    def capacity(self):
+        return len(self._workers) * self.concurrency
+
+    def start(self):
+        """
+        worker 를 띄우고 (processes 가 있을 때) 준비될 때까지 대기 (모델 로드 스레드에서 호출, ModelManager loader)
+        Returns:
+            self
+        """
+        if self.processes is not None:
+            infos = self.processes.start(self.start_timeout)
+        else:
+            infos = wait_ready([w.path for w in self._workers], self.start_timeout)
+        for worker, info in zip(self._workers, infos):
+            if info is not None:
+                worker.update(info)
+        log.info("[ModelPool] worker %s/%s개 준비 (concurrency %s)",
+                 sum(w.healthy for w in self._workers), len(self._workers), self.concurrency)
+        return self
+
+    def supports(self, method):
+        return any(method in w.methods for w in self._workers if w.healthy)
+
+    def route(self, key):
+        """rendezvous hashing: 정상 worker 중 (key, worker) 점수가 가장 높은 곳"""
+        key = key or "default"
+        candidates = [w for w in self._workers if w.healthy]
+        if not candidates:
+            raise ModelNotReady("사용 가능한 모델 worker 가 없습니다.")
+        return max(candidates, key=lambda w: _score(key, w.index))
+
+    async def call(self, method, key=None, **kwargs):
+        """
+        key(session_id) 의 worker 에서 method(**kwargs) 실행
+
+        Returns:
+            (result, timing) - timing: {"job_id", "queued_ms", "run_ms", "worker"} (InferenceExecutor.run 과 같은 형식)
+        Raises:
+            InferenceQueueFull, ModelNotReady, ModelWorkerError
+        """
+        timing = self._admit()
+        submitted_at = time.perf_counter()
+        request = {"method": method, "kwargs": kwargs}
+        try:
+            for attempt in range(2):
+                worker = self.route(key)
+                conn = await worker.acquire()
+                started_at = time.perf_counter()
+                timing.update(queued_ms=round((started_at - submitted_at) * 1000, 2), worker=worker.index)
+                worker.inflight += 1
+                response = error = None
+                try:
+                    conn[1].write(_encode(request))
+                    await conn[1].drain()
+                    response = await asyncio.wait_for(_read_frame(conn[0]), self.request_timeout)
+                except asyncio.TimeoutError:
+                    error = ModelWorkerError(f"worker {worker.index} 응답 시간 초과 ({self.request_timeout}s)")
+                except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+                    error = e
+                finally:
+                    # 응답을 다 읽지 못한 연결은 (취소 포함) 다음 요청이 이전 응답을 받지 않도록 버림
+                    worker.release(conn if response is not None else _close(conn))
+                    worker.inflight -= 1
+                    timing["run_ms"] = round((time.perf_counter() - started_at) * 1000, 2)
+
+                if isinstance(error, ModelWorkerError):
+                    raise error
+                if error is not None:
+                    # worker 가 죽음 → 빼고 한 번만 다른 worker 로 재시도 (health check 가 재시작 / 복구)
+                    worker.healthy = False
+                    log.warning("[ModelPool] worker %s 연결 끊김 (%s: %s)", worker.index, type(error).__name__, error)
+                    if attempt:
+                        raise ModelWorkerError(f"worker {worker.index} 연결이 끊겼습니다.") from error
+                    self._retried += 1
+                    continue
+
+                worker.completed += 1
+                if "error" in response:
+                    raise ModelWorkerError(response["error"])
+                return response["result"], timing
+        finally:
+            self._finish(timing)
+
+    async def stream(self, method, key=None, **kwargs):
+        """
+        worker 에서 generator 를 반환하는 method 의 조각을 나오는 대로 yield (call 과 같은 대기열 제한 / 라우팅)
+        이미 조각을 보냈을 수 있으므로 연결이 끊겨도 재시도하지 않음 (ModelWorkerError)
+        """
+        timing = self._admit()
+        submitted_at = time.perf_counter()
+        try:
+            worker = self.route(key)
+            conn = await worker.acquire()
+            started_at = time.perf_counter()
+            timing.update(queued_ms=round((started_at - submitted_at) * 1000, 2), worker=worker.index)
+            worker.inflight += 1
+            response = None
+            try:
+                conn[1].write(_encode({"method": method, "kwargs": kwargs}))
+                await conn[1].drain()
+                while True:
+                    frame = await asyncio.wait_for(_read_frame(conn[0]), self.request_timeout)
+                    if "chunk" not in frame:
+                        response = frame
+                        break
+                    yield frame["chunk"]
+            except asyncio.TimeoutError:
+                raise ModelWorkerError(f"worker {worker.index} 응답 시간 초과 ({self.request_timeout}s)")
+            except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+                worker.healthy = False
+                log.warning("[ModelPool] worker %s 연결 끊김 (%s: %s)", worker.index, type(e).__name__, e)
+                raise ModelWorkerError(f"worker {worker.index} 연결이 끊겼습니다.") from e
+            finally:
+                # 끝까지 읽지 못한 연결은 (중간에 그만 읽은 경우 포함) 버림
+                worker.release(conn if response is not None else _close(conn))
+                worker.inflight -= 1
+                timing["run_ms"] = round((time.perf_counter() - started_at) * 1000, 2)
+            worker.completed += 1
+            if "error" in response:
+                raise ModelWorkerError(response["error"])
+        finally:
+            self._finish(timing)
+
+    def _admit(self):
+        """대기 + 실행 중인 요청이 capacity + max_queue 를 넘으면 InferenceQueueFull → timing dict"""
+        if self._pending >= self.capacity + self.max_queue:
+            self._rejected += 1
+            raise InferenceQueueFull(f"모델 worker 대기열이 가득 찼습니다. (pending={self._pending}, queue_size={self.max_queue})")
+        self._pending += 1
+        self._job_seq += 1
+        return {"job_id": self._job_seq, "queued_ms": None, "run_ms": None, "worker": None}
+
+    def _finish(self, timing):
+        self._pending -= 1
+        self._completed += 1
+        self.recent_jobs.append(dict(timing))
+
+    # ============================
+    # health check
+    # ============================
+    async def _ping(self, worker):
+        reader, writer = await asyncio.open_unix_connection(worker.path)
+        try:
+            writer.write(_encode({"method": "ping"}))
+            await writer.drain()
+            return (await _read_frame(reader))["result"]
+        finally:
+            writer.close()
+
+    async def check(self):
+        if self.processes is not None:
+            await asyncio.to_thread(self.processes.check)
+        for worker in self._workers:
+            if self.processes is not None and not self.processes.alive(worker.index):
+                worker.healthy = False
+                continue
+            try:
+                info = await asyncio.wait_for(self._ping(worker), self.ping_timeout)
+            except (OSError, ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError):
+                worker.failures += 1
+                if worker.healthy and worker.failures >= 2:
+                    worker.healthy = False
+                    log.warning("[ModelPool] worker %s ping 실패 → 라우팅에서 제외", worker.index)
+                # 한 번이라도 응답했던 프로세스만 (모델 로드 중인 새 프로세스는 기다림)
+                hung = worker.pid == self.processes.pid(worker.index) if self.processes is not None else False
+                if hung and worker.failures >= self.max_ping_failures:
+                    await asyncio.to_thread(self.processes.restart, worker.index)
+                    worker.failures = 0
+                continue
+            if not worker.healthy:
+                log.info("[ModelPool] worker %s 복구 (pid %s)", worker.index, info["pid"])
+            worker.update(info)
+
+    async def run(self):
+        while True:
+            try:
+                await self.check()
+            except Exception:
+                log.exception("[ModelPool] health check 실패")
+            await asyncio.sleep(self.health_interval)
+
+    def start_health_checks(self):
+        """이벤트 루프 안에서 호출 (앱 startup)"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.processes is not None:
+            await asyncio.to_thread(self.processes.stop)
+
+    def stats(self):
+        jobs = [j for j in list(self.recent_jobs) if j["run_ms"] is not None]
+        return {
+            "workers": [
+                {
+                    "index": w.index,
+                    "pid": w.pid,
+                    "healthy": w.healthy,
+                    "inflight": w.inflight,
+                    "completed": w.completed,
+                    "restarts": self.processes.restarts[w.index] if self.processes is not None else None,
+                }
+                for w in self._workers
+            ],
+            "concurrency": self.concurrency,
+            "capacity": self.capacity,
+            "queue_size": self.max_queue,
+            "pending": self._pending,
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "retried": self._retried,
+            "avg_queued_ms": round(sum(j["queued_ms"] for j in jobs) / len(jobs), 2) if jobs else None,
+            "avg_run_ms": round(sum(j["run_ms"] for j in jobs) / len(jobs), 2) if jobs else None,
+        }
+
+
+def processes_from_env(module, concurrency=1):
+    """MODEL_WORKERS / MODEL_WORKER_CONCURRENCY (기본 concurrency) 로 WorkerProcesses 생성 (0 이면 None)"""
+    workers = int(os.environ.get("MODEL_WORKERS", 0))
+    if workers <= 0 or os.environ.get(WORKER_ENV):
+        return None
+    return WorkerProcesses(module, workers, concurrency=int(os.environ.get("MODEL_WORKER_CONCURRENCY", concurrency)))
+
+
+def from_env(module, max_queue=8, concurrency=1):
+    """
+    MODEL_WORKERS > 0 이면 풀 생성 (아니면 None → 기존처럼 API 프로세스 안에서 추론, worker 프로세스 안에서도 None)
+    MODEL_POOL_DIR 가 있으면 worker 를 띄우지 않고 그 디렉터리의 worker-N.sock 에 연결만 함
+    """
+    workers = int(os.environ.get("MODEL_WORKERS", 0))
+    if workers <= 0 or os.environ.get(WORKER_ENV):
+        return None
+    socket_dir = os.environ.get("MODEL_POOL_DIR")
+    processes = None if socket_dir else processes_from_env(module, concurrency)
+    return ModelWorkerPool(
+        socket_paths(socket_dir, workers) if socket_dir else processes.paths,
+        concurrency=int(os.environ.get("MODEL_WORKER_CONCURRENCY", concurrency)),
+        max_queue=max_queue,
+        request_timeout=float(os.environ.get("MODEL_WORKER_TIMEOUT", 120)),
+        start_timeout=float(os.environ.get("MODEL_WORKER_START_TIMEOUT", 600)),
+        health_interval=float(os.environ.get("MODEL_WORKER_HEALTH_INTERVAL", 1.0)),
+        processes=processes,
+    )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="모델 worker 하나(--socket) 또는 worker 풀 감시 프로세스(--workers)")
+    parser.add_argument("--module", required=True, help="get_next_action (또는 WORKER_METHODS) 을 가진 모듈 이름")
+    parser.add_argument("--socket", help="worker 하나: 이 Unix socket 에서 요청 처리")
+    parser.add_argument("--workers", type=int, help="풀: worker 개수 (--socket-dir 에 worker-N.sock, API 는 MODEL_POOL_DIR 로 연결)")
+    parser.add_argument("--socket-dir", help="풀: socket 디렉터리 (기본 임시 디렉터리)")
+    parser.add_argument("--concurrency", type=int, default=1, help="worker 하나가 동시에 실행할 모델 호출 수")
+    parser.add_argument("--parent-pid", type=int, help="이 프로세스가 죽으면 같이 종료")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    from log_config import setup_logging
+    setup_logging()
+
+    if args.socket:
+        serve(args.module, args.socket, args.concurrency, args.parent_pid)
+        return
+    if not args.workers:
+        sys.exit("--socket 또는 --workers 가 필요합니다.")
+
+    processes = WorkerProcesses(args.module, args.workers, socket_dir=args.socket_dir, concurrency=args.concurrency)
+    processes.start(timeout=float(os.environ.get("MODEL_WORKER_START_TIMEOUT", 600)))
+    print(f"MODEL_POOL_DIR={processes.socket_dir} MODEL_WORKERS={args.workers}", flush=True)
+    signal.signal(signal.SIGTERM, lambda *_: processes._stop.set())  # supervise() 를 빠져나와 worker 정리
+    try:
+        processes.supervise()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        processes.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Observation Encoder
+ui_state(사이드바 트리 + current_page.form_fields)를 모델 프롬프트용 짧은 텍스트로 변환
+
+출력 예시:
+    url: https://ndrims.dongguk.edu/main/main.clx
+    page: 희망강의신청
+    menu:
+    > 학적/확인서 (+3)
+    v 수강신청
+     > 희망강의신청 *
+    fields: 조직분류=학부(서울)
+
+- "v" 펼쳐진 메뉴, ">" 접힌 메뉴, "*" 체크(선택)된 메뉴, "(+N)" 생략된 하위 메뉴 수
+- 접힌 메뉴의 하위 트리는 생략 (단, 체크된 메뉴까지의 경로는 유지)
+- 같은 입력이면 항상 같은 텍스트 (dict 순서 외에 다른 상태 없음)
+"""
+import json
+import re
+
+_WORD_RE = re.compile(r"[A-Za-z0-9]+|[^\sA-Za-z0-9]")
+
+
+def count_tokens(text, tokenizer=None):
+    """tokenizer 가 있으면 정확히, 없으면 대략 추정 (영숫자 4글자당 1토큰, 그 외 문자는 1글자당 1토큰)"""
+    if tokenizer is not None:
+        return len(tokenizer(text, add_special_tokens=False)["input_ids"])
+    total = 0
+    for piece in _WORD_RE.findall(text):
+        total += max(1, (len(piece) + 3) // 4) if piece[0].isascii() and piece[0].isalnum() else 1
+    return total
+
+
+class EncodedObservation:
+    """
+    encode_ui_state 결과
+    token_count / raw_token_count 는 처음 읽을 때 계산 (디버그 로그 / 비교용이라 /state 마다 원본을 다시 직렬화하지 않도록)
+    """
+    __slots__ = ("text", "nodes", "elided", "_ui_state", "_tokenizer", "_token_count", "_raw_token_count")
+
+    def __init__(self, text, nodes, elided, ui_state, tokenizer=None):
+        self.text = text
+        self.nodes = nodes
+        self.elided = elided
+        self._ui_state = ui_state
+        self._tokenizer = tokenizer
+        self._token_count = None
+        self._raw_token_count = None
+
+    @property
+    def token_count(self):
+        if self._token_count is None:
+            self._token_count = count_tokens(self.text, self._tokenizer)
+        return self._token_count
+
+    @property
+    def raw_token_count(self):
+        """원본 ui_state 를 JSON 으로 그대로 보냈을 때의 토큰 수"""
+        if self._raw_token_count is None:
+            self._raw_token_count = count_tokens(json.dumps(self._ui_state, ensure_ascii=False), self._tokenizer)
+        return self._raw_token_count
+
+
+def _has_checked(item):
+    return bool(item.get("checked")) or any(_has_checked(sub) for sub in item.get("sub_items") or [])
+
+
+def _count_nodes(items):
+    return sum(1 + _count_nodes(item.get("sub_items") or []) for item in items or [])
+
+
+def _encode_items(items, depth, lines, counters, prune_collapsed, max_depth):
+    for item in items or []:
+        subs = item.get("sub_items") or []
+        expanded = bool(item.get("expanded"))
+        marker = "v" if expanded else ">"
+        line = " " * depth + marker + " " + str(item.get("label", ""))
+        if item.get("checked"):
+            line += " *"
+
+        # 접혀 있거나 max_depth 를 넘으면 하위 메뉴 생략, 체크된 경로만 남김
+        prune = (prune_collapsed and not expanded) or (max_depth is not None and depth + 1 > max_depth)
+        visible = [sub for sub in subs if _has_checked(sub)] if prune else subs
+        elided = _count_nodes(subs) - _count_nodes(visible)
+        if elided:
+            line += f" (+{elided})"
+            counters["elided"] += elided
+
+        lines.append(line)
+        counters["nodes"] += 1
+        _encode_items(visible, depth + 1, lines, counters, prune_collapsed, max_depth)
+
+
+def encode_ui_state(ui_state, prune_collapsed=True, max_depth=None, include_form_fields=True,
+                    max_form_fields=20, tokenizer=None):
+    """
+    Args:
+        prune_collapsed: 접힌 메뉴의 하위 트리 생략
+        max_depth: 이 깊이보다 깊은 메뉴는 생략 (None 이면 제한 없음)
+        include_form_fields: current_page.form_fields 포함 여부
+        tokenizer: 있으면 정확한 토큰 수 계산
+    Returns:
+        EncodedObservation(text, token_count, raw_token_count, nodes, elided)
+    """
+    ui_state = ui_state or {}
+    lines = []
+    counters = {"nodes": 0, "elided": 0}
+
+    if ui_state.get("url"):
+        lines.append(f"url: {ui_state['url']}")
+    current_page = ui_state.get("current_page") or {}
+    if current_page.get("title"):
+        lines.append(f"page: {current_page['title']}")
+
+    sidebar = ui_state.get("sidebar") or []
+    if sidebar:
+        lines.append("menu:")
+        _encode_items(sidebar, 0, lines, counters, prune_collapsed, max_depth)
+
+    fields = current_page.get("form_fields") or []
+    if include_form_fields and fields:
+        parts = [
+            f"{field.get('label') or field.get('id')}={field.get('value', '')}"
+            for field in fields[:max_form_fields]
+        ]
+        if len(fields) > max_form_fields:
+            parts.append(f"...(+{len(fields) - max_form_fields})")
+        lines.append("fields: " + "; ".join(parts))
+
+    # 알 수 없는 나머지 키는 compact JSON 으로 붙임
+    extra = {k: v for k, v in ui_state.items() if k not in ("url", "sidebar", "current_page")}
+    if extra:
+        lines.append("extra: " + json.dumps(extra, ensure_ascii=False, separators=(",", ":"), sort_keys=True))
+
+    return EncodedObservation(
+        text="\n".join(lines),
+        nodes=counters["nodes"],
+        elided=counters["elided"],
+        ui_state=ui_state,
+        tokenizer=tokenizer,
+    )
+
+
+def encode_state_for_prompt(state, **options):
+    """
+    /state 로 들어온 state dict 를 프롬프트용 텍스트로 변환
+    ui_state 가 있거나 state 자체가 ui_state 모양이면 encode_ui_state, 아니면 compact JSON
+    """
+    if isinstance(state, dict):
+        if isinstance(state.get("ui_state"), dict):
+            return encode_ui_state(state["ui_state"], **options).text
+        if "sidebar" in state or "current_page" in state:
+            return encode_ui_state(state, **options).text
+    return json.dumps(state, ensure_ascii=False, separators=(",", ":"), sort_keys=True, default=str)
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Plan Cache
+자주 반복되는 프롬프트("학적부 조회", "성적 확인" ...)는 같은 nDRIMS 화면에서 같은 클릭을 만들어내므로
+(정규화된 프롬프트, step 번호, UI 상태 지문) → 다음 액션 을 캐시해서 모델 호출을 건너뜀
+
+- UI 상태 지문: url + 사이드바 label/expanded/checked + current_page.title
+- TTL + LRU 제거, 검증 실패 시 해당 프롬프트 항목 무효화
+- hit / miss 카운터
+"""
+import copy
+import hashlib
+import json
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+
+
+def normalize_prompt(text):
+    text = unicodedata.normalize("NFKC", text or "")
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def _sidebar_signature(items):
+    return [
+        [item.get("label"), bool(item.get("expanded")), bool(item.get("checked")),
+         _sidebar_signature(item.get("sub_items") or [])]
+        for item in items or []
+    ]
+
+
+def ui_fingerprint(ui_state):
+    """액션 결정에 영향을 주는 UI 상태만 뽑아서 해시"""
+    if not ui_state:
+        return "-"
+    signature = {
+        "url": ui_state.get("url"),
+        "sidebar": _sidebar_signature(ui_state.get("sidebar")),
+        "title": (ui_state.get("current_page") or {}).get("title"),
+    }
+    raw = json.dumps(signature, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class PlanCache:
+    def __init__(self, max_entries=512, ttl_seconds=3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (expires_at, generated_action)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(prompt_text, step, ui_state, is_first_request):
+        """
+        step: 이번 테스크에서 몇 번째 액션인지 (같은 화면에서 같은 액션이 반복되는 루프 방지)
+        첫 요청은 모델에 observations 를 안 넘기므로 UI 상태와 상관없이 같은 키
+        """
+        return (normalize_prompt(prompt_text), step, "first" if is_first_request else ui_fingerprint(ui_state))
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return copy.deepcopy(entry[1])
+
+    def put(self, key, generated_action):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, copy.deepcopy(generated_action))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate_prompts(self, prompts):
+        """해당 (정규화된) 프롬프트의 항목을 모두 제거"""
+        prompts = set(prompts)
+        stale = [key for key in self._entries if key[0] in prompts]
+        for key in stale:
+            del self._entries[key]
+        self.invalidations += len(stale)
+        return len(stale)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / total, 4) if total else None,
+        }
@@ -2,11 +2,12 @@ import requests
 import time
 
 COMMAND_URL = "http://127.0.0.1:8000/command"
+LONG_POLL_SECONDS = 25  # 서버가 명령이 생길 때까지 최대 이만큼 응답을 보류 (0 이면 기존 5초 폴링)
 
 def poll_command():
     while True:
         try:
-            resp = requests.get(COMMAND_URL, timeout=5)
+            resp = requests.get(COMMAND_URL, params={"wait": LONG_POLL_SECONDS}, timeout=LONG_POLL_SECONDS + 5)
             if resp.status_code == 200:
                 data = resp.json()
                 if data.get("has_task"):
@@ -29,7 +30,10 @@ def poll_command():
                 print(f"Error: Received status code {resp.status_code} - {resp.text}")
         except Exception as e:
             print(f"Exception occurred: {e}")
-        time.sleep(5)
+            time.sleep(5)
+            continue
+        if not LONG_POLL_SECONDS:
+            time.sleep(5)
 
 if __name__ == "__main__":
     poll_command()
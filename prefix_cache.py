@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Prefix KV-Cache
+한 테스크 안에서 step 마다 반복되는 앞부분(시스템 문구 + 사용자 프롬프트)의
+KV-cache 를 재사용해서, 다음 step 에서는 새 observation 토큰만 prefill 하도록 함
+
+- 키: prefix 토큰 ID 를 해시한 값 (같은 prefix 면 세션이 달라도 공유)
+- LRU + 개수 / 메모리(바이트) 상한
+"""
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def _iter_tensors(past):
+    """past_key_values 안의 텐서들 (DynamicCache / 구버전 tuple 형식 모두)"""
+    layers = getattr(past, "layers", None)
+    if layers is not None:
+        for layer in layers:
+            for name in ("keys", "values"):
+                t = getattr(layer, name, None)
+                if t is not None:
+                    yield t
+        return
+    if hasattr(past, "key_cache"):
+        yield from past.key_cache
+        yield from past.value_cache
+        return
+    for layer in past:
+        yield from layer
+
+
+def cache_nbytes(past):
+    return sum(t.numel() * t.element_size() for t in _iter_tensors(past))
+
+
+class PrefixKVCache:
+    def __init__(self, max_entries=16, max_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (past_key_values, nbytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key_for(token_ids):
+        return hashlib.sha1(",".join(map(str, token_ids)).encode("ascii")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, past):
+        nbytes = cache_nbytes(past)
+        if nbytes > self.max_bytes:
+            return  # 혼자서 상한을 넘으면 저장하지 않음
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (past, nbytes)
+            self._bytes += nbytes
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self._bytes -= evicted_bytes
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else None,
+            }
+
+
+def prefill_prefix(model, tokenizer, cache, prefix, suffix):
+    """
+    (prefix + suffix 전체 input_ids, prefix 의 KV-cache) 반환
+    KV-cache 는 cache 와 공유하는 객체이므로 이어서 생성할 때는 복사본을 써야 함
+    """
+    import torch
+
+    device = model.device
+    prefix_ids = tokenizer(prefix, return_tensors="pt").input_ids.to(device)
+    suffix_ids = tokenizer(suffix, add_special_tokens=False, return_tensors="pt").input_ids.to(device)
+
+    key = cache.key_for(prefix_ids[0].tolist())
+    past = cache.get(key)
+    if past is None:
+        with torch.no_grad():
+            past = model(prefix_ids, use_cache=True).past_key_values
+        cache.put(key, past)
+    return torch.cat([prefix_ids, suffix_ids], dim=1), past
+
+
+def generate_with_prefix_cache(model, tokenizer, cache, prefix, suffix,
+                               max_new_tokens=256, temperature=0.7, top_p=0.95, stop_at_json=False,
+                               constrain_action=False):
+    """
+    prefix 의 KV-cache 를 cache 에서 꺼내(없으면 만들어 저장) suffix 부분만 prefill 하고 생성
+
+    prefix 는 줄바꿈 등으로 끝나게 잘라야 토큰 경계가 어긋나지 않음
+    stop_at_json=True 면 첫 JSON 객체가 닫히는 즉시 생성 종료
+    constrain_action=True 면 action_grammar 로 액션 JSON 스키마에 맞는 토큰만 생성
+    """
+    import torch
+    from generation_utils import GenerationTimer, json_stopping_criteria
+
+    timer = GenerationTimer("prefix_cache")
+    input_ids, past = prefill_prefix(model, tokenizer, cache, prefix, suffix)
+    do_sample = temperature > 0
+    gen_kwargs = {"temperature": temperature, "top_p": top_p} if do_sample else {}
+    if stop_at_json:
+        gen_kwargs["stopping_criteria"] = json_stopping_criteria(tokenizer, input_ids.shape[1])
+    if constrain_action:
+        from action_grammar import make_action_logits_processor
+        gen_kwargs["logits_processor"] = make_action_logits_processor(tokenizer, input_ids.shape[1])
+    timer.attach(gen_kwargs)
+    with torch.no_grad():
+        output = model.generate(
+            input_ids=input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            past_key_values=copy.deepcopy(past),  # generate 가 cache 뒤에 이어 붙이므로 복사본 사용
+            max_new_tokens=max_new_tokens,
+            do_sample=do_sample,
+            pad_token_id=tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id,
+            **gen_kwargs,
+        )
+    timer.finish(output.shape[1] - input_ids.shape[1])
+    return tokenizer.decode(output[0][input_ids.shape[1]:], skip_special_tokens=True)
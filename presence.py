@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+Presence
+실행 웹(execution_web_id)별 연결 상태 레지스트리
+
+기존: 세션마다 execution_web_connected / last_poll_time / browser_count 를 저장하고
+      /execution_web/status 를 호출할 때마다 datetime 으로 8초 경과를 계산
+변경:
+- heartbeat(): /command 폴링마다 O(1) 갱신 (dict 조회 + 숫자 몇 개, datetime 생성 없음)
+- 만료: hashed timing wheel (tick 간격의 슬롯 배열)
+  heartbeat 는 만료 tick 만 늘리고 슬롯은 옮기지 않음 → 슬롯을 처리할 때 아직 살아 있으면 새 슬롯으로 이동 (lazy)
+  → 전체 스캔 없이 tick 마다 그 슬롯에 든 것만 확인
+- long-poll / SSE 로 대기 중인 실행 웹은 폴링이 없어도 연결된 것으로 유지 (poll_started / poll_finished)
+- 연결 수 / 브라우저 실행 중인 실행 웹 수 / 브라우저 수 합계 / 대기 중인 수는 변경될 때마다 증감 (조회 O(1))
+
+store(shared_state 백엔드)가 있으면 실행 웹 상태를 sync_interval 마다 저장해서 다른 worker 에서도 조회
+(worker 마다 받은 폴링만 알고 있으므로 목록 / 세션 상태는 store 기준)
+
+이벤트 루프 스레드에서만 사용
+"""
+import asyncio
+import json
+import logging
+import math
+import time
+from datetime import datetime
+
+log = logging.getLogger(__name__)
+
+
+class ExecutionWeb:
+    __slots__ = ("web_id", "session_id", "browser_running", "browser_count", "active_polls",
+                 "first_seen", "last_seen", "expire_tick", "slot", "published")
+
+    def __init__(self, web_id, session_id):
+        self.web_id = web_id
+        self.session_id = session_id
+        self.browser_running = False
+        self.browser_count = 0
+        self.active_polls = 0
+        self.first_seen = self.last_seen = time.time()
+        self.expire_tick = 0
+        self.slot = None
+        self.published = 0.0
+
+    def to_dict(self):
+        return {
+            "execution_web_id": self.web_id,
+            "session_id": self.session_id,
+            "browser_running": self.browser_running,
+            "browser_count": self.browser_count,
+            "polling": self.active_polls > 0,
+            "first_seen": self.first_seen,
+            "last_seen": self.last_seen,
+        }
+
+
+def _iso(timestamp):
+    return datetime.fromtimestamp(timestamp).isoformat() if timestamp else None
+
+
+class PresenceRegistry:
+    NAMESPACE = "presence"
+
+    def __init__(self, timeout=8.0, tick=0.25, on_expire=None, store=None, sync_interval=1.0, clock=time.monotonic):
+        """
+        Args:
+            timeout: 마지막 폴링 후 이 시간(초)이 지나면 연결 끊김
+            tick: timing wheel 슬롯 간격(초), 만료 시점 오차
+            on_expire: 만료된 ExecutionWeb 을 받는 콜백
+            store: kv_get / kv_put / kv_delete / kv_values 를 가진 공유 백엔드 (여러 worker 일 때)
+        """
+        self.timeout = timeout
+        self.tick = tick
+        self.on_expire = on_expire
+        self.store = store
+        self.sync_interval = sync_interval
+        self._clock = clock
+        self._ticks = max(1, math.ceil(timeout / tick))
+        self._wheel = [set() for _ in range(self._ticks + 1)]  # 만료 tick 이 한 바퀴 안에 들어오도록
+        self._tick = self._now_tick()
+        self._webs = {}          # web_id -> ExecutionWeb
+        self._by_session = {}    # session_id -> {web_id}
+        self._browsers_running = 0
+        self._browser_total = 0
+        self._polling = 0
+        self.expired = 0
+        self._task = None
+
+    def _now_tick(self):
+        return int(self._clock() / self.tick)
+
+    # ============================
+    # 갱신
+    # ============================
+    def heartbeat(self, web_id, session_id, browser_running=False, browser_count=0):
+        web = self._webs.get(web_id)
+        if web is None:
+            web = ExecutionWeb(web_id, session_id)
+            self._webs[web_id] = web
+            self._by_session.setdefault(session_id, set()).add(web_id)
+            changed = True
+        else:
+            web.last_seen = time.time()
+            changed = web.browser_running != browser_running or web.browser_count != browser_count
+            if web.session_id != session_id:  # 같은 실행 웹이 다른 세션으로 로그인
+                self._unlink(web)
+                web.session_id = session_id
+                self._by_session.setdefault(session_id, set()).add(web_id)
+        self._browsers_running += int(browser_running) - int(web.browser_running)
+        self._browser_total += browser_count - web.browser_count
+        web.browser_running = browser_running
+        web.browser_count = browser_count
+        web.expire_tick = self._now_tick() + self._ticks
+        if web.slot is None:
+            self._schedule(web)
+        self._publish(web, force=changed)
+        return web
+
+    def poll_started(self, web_id):
+        web = self._webs.get(web_id)
+        if web is not None:
+            web.active_polls += 1
+            self._polling += web.active_polls == 1
+
+    def poll_finished(self, web_id):
+        web = self._webs.get(web_id)
+        if web is not None and web.active_polls > 0:
+            web.active_polls -= 1
+            self._polling -= web.active_polls == 0
+
+    def remove(self, web_id):
+        """실행 웹이 종료를 알림 → 바로 제거"""
+        web = self._webs.get(web_id)
+        if web is None:
+            return False
+        self._drop(web)
+        if self.store is not None:
+            self.store.kv_delete(self.NAMESPACE, web_id)
+        return True
+
+    def remove_session(self, session_id):
+        removed = 0
+        for web_id in list(self._by_session.get(session_id, ())):
+            removed += self.remove(web_id)
+        if self.store is not None:
+            for entry in self._stored():
+                if entry["session_id"] == session_id:
+                    removed += self.store.kv_delete(self.NAMESPACE, entry["execution_web_id"])
+        return removed
+
+    # ============================
+    # timing wheel
+    # ============================
+    def _schedule(self, web):
+        web.slot = web.expire_tick % len(self._wheel)
+        self._wheel[web.slot].add(web.web_id)
+
+    def advance(self):
+        """현재 시각까지 지난 tick 의 슬롯만 처리 (heartbeat 당 상수 비용)"""
+        now_tick = self._now_tick()
+        if now_tick - self._tick > len(self._wheel):
+            self._tick = now_tick - len(self._wheel)  # 오래 멈춰 있었으면 한 바퀴만 처리
+        while self._tick < now_tick:
+            self._tick += 1
+            slot = self._wheel[self._tick % len(self._wheel)]
+            if not slot:
+                continue
+            for web_id in list(slot):
+                web = self._webs[web_id]
+                if web.active_polls > 0:
+                    # long-poll / SSE 대기 중 → 폴링한 것으로 봄
+                    web.last_seen = time.time()
+                    web.expire_tick = self._tick + self._ticks
+                    self._publish(web)
+                if web.expire_tick > self._tick:
+                    slot.discard(web_id)
+                    self._schedule(web)
+                else:
+                    self._expire(web)
+
+    def _expire(self, web):
+        self._drop(web)
+        self.expired += 1
+        if self.store is not None:
+            # 다른 worker 가 받은 폴링으로 아직 살아 있을 수 있음
+            raw = self.store.kv_get(self.NAMESPACE, web.web_id)
+            if raw is not None and time.time() - json.loads(raw)["last_seen"] > self.timeout:
+                self.store.kv_delete(self.NAMESPACE, web.web_id)
+        log.info("[Presence] 실행 웹 연결 끊김: %s (session: %s)", web.web_id, web.session_id)
+        if self.on_expire is not None:
+            self.on_expire(web)
+
+    def _drop(self, web):
+        if web.slot is not None:
+            self._wheel[web.slot].discard(web.web_id)
+            web.slot = None
+        del self._webs[web.web_id]
+        self._unlink(web)
+        self._browsers_running -= int(web.browser_running)
+        self._browser_total -= web.browser_count
+        self._polling -= web.active_polls > 0
+
+    def _unlink(self, web):
+        web_ids = self._by_session.get(web.session_id)
+        if web_ids is not None:
+            web_ids.discard(web.web_id)
+            if not web_ids:
+                del self._by_session[web.session_id]
+
+    async def run(self):
+        while True:
+            self.advance()
+            await asyncio.sleep(self.tick)
+
+    def start(self):
+        """이벤트 루프 안에서 호출 (앱 startup). 없어도 조회할 때마다 advance() 로 만료 처리"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    # ============================
+    # 공유 store (여러 worker)
+    # ============================
+    def _publish(self, web, force=False):
+        if self.store is None:
+            return
+        now = time.time()
+        if force or now - web.published >= self.sync_interval:
+            web.published = now
+            self.store.kv_put(self.NAMESPACE, web.web_id, json.dumps(web.to_dict(), ensure_ascii=False))
+
+    def _stored(self):
+        """store 에 있는 실행 웹 중 timeout 안에 폴링한 것"""
+        cutoff = time.time() - self.timeout - self.sync_interval
+        return [entry for entry in map(json.loads, self.store.kv_values(self.NAMESPACE)) if entry["last_seen"] >= cutoff]
+
+    # ============================
+    # 조회
+    # ============================
+    def _entries(self, session_id=None):
+        self.advance()
+        if self.store is not None:
+            entries = self._stored()
+            if session_id is not None:
+                entries = [e for e in entries if e["session_id"] == session_id]
+            return entries
+        if session_id is not None:
+            return [self._webs[web_id].to_dict() for web_id in self._by_session.get(session_id, ())]
+        return [web.to_dict() for web in self._webs.values()]
+
+    def session_status(self, session_id):
+        """/execution_web/status 형식 (세션에 붙은 실행 웹들을 합침)"""
+        entries = self._entries(session_id)
+        last_seen = max((e["last_seen"] for e in entries), default=None)
+        return {
+            "connected": bool(entries),
+            "last_poll_time": _iso(last_seen),
+            "browser_running": any(e["browser_running"] for e in entries),
+            "browser_count": sum(e["browser_count"] for e in entries),
+            "execution_webs": len(entries),
+        }
+
+    def connected_sessions(self):
+        """실행 웹이 하나라도 연결된 세션 id 집합"""
+        if self.store is None:
+            self.advance()
+            return set(self._by_session)
+        return {entry["session_id"] for entry in self._entries()}
+
+    def list(self, session_id=None, limit=100, offset=0):
+        entries = sorted(self._entries(session_id), key=lambda e: e["last_seen"], reverse=True)
+        for entry in entries[offset:offset + limit]:
+            yield {**entry, "first_seen": _iso(entry["first_seen"]), "last_seen": _iso(entry["last_seen"])}
+
+    def stats(self):
+        """이 worker 가 받은 폴링 기준 합계 (O(1))"""
+        self.advance()
+        return {
+            "connected": len(self._webs),
+            "sessions": len(self._by_session),
+            "browsers_running": self._browsers_running,
+            "browser_count": self._browser_total,
+            "polling": self._polling,
+            "expired_total": self.expired,
+            "timeout": self.timeout,
+            "tick": self.tick,
+        }
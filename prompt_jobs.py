@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+"""
+Prompt Jobs
+/prompt 를 job 으로 받아 세션별 큐에서 순서대로 실행하는 모듈
+(HTTP 요청을 60초 동안 붙잡고 있거나 두 번째 프롬프트를 409 로 거절하지 않도록)
+
+- submit(session_id, text): job 생성 후 바로 반환, 세션마다 한 번에 하나씩 순서대로 실행
+- runner(job): 실제 테스크 실행 코루틴 (Api.py 에서 주입, 결과 dict 반환)
+- 상태: queued → running → succeeded | failed | timeout | cancelled
+- await wait(job, timeout) / watch(job, version, timeout): 결과 대기 / 상태 변경 구독 (SSE 용)
+- 끝난 job 은 최근 max_jobs 개, ttl 초까지만 보관
+
+이벤트 루프 스레드에서만 사용
+store(shared_state 백엔드)가 있으면 job 상태를 저장해서 다른 worker 에서도 조회 가능 (snapshot / wait_snapshot)
+cancel_session 도 store 에 기록 → 다른 worker 에 대기 중이던 그 세션의 job 은 시작 전에 취소됨
+"""
+import asyncio
+import json
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime
+
+FINISHED = frozenset(("succeeded", "failed", "timeout", "cancelled"))
+
+
+class JobQueueFull(Exception):
+    """세션의 대기 job 이 max_queued 를 넘음 (→ 429)"""
+
+
+class JobTimeout(Exception):
+    """runner 가 테스크 제한 시간을 넘김 (→ status timeout)"""
+
+
+class JobCancelled(Exception):
+    """runner 가 더 이상 실행할 수 없음 (세션 로그아웃 / 삭제 등 → status cancelled)"""
+
+
+def _now():
+    return datetime.now().isoformat(timespec="milliseconds")
+
+
+class PromptJob:
+    def __init__(self, session_id, text):
+        self.job_id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.text = text
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.created_at = _now()
+        self.created_ts = time.time()  # 다른 worker 의 cancel_session 과 비교 (wall clock)
+        self.started_at = None
+        self.finished_at = None
+        self.version = 0
+        self._changed = asyncio.Event()
+        self._finished_mono = None
+        self._on_change = None
+
+    @property
+    def finished(self):
+        return self.status in FINISHED
+
+    def _set(self, status, **fields):
+        self.status = status
+        for name, value in fields.items():
+            setattr(self, name, value)
+        if status in FINISHED:
+            self._finished_mono = time.monotonic()
+        self.version += 1
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+        if self._on_change is not None:
+            self._on_change(self)
+
+    def to_dict(self, position=None):
+        return {
+            "job_id": self.job_id,
+            "session_id": self.session_id,
+            "text": self.text,
+            "status": self.status,
+            "position": position,  # 0: 실행 중, n: 앞에 n-1 개 대기, None: 끝남
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class PromptJobManager:
+    NAMESPACE = "jobs"
+    CANCEL_NAMESPACE = "jobs_cancelled"  # session_id -> 마지막 cancel_session 시각
+
+    def __init__(self, runner, max_queued=20, max_jobs=1000, ttl=3600, store=None):
+        """
+        Args:
+            runner: async runner(job) -> 결과 dict. JobTimeout 이면 timeout, JobCancelled 면 cancelled, 다른 예외면 failed
+            max_queued: 세션당 대기 job 최대 개수
+            max_jobs / ttl: 끝난 job 보관 개수 / 시간(초)
+            store: kv_get / kv_put / kv_delete / kv_values 를 가진 공유 백엔드 (여러 worker 일 때)
+        """
+        self.runner = runner
+        self.store = store
+        self.max_queued = max_queued
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self._jobs = OrderedDict()   # job_id -> PromptJob (생성 순)
+        self._queues = {}            # session_id -> deque[PromptJob] (대기 중)
+        self._running = {}           # session_id -> PromptJob
+        self._workers = {}           # session_id -> asyncio.Task
+
+    # ============================
+    # 제출 / 조회
+    # ============================
+    def submit(self, session_id, text):
+        q = self._queues.setdefault(session_id, deque())
+        if len(q) >= self.max_queued:
+            raise JobQueueFull(f"대기 중인 프롬프트가 너무 많습니다. (max_queued={self.max_queued})")
+        job = PromptJob(session_id, text)
+        job._on_change = self._publish
+        q.append(job)
+        self._jobs[job.job_id] = job
+        self._publish(job)
+        self._evict()
+
+        worker = self._workers.get(session_id)
+        if worker is None or worker.done():
+            self._workers[session_id] = asyncio.get_running_loop().create_task(self._drain(session_id))
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def position(self, job):
+        if job.status == "running":
+            return 0
+        if job.status == "queued":
+            q = self._queues.get(job.session_id) or ()
+            for i, queued in enumerate(q):
+                if queued is job:
+                    return i + 1
+        return None
+
+    def describe(self, job):
+        return job.to_dict(self.position(job))
+
+    def session_jobs(self, session_id, limit=20):
+        if self.store is not None:
+            # 다른 worker 가 받은 job 까지 포함
+            jobs = [json.loads(raw) for raw in self.store.kv_values(self.NAMESPACE)]
+            jobs = [j for j in jobs if j["session_id"] == session_id]
+            jobs.sort(key=lambda j: j["created_at"], reverse=True)
+            return jobs[:limit]
+        jobs = [j for j in reversed(self._jobs.values()) if j.session_id == session_id]
+        return [self.describe(j) for j in jobs[:limit]]
+
+    # ============================
+    # 다른 worker 의 job (store 있을 때)
+    # ============================
+    def _publish(self, job):
+        if self.store is not None:
+            self.store.kv_put(self.NAMESPACE, job.job_id, json.dumps(self.describe(job), ensure_ascii=False))
+
+    def snapshot(self, job_id):
+        """store 에 저장된 job 상태 dict (없으면 None)"""
+        if self.store is None:
+            return None
+        raw = self.store.kv_get(self.NAMESPACE, job_id)
+        return json.loads(raw) if raw is not None else None
+
+    async def wait_snapshot(self, job_id, timeout, interval=0.05, since=None):
+        """
+        다른 worker 의 job 을 폴링: 끝나거나 since 와 달라질 때까지 최대 timeout 초
+        Returns:
+            마지막 snapshot
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        snapshot = self.snapshot(job_id)
+        while snapshot is not None and snapshot["status"] not in FINISHED:
+            if since is not None and snapshot != since:
+                break
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(min(interval, remaining))
+            snapshot = self.snapshot(job_id)
+        return snapshot
+
+    # ============================
+    # 취소
+    # ============================
+    def cancel(self, job_id):
+        """대기 중인 job 만 취소 가능. 취소했으면 True"""
+        job = self._jobs.get(job_id)
+        if job is None or job.status != "queued":
+            return False
+        q = self._queues.get(job.session_id)
+        if q is not None and job in q:
+            q.remove(job)
+        job._set("cancelled", finished_at=_now())
+        return True
+
+    def cancel_session(self, session_id):
+        """
+        세션의 대기 job 전부 취소 (로그아웃 등) → 이 worker 에서 취소한 개수
+        store 가 있으면 취소 시각을 기록 → 다른 worker 의 대기 job 도 지금 이전에 만들어진 것은 시작 전에 취소
+        """
+        if self.store is not None:
+            self._prune_cancellations()
+            self.store.kv_put(self.CANCEL_NAMESPACE, session_id,
+                              json.dumps({"session_id": session_id, "cancelled_at": time.time()}))
+        q = self._queues.pop(session_id, None) or ()
+        for job in q:
+            job._set("cancelled", finished_at=_now())
+        return len(q)
+
+    def is_cancelled(self, job):
+        """job 이 만들어진 뒤 (다른 worker 포함) cancel_session 이 있었으면 True"""
+        if self.store is None:
+            return False
+        raw = self.store.kv_get(self.CANCEL_NAMESPACE, job.session_id)
+        return raw is not None and json.loads(raw)["cancelled_at"] >= job.created_ts
+
+    def _prune_cancellations(self):
+        """ttl 보다 오래된 취소 기록 삭제 (그보다 오래 대기하는 job 은 없다고 봄)"""
+        expire_before = time.time() - self.ttl
+        for raw in self.store.kv_values(self.CANCEL_NAMESPACE):
+            record = json.loads(raw)
+            if record["cancelled_at"] < expire_before:
+                self.store.kv_delete(self.CANCEL_NAMESPACE, record["session_id"])
+
+    # ============================
+    # 대기 / 구독
+    # ============================
+    async def wait(self, job, timeout):
+        """job 이 끝날 때까지 최대 timeout 초 대기. 끝났으면 True"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while not job.finished:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False
+            await self.watch(job, job.version, remaining)
+        return True
+
+    async def watch(self, job, version, timeout):
+        """version 이후 상태가 바뀔 때까지 최대 timeout 초 대기. 바뀌었으면 True"""
+        if job.version != version:
+            return True
+        try:
+            await asyncio.wait_for(job._changed.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    # ============================
+    # 실행
+    # ============================
+    async def _drain(self, session_id):
+        """세션의 job 을 하나씩 순서대로 실행 (큐가 비면 종료)"""
+        while True:
+            q = self._queues.get(session_id)
+            if not q:
+                self._queues.pop(session_id, None)
+                self._workers.pop(session_id, None)
+                return
+            job = q.popleft()
+            if self.is_cancelled(job):  # 다른 worker 에서 로그아웃됨
+                job._set("cancelled", error="세션이 로그아웃되어 취소되었습니다.", finished_at=_now())
+                continue
+            self._running[session_id] = job
+            job._set("running", started_at=_now())
+            try:
+                result = await self.runner(job)
+                job._set("succeeded", result=result, finished_at=_now())
+            except JobTimeout as e:
+                job._set("timeout", error=str(e), finished_at=_now())
+            except JobCancelled as e:
+                job._set("cancelled", error=str(e), finished_at=_now())
+            except asyncio.CancelledError:
+                job._set("cancelled", finished_at=_now())
+                raise
+            except Exception as e:
+                job._set("failed", error=str(e), finished_at=_now())
+            finally:
+                self._running.pop(session_id, None)
+
+    def _evict(self):
+        """끝난 job 중 오래된 것부터 제거"""
+        expire_before = time.monotonic() - self.ttl
+        excess = len(self._jobs) - self.max_jobs
+        for job_id, job in list(self._jobs.items()):
+            if not job.finished:
+                continue
+            if excess > 0 or job._finished_mono < expire_before:
+                del self._jobs[job_id]
+                if self.store is not None:
+                    self.store.kv_delete(self.NAMESPACE, job_id)
+                excess -= 1
+
+    def stats(self):
+        statuses = {}
+        for job in self._jobs.values():
+            statuses[job.status] = statuses.get(job.status, 0) + 1
+        return {
+            "jobs": len(self._jobs),
+            "queued": sum(len(q) for q in self._queues.values()),
+            "running": len(self._running),
+            "by_status": statuses,
+        }
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+Replay
+trace_recorder 로 기록한 (prompt, observations) → generated_action 을 get_next_action 구현에 다시 돌려서
+브라우저 없이 실제 작업 형태로 성능 / 정확도 비교
+
+- step 지연 시간 p50/p95/p99, steps/sec, 출력 토큰/sec, 최대 메모리(RSS, CUDA)
+- 기록된 액션과의 exact match (action JSON 전체) / name match 비율
+- 세션별로 기록된 순서대로 재실행 (step 카운터가 있는 모델도 같은 흐름), --batch-size 면 여러 세션을 묶어서
+  get_next_action_batch 로 실행
+- --compare 로 이전 결과와 비교 (p95 가 --threshold 이상 느려지거나 exact match 가 떨어지면 exit 1)
+
+사용 예:
+    python replay.py traces.jsonl --model mock_action_model
+    MODEL_DTYPE=int8 python replay.py traces.jsonl.gz --model action_model_2 --out int8.json --compare fp32.json
+"""
+import argparse
+import importlib
+import json
+import os
+import resource
+import sys
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from loadtest import _git_commit, summarize
+from observation_encoder import count_tokens
+from trace_recorder import read_traces
+
+
+def load_sessions(path, limit=None):
+    """기록을 세션별 step 리스트로 (기록 시각 순)"""
+    sessions = OrderedDict()
+    for i, entry in enumerate(read_traces(path)):
+        if limit is not None and i >= limit:
+            break
+        sessions.setdefault(entry.get("session_id"), []).append(entry)
+    for steps in sessions.values():
+        steps.sort(key=lambda e: e.get("ts") or 0)
+    return sessions
+
+
+def _canonical(value):
+    return json.dumps(value, ensure_ascii=False, sort_keys=True)
+
+
+def _action_of(generated_action):
+    if isinstance(generated_action, dict) and "action" in generated_action:
+        return generated_action["action"]
+    return generated_action
+
+
+def _tokenizer_of(model):
+    tokenizer = getattr(model, "tokenizer", None)
+    if tokenizer is None and hasattr(model, "get_tokenizer"):
+        tokenizer = model.get_tokenizer()
+    return tokenizer
+
+
+def _peak_memory_mb():
+    peak = {"rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}  # Linux: KB
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        peak["cuda_mb"] = round(torch.cuda.max_memory_allocated() / (1024 * 1024), 1)
+    return peak
+
+
+class _Result:
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.latencies = []
+        self.output_tokens = 0
+        self.steps = 0
+        self.exact = 0
+        self.name_match = 0
+        self.errors = 0
+        self.mismatches = []
+
+    def add(self, entry, result, latency_ms):
+        self.steps += 1
+        self.latencies.append(latency_ms)
+        if not isinstance(result, dict) or "error" in result:
+            self.errors += 1
+            return
+        expected = _action_of(entry.get("generated_action"))
+        actual = _action_of(result.get("generated_action"))
+        self.output_tokens += count_tokens(_canonical(actual), self.tokenizer)
+        if _canonical(expected) == _canonical(actual):
+            self.exact += 1
+            return
+        if isinstance(expected, dict) and isinstance(actual, dict) and expected.get("name") == actual.get("name"):
+            self.name_match += 1
+        if len(self.mismatches) < 5:
+            self.mismatches.append({"session_id": entry.get("session_id"), "step": entry.get("step"),
+                                    "expected": expected, "actual": actual})
+
+
+def _request(entry, session_prefix):
+    return {
+        "observations": entry.get("observations"),
+        "prompt_text": entry.get("prompt_text"),
+        "session_id": f"{session_prefix}{entry.get('session_id')}",
+    }
+
+
+def replay(model, sessions, batch_size=1, session_prefix="replay-", max_new_tokens=256):
+    result = _Result(_tokenizer_of(model))
+    started = time.perf_counter()
+
+    if batch_size > 1 and hasattr(model, "get_next_action_batch"):
+        # 세션마다 다음 step 하나씩 모아서 배치 (같은 세션의 step 순서는 유지)
+        cursors = {sid: 0 for sid in sessions}
+        while cursors:
+            batch = []
+            for sid in list(cursors):
+                batch.append(sessions[sid][cursors[sid]])
+                cursors[sid] += 1
+                if cursors[sid] >= len(sessions[sid]):
+                    del cursors[sid]
+                if len(batch) >= batch_size:
+                    break
+            t0 = time.perf_counter()
+            try:
+                outputs = model.get_next_action_batch([_request(e, session_prefix) for e in batch],
+                                                      max_new_tokens=max_new_tokens)
+            except Exception as e:
+                outputs = [{"error": str(e)}] * len(batch)
+            latency = (time.perf_counter() - t0) * 1000
+            for entry, output in zip(batch, outputs):
+                result.add(entry, output, latency)
+    else:
+        for steps in sessions.values():
+            for entry in steps:
+                t0 = time.perf_counter()
+                try:
+                    output = model.get_next_action(**_request(entry, session_prefix), max_new_tokens=max_new_tokens)
+                except Exception as e:
+                    output = {"error": str(e)}
+                result.add(entry, output, (time.perf_counter() - t0) * 1000)
+
+    elapsed = time.perf_counter() - started
+    recorded = [e["latency_ms"] for steps in sessions.values() for e in steps if e.get("latency_ms") is not None]
+    return {
+        "sessions": len(sessions),
+        "steps": result.steps,
+        "elapsed_sec": round(elapsed, 3),
+        "steps_per_sec": round(result.steps / elapsed, 2) if elapsed else None,
+        "output_tokens": result.output_tokens,
+        "tokens_per_sec": round(result.output_tokens / elapsed, 2) if elapsed else None,
+        "token_count": "tokenizer" if result.tokenizer is not None else "estimate",
+        "latency_ms": summarize(result.latencies),
+        "recorded_latency_ms": summarize(recorded),
+        "exact_match": round(result.exact / result.steps, 4) if result.steps else None,
+        "name_match": round((result.exact + result.name_match) / result.steps, 4) if result.steps else None,
+        "errors": result.errors,
+        "mismatches": result.mismatches,
+        "peak_memory": _peak_memory_mb(),
+    }
+
+
+def compare(result, baseline, threshold):
+    """p95 지연 시간이 threshold(%) 이상 늘거나 exact match 가 떨어지면 False"""
+    ok = True
+    print(f"\n{'metric':<16}{'base':>12}{'now':>12}{'diff':>10}")
+    for name, before, after in (
+        ("p95_ms", baseline.get("latency_ms", {}).get("p95"), result["latency_ms"].get("p95")),
+        ("steps_per_sec", baseline.get("steps_per_sec"), result.get("steps_per_sec")),
+        ("tokens_per_sec", baseline.get("tokens_per_sec"), result.get("tokens_per_sec")),
+        ("exact_match", baseline.get("exact_match"), result.get("exact_match")),
+        ("peak_rss_mb", baseline.get("peak_memory", {}).get("rss_mb"), result["peak_memory"].get("rss_mb")),
+    ):
+        if before is None or after is None:
+            continue
+        diff = (after - before) / before * 100 if before else 0.0
+        flag = ""
+        if name == "p95_ms" and diff > threshold:
+            ok, flag = False, "  <-- regression"
+        if name == "exact_match" and after < before:
+            ok, flag = False, "  <-- accuracy drop"
+        print(f"{name:<16}{before:>12.2f}{after:>12.2f}{diff:>9.1f}%{flag}")
+    return ok
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="기록된 /state trace 를 get_next_action 구현에 재실행")
+    parser.add_argument("traces", help="trace_recorder 기록 파일 (.jsonl / .jsonl.gz)")
+    parser.add_argument("--model", default="mock_action_model", help="get_next_action 을 가진 모듈 이름")
+    parser.add_argument("--batch-size", type=int, default=1, help="1 보다 크면 get_next_action_batch 로 묶어서 실행")
+    parser.add_argument("--limit", type=int, help="앞에서부터 이 개수의 step 만")
+    parser.add_argument("--max-new-tokens", type=int, default=256)
+    parser.add_argument("--no-warmup", action="store_true", help="모델의 warm_up() 건너뛰기")
+    parser.add_argument("--out", help="결과 JSON 저장 경로")
+    parser.add_argument("--compare", help="비교할 이전 결과 JSON")
+    parser.add_argument("--threshold", type=float, default=20.0, help="p95 회귀 허용치(%%)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    from log_config import setup_logging
+    setup_logging()
+
+    sessions = load_sessions(args.traces, args.limit)
+    if not sessions:
+        sys.exit(f"기록이 없습니다: {args.traces}")
+
+    model = importlib.import_module(args.model)
+    load_started = time.perf_counter()
+    if hasattr(model, "load"):
+        model.load()
+    if hasattr(model, "warm_up") and not args.no_warmup:
+        model.warm_up()
+    load_ms = round((time.perf_counter() - load_started) * 1000, 1)
+
+    result = {
+        "model": args.model,
+        "traces": os.path.abspath(args.traces),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "config": {
+            "batch_size": args.batch_size,
+            "limit": args.limit,
+            "max_new_tokens": args.max_new_tokens,
+            "model_dtype": os.environ.get("MODEL_DTYPE"),
+        },
+        "load_ms": load_ms,
+        **replay(model, sessions, batch_size=args.batch_size, max_new_tokens=args.max_new_tokens),
+    }
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if not compare(result, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Session Registry
+Api.py 의 전역 상태(STUDENT_ID, TASK_TYPE, PROMPT_EVENT ...)를 세션 단위로 분리하기 위한 모듈
+
+- 세션 ID(보통 학번)별로 Session 객체를 하나씩 보관 → 폴링마다 dict 조회 O(1)
+- session_id 를 보내지 않는 기존 클라이언트는 DEFAULT_SESSION_ID 세션을 그대로 사용
+- 여러 worker 로 실행할 때는 shared_state.SharedSessionRegistry (같은 인터페이스, 필드를 공유 백엔드에 저장)
+"""
+from task_state import TaskStateMachine
+from ui_state_patch import UiStateSync
+
+DEFAULT_SESSION_ID = "default"
+
+
+class Session:
+    """실행 웹 하나(= 학생 한 명)의 상태"""
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+
+        # 로그인 정보
+        self.student_id = None
+        self.password = None
+
+        # 테스크 상태 기계 (NONE, LOGIN, STATE, ACTION, SHUTDOWN, VERIFICATION, LOGOUT = 기존 TASK_TYPE 값)
+        # 전이될 때 그 상태를 기다리던 long-poll / /prompt / SSE 만 깨어남
+        self.task = TaskStateMachine()
+        self.prompt_text = None
+
+        # 이번 테스크에서 사용한 plan cache 키 (검증 실패 시 무효화용)
+        self.plan_cache_keys = []
+        # plan 모드: 이번 테스크에서 checkpoint 실패로 다시 계획한 횟수
+        self.plan_replans = 0
+
+        # 진행 중인 테스크의 trace (/prompt 에서 시작, /verification 에서 종료)
+        self.trace_id = None
+
+        # 실행 웹이 마지막으로 보낸 ui_state (+ 버전) → 다음 /state 는 변경분(ui_state_patch)만 보내도 됨
+        self.ui_state = UiStateSync()
+
+        # /state/screenshot 으로 올라왔지만 아직 /state 에 붙지 않은 스크린샷 참조
+        self.pending_screenshot = None
+
+        # verification 결과
+        self.status_success = None
+        self.status_message = None
+
+    @property
+    def is_default(self):
+        return self.session_id == DEFAULT_SESSION_ID
+
+    @property
+    def task_type(self):
+        """기존 TASK_TYPE 정수 값 (읽기 전용, 바꿀 때는 session.task.transition)"""
+        return int(self.task.state)
+
+    def transition(self, to, expect=None, **fields):
+        """테스크 상태 전이 + 필드 변경을 한 번에 (공유 백엔드에서는 같은 트랜잭션) → 이전 상태"""
+        previous = self.task.transition(to, expect=expect)
+        for name, value in fields.items():
+            setattr(self, name, value)
+        return previous
+
+
+class SessionRegistry:
+    def __init__(self):
+        self._sessions = {}
+        self.get_or_create(DEFAULT_SESSION_ID)  # 기존 단일 사용자 클라이언트용
+
+    def get(self, session_id):
+        return self._sessions.get(session_id or DEFAULT_SESSION_ID)
+
+    def get_or_create(self, session_id):
+        session_id = session_id or DEFAULT_SESSION_ID
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = Session(session_id)
+            self._sessions[session_id] = session
+        return session
+
+    def remove(self, session_id):
+        # default 세션은 지우지 않고 유지
+        if session_id and session_id != DEFAULT_SESSION_ID:
+            self._sessions.pop(session_id, None)
+
+    def values(self):
+        return list(self._sessions.values())
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
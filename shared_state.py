@@ -0,0 +1,758 @@
+# -*- coding: utf-8 -*-
+"""
+Shared State
+Api.py 를 여러 uvicorn worker(프로세스)로 실행할 때 세션 / 테스크 상태 / 상태 저장소 / job 을 공유하는 백엔드
+
+worker 하나일 때는 기존처럼 프로세스 메모리(SessionRegistry, TaskStateMachine ...)를 그대로 쓰고,
+SHARED_STATE 가 있으면 같은 인터페이스의 Shared* 클래스로 바꿔 끼움
+
+- SqliteBackend (SHARED_STATE=sqlite:///경로): WAL 모드 SQLite 파일 하나, 같은 서버의 worker 끼리 공유 (추가 의존성 없음)
+- RedisBackend  (SHARED_STATE=redis://host:6379/0): 여러 서버에서 공유할 때 (redis 패키지 필요)
+
+- 테스크 상태 전이는 compare-and-set (다른 worker 가 먼저 바꿨으면 다시 읽고 검사) + 같은 트랜잭션에서 필드 변경
+- 전이 / notify 마다 이벤트를 남기고, worker 마다 notifier 가 SHARED_STATE_POLL_MS 간격으로 읽어서
+  그 worker 에서 기다리던 long-poll / SSE / /prompt job 을 깨움 (자기 worker 의 이벤트는 이미 깨웠으므로 건너뜀)
+- 세션 필드는 JSON 으로 저장 (datetime 은 {"$datetime": iso})
+- 세션 필드 / 테스크 상태 읽기는 이벤트 루프 한 step 동안 캐시 (요청 처리 중 여러 번 읽어도 백엔드 조회는 한 번)
+- 로그인 비밀번호는 세션 필드로 저장하지 않고 kv 에 잠깐 두었다가 실행 웹에 전달하면 삭제
+- 부모 프로세스가 worker 를 띄우기 전에 reset_from_env() 로 이전 실행의 세션 / 이벤트 / kv 삭제
+- 세션 / 테스크 상태는 요청 처리 중 동기로 읽고 쓰므로 이벤트 루프에서 백엔드를 기다리는 시간을 제한
+  SHARED_STATE_TIMEOUT_MS (기본 100): SQLite 잠금 대기 (이벤트 루프 스레드만) / Redis 소켓 타임아웃
+  넘으면 backend.errors 예외 → Api.py 에서 503 + Retry-After (WAL checkpoint 는 notifier 스레드에서)
+
+worker 별로 남는 것: 모델 / 추론 대기열, plan cache, trace(/traces), 진행 중인 job 의 실행 (job 결과는 공유)
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+from session_registry import DEFAULT_SESSION_ID, Session
+from task_state import TRANSITIONS, InvalidTransition, SessionGone, TaskStateMachine, TaskType
+from ui_state_patch import UiStateSync
+
+log = logging.getLogger(__name__)
+
+EVENT_RETENTION_SEC = 300  # 이 시간이 지난 이벤트는 삭제 (notifier 는 몇 ms 안에 읽음)
+
+
+def _on_event_loop():
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+# ============================
+# 값 인코딩
+# ============================
+def _default(value):
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    raise TypeError(f"JSON 으로 저장할 수 없는 값: {type(value).__name__}")
+
+
+def _object_hook(obj):
+    if len(obj) == 1 and "$datetime" in obj:
+        return datetime.fromisoformat(obj["$datetime"])
+    return obj
+
+
+def encode(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=_default)
+
+
+def decode(text):
+    return json.loads(text, object_hook=_object_hook)
+
+
+# ============================
+# SQLite 백엔드
+# ============================
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    task_state INTEGER NOT NULL DEFAULT 0,
+    task_version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS session_fields (
+    session_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (session_id, name)
+);
+CREATE TABLE IF NOT EXISTS kv (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE TABLE IF NOT EXISTS events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    origin TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    state INTEGER,
+    version INTEGER NOT NULL
+);
+"""
+
+
+class SqliteBackend:
+    """
+    SQLite 파일 하나 (WAL: 읽기는 쓰기를 막지 않음, synchronous=NORMAL: 커밋마다 fsync 안 함)
+    연결은 스레드마다 하나 (이벤트 루프 스레드 + notifier 가 쓰는 to_thread 스레드)
+    이벤트 루프 스레드의 연결은 잠금을 loop_busy_timeout 초까지만 기다리고 (넘으면 sqlite3.OperationalError),
+    자동 checkpoint 도 하지 않음 (fsync 가 루프를 막지 않도록 notifier 가 checkpoint() 를 호출)
+    """
+
+    errors = (sqlite3.OperationalError,)  # 잠금 대기 시간 초과 등 (→ 503)
+
+    def __init__(self, path, busy_timeout=5.0, loop_busy_timeout=0.1):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.loop_busy_timeout = loop_busy_timeout
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.on_loop = False
+        on_loop = _on_event_loop()
+        if on_loop != self._local.on_loop:  # 같은 스레드에서 나중에 루프를 돌리는 경우 (메인 스레드, 테스트)
+            timeout = self.loop_busy_timeout if on_loop else self.busy_timeout
+            conn.execute(f"PRAGMA busy_timeout = {int(timeout * 1000)}")
+            conn.execute(f"PRAGMA wal_autocheckpoint = {0 if on_loop else 1000}")
+            self._local.on_loop = on_loop
+        return conn
+
+    @contextmanager
+    def _tx(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    # ---------- 세션 ----------
+    def create_session(self, session_id):
+        self._conn().execute("INSERT OR IGNORE INTO sessions (session_id) VALUES (?)", (session_id,))
+
+    def has_session(self, session_id):
+        row = self._conn().execute("SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return row is not None
+
+    def session_ids(self):
+        return [row[0] for row in self._conn().execute("SELECT session_id FROM sessions ORDER BY rowid")]
+
+    def delete_session(self, session_id):
+        with self._tx() as conn:
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM session_fields WHERE session_id = ?", (session_id,))
+
+    def get_task(self, session_id):
+        """(state, version), 세션이 없으면 None"""
+        return self._conn().execute(
+            "SELECT task_state, task_version FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+
+    def compare_and_set_task(self, session_id, current, to, fields, origin):
+        """현재 상태가 current 일 때만 to 로 바꾸고 fields 저장 + 이벤트. 바꿨으면 True"""
+        with self._tx() as conn:
+            updated = conn.execute(
+                "UPDATE sessions SET task_state = ?, task_version = task_version + 1 "
+                "WHERE session_id = ? AND task_state = ?", (to, session_id, current)).rowcount
+            if not updated:
+                return False
+            conn.executemany("INSERT OR REPLACE INTO session_fields (session_id, name, value) VALUES (?, ?, ?)",
+                             [(session_id, name, value) for name, value in fields.items()])
+            self._add_event(conn, origin, session_id, to)
+        return True
+
+    def bump_task(self, session_id, origin):
+        """상태 변화 없는 알림 (version 만 증가)"""
+        with self._tx() as conn:
+            conn.execute("UPDATE sessions SET task_version = task_version + 1 WHERE session_id = ?", (session_id,))
+            self._add_event(conn, origin, session_id, None)
+
+    @staticmethod
+    def _add_event(conn, origin, session_id, state):
+        conn.execute("INSERT INTO events (ts, origin, session_id, state, version) "
+                     "SELECT ?, ?, ?, ?, task_version FROM sessions WHERE session_id = ?",
+                     (time.time(), origin, session_id, state, session_id))
+
+    # ---------- 세션 필드 ----------
+    def get_fields(self, session_id):
+        """세션 필드 전체 {name: value}"""
+        return dict(self._conn().execute("SELECT name, value FROM session_fields WHERE session_id = ?",
+                                         (session_id,)))
+
+    def set_fields(self, session_id, fields):
+        with self._tx() as conn:
+            conn.executemany("INSERT OR REPLACE INTO session_fields (session_id, name, value) VALUES (?, ?, ?)",
+                             [(session_id, name, value) for name, value in fields.items()])
+
+    # ---------- 이벤트 ----------
+    def events_since(self, cursor):
+        """cursor 이후 이벤트 [(origin, session_id, state, version)], 새 cursor. cursor 가 None 이면 지금부터"""
+        conn = self._conn()
+        if cursor is None:
+            return [], conn.execute("SELECT COALESCE(MAX(seq), 0) FROM events").fetchone()[0]
+        rows = conn.execute("SELECT seq, origin, session_id, state, version FROM events WHERE seq > ? ORDER BY seq",
+                            (cursor,)).fetchall()
+        if rows:
+            cursor = rows[-1][0]
+        return [row[1:] for row in rows], cursor
+
+    def prune_events(self, before):
+        self._conn().execute("DELETE FROM events WHERE ts < ?", (before,))
+
+    def checkpoint(self):
+        """WAL 을 DB 파일에 반영 (PASSIVE: 쓰기를 막지 않음). 이벤트 루프 밖에서 호출"""
+        self._conn().execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    # ---------- key-value (상태 저장소 / job) ----------
+    def kv_get(self, namespace, key):
+        row = self._conn().execute("SELECT value FROM kv WHERE namespace = ? AND key = ?",
+                                   (namespace, key)).fetchone()
+        return row[0] if row else None
+
+    def kv_put(self, namespace, key, value):
+        self._conn().execute("INSERT OR REPLACE INTO kv (namespace, key, value) VALUES (?, ?, ?)",
+                             (namespace, key, value))
+
+    def kv_delete(self, namespace, key):
+        return self._conn().execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key)).rowcount > 0
+
+    def kv_values(self, namespace):
+        return [row[0] for row in self._conn().execute("SELECT value FROM kv WHERE namespace = ?", (namespace,))]
+
+    def reset(self):
+        """세션 / 테스크 상태 / 이벤트 / kv 전부 삭제 (worker 를 띄우기 전에 한 번)"""
+        with self._tx() as conn:
+            for table in ("sessions", "session_fields", "kv", "events"):
+                conn.execute(f"DELETE FROM {table}")
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+# ============================
+# Redis 백엔드 (선택)
+# ============================
+# KEYS: task, fields, events / ARGV: current, to, origin, session_id, 필드 이름, 값, ...
+# to 가 빈 문자열이면 상태는 그대로 두고 version 만 증가 (notify)
+_CAS_SCRIPT = """
+if ARGV[2] ~= '' then
+    local current = redis.call('HGET', KEYS[1], 'state')
+    if current ~= ARGV[1] then return 0 end
+    redis.call('HSET', KEYS[1], 'state', ARGV[2])
+end
+local version = redis.call('HINCRBY', KEYS[1], 'version', 1)
+for i = 5, #ARGV, 2 do redis.call('HSET', KEYS[2], ARGV[i], ARGV[i + 1]) end
+redis.call('XADD', KEYS[3], 'MAXLEN', '~', '10000', '*',
+           'origin', ARGV[3], 'session_id', ARGV[4], 'state', ARGV[2], 'version', version)
+return 1
+"""
+
+
+class RedisBackend:
+    """SqliteBackend 와 같은 인터페이스 (세션: hash, 이벤트: stream)"""
+
+    def __init__(self, url, prefix="ndrims:", timeout=0.1):
+        import redis  # 선택 의존성: SHARED_STATE=redis://... 일 때만 필요
+
+        self.errors = (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError)
+        self._redis = redis.Redis.from_url(url, decode_responses=True,
+                                           socket_timeout=timeout, socket_connect_timeout=timeout)
+        self._cas = self._redis.register_script(_CAS_SCRIPT)
+        self.prefix = prefix
+        self._sessions_key = prefix + "sessions"
+        self._events_key = prefix + "events"
+
+    def _task_key(self, session_id):
+        return f"{self.prefix}task:{session_id}"
+
+    def _fields_key(self, session_id):
+        return f"{self.prefix}fields:{session_id}"
+
+    def _kv_key(self, namespace):
+        return f"{self.prefix}kv:{namespace}"
+
+    def create_session(self, session_id):
+        pipe = self._redis.pipeline()
+        pipe.sadd(self._sessions_key, session_id)
+        pipe.hsetnx(self._task_key(session_id), "state", 0)
+        pipe.hsetnx(self._task_key(session_id), "version", 0)
+        pipe.execute()
+
+    def has_session(self, session_id):
+        return bool(self._redis.sismember(self._sessions_key, session_id))
+
+    def session_ids(self):
+        return sorted(self._redis.smembers(self._sessions_key))
+
+    def delete_session(self, session_id):
+        pipe = self._redis.pipeline()
+        pipe.srem(self._sessions_key, session_id)
+        pipe.delete(self._task_key(session_id), self._fields_key(session_id))
+        pipe.execute()
+
+    def get_task(self, session_id):
+        state, version = self._redis.hmget(self._task_key(session_id), "state", "version")
+        if state is None:
+            return None
+        return int(state), int(version or 0)
+
+    def compare_and_set_task(self, session_id, current, to, fields, origin):
+        args = [current, to, origin, session_id]
+        for name, value in fields.items():
+            args += [name, value]
+        keys = [self._task_key(session_id), self._fields_key(session_id), self._events_key]
+        return bool(self._cas(keys=keys, args=args))
+
+    def bump_task(self, session_id, origin):
+        keys = [self._task_key(session_id), self._fields_key(session_id), self._events_key]
+        self._cas(keys=keys, args=["", "", origin, session_id])
+
+    def get_fields(self, session_id):
+        return self._redis.hgetall(self._fields_key(session_id))
+
+    def set_fields(self, session_id, fields):
+        if fields:
+            self._redis.hset(self._fields_key(session_id), mapping=fields)
+
+    def events_since(self, cursor):
+        if cursor is None:
+            last = self._redis.xrevrange(self._events_key, count=1)
+            return [], last[0][0] if last else "0-0"
+        events = []
+        for _, entries in self._redis.xread({self._events_key: cursor}, count=1000) or ():
+            for entry_id, data in entries:
+                cursor = entry_id
+                state = data.get("state")
+                events.append((data.get("origin"), data.get("session_id"), int(state) if state else None,
+                               int(data.get("version", 0))))
+        return events, cursor
+
+    def prune_events(self, before):
+        pass  # XADD MAXLEN 으로 길이 제한
+
+    def checkpoint(self):
+        pass
+
+    def kv_get(self, namespace, key):
+        return self._redis.hget(self._kv_key(namespace), key)
+
+    def kv_put(self, namespace, key, value):
+        self._redis.hset(self._kv_key(namespace), key, value)
+
+    def kv_delete(self, namespace, key):
+        return self._redis.hdel(self._kv_key(namespace), key) > 0
+
+    def kv_values(self, namespace):
+        return self._redis.hvals(self._kv_key(namespace))
+
+    def reset(self):
+        """prefix 아래 키 전부 삭제 (같은 prefix 를 쓰는 다른 서버의 세션도 지워짐)"""
+        keys = list(self._redis.scan_iter(match=self.prefix + "*", count=1000))
+        for start in range(0, len(keys), 1000):
+            self._redis.delete(*keys[start:start + 1000])
+
+    def close(self):
+        self._redis.close()
+
+
+# ============================
+# 공유 세션 / 테스크 상태
+# ============================
+# Session 의 필드 중 worker 끼리 공유하는 것과 기본값 (session_registry.Session.__init__ 과 같게 유지)
+# password 는 여기 넣지 않음 (CREDENTIALS_NAMESPACE 참고)
+SHARED_FIELDS = {
+    "student_id": None,
+    "prompt_text": None,
+    "plan_cache_keys": [],
+    "plan_replans": 0,
+    "trace_id": None,
+    "pending_screenshot": None,
+    "status_success": None,
+    "status_message": None,
+    "ui_state_data": None,
+    "ui_state_version": 0,
+}
+
+# 로그인 비밀번호: /login 에서 kv 에 두었다가 /command 가 실행 웹에 전달하면 (LOGIN → NONE) 삭제
+# 세션 필드처럼 남지 않도록 로그아웃 / 세션 삭제 / 서버 시작 때도 삭제
+CREDENTIALS_NAMESPACE = "credentials"
+
+
+class _StepCache:
+    """
+    이벤트 루프의 한 step (다음 await 로 양보할 때까지) 동안만 유지되는 읽기 캐시
+    요청 전체 동안 캐시하면 추론 / long-poll 을 기다리는 사이 다른 worker 가 바꾼 값을 못 보므로 step 단위로 비움
+    (처음 채울 때 call_soon 으로 비우기를 예약). 이벤트 루프 밖 (to_thread 등) 에서는 캐시하지 않음
+    """
+
+    def __init__(self):
+        self._values = {}
+        self._loop = None
+
+    def get(self, key, load):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return load()
+        if loop is not self._loop:  # 이전 루프에서 예약한 비우기가 실행되지 않았을 수 있음
+            self._values.clear()
+            self._loop = loop
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+        value = load()
+        if not self._values:
+            loop.call_soon(self._values.clear)
+        self._values[key] = value
+        return value
+
+    def peek(self, key):
+        return self._values.get(key)
+
+    def drop(self, key):
+        self._values.pop(key, None)
+
+
+class SharedTaskStateMachine(TaskStateMachine):
+    """state / version 은 백엔드에서 읽고, 전이는 CAS. 대기자(future)는 이 worker 안에만 있음"""
+
+    def __init__(self, shared, session_id):
+        super().__init__()
+        self._shared = shared
+        self._session_id = session_id
+
+    def _row(self):
+        return self._shared.cached_task(self._session_id) or (int(TaskType.NONE), 0)
+
+    @property
+    def state(self):
+        return TaskType(self._row()[0])
+
+    @property
+    def version(self):
+        return self._row()[1]
+
+    def transition(self, to, expect=None, fields=None):
+        to = TaskType(to)
+        encoded = {name: encode(value) for name, value in (fields or {}).items()}
+        while True:
+            row = self._shared.cached_task(self._session_id)
+            if row is None:  # 세션 행이 없으면 CAS 가 계속 실패하므로 다시 시도하지 않음
+                raise SessionGone(self._session_id, to)
+            current = TaskType(row[0])
+            if expect is not None:
+                expected = {expect} if isinstance(expect, int) else set(expect)
+                if current not in expected:
+                    raise InvalidTransition(current, to)
+            if to not in TRANSITIONS[current]:
+                raise InvalidTransition(current, to)
+            changed = self._shared.backend.compare_and_set_task(self._session_id, int(current), int(to), encoded,
+                                                                self._shared.origin)
+            self._shared.reads.drop(("task", self._session_id))
+            if changed:
+                self._shared.update_cached_fields(self._session_id, encoded)
+                self._wake(to)
+                return current
+            # 다른 worker 가 그 사이에 상태를 바꿈 → 다시 읽고 검사
+
+    def notify(self):
+        self._shared.backend.bump_task(self._session_id, self._shared.origin)
+        self._shared.reads.drop(("task", self._session_id))
+        self._wake(None)
+
+    def remote_change(self, state, version):
+        """다른 worker 의 전이 / notify (notifier 에서 호출, 그 변경 이후에 등록한 대기자는 깨우지 않음)"""
+        self._wake(None if state is None else TaskType(state), version)
+
+
+class SharedUiStateSync(UiStateSync):
+    """UiStateSync 의 state / version 을 세션 필드에 저장"""
+
+    def __init__(self, session):
+        self._session = session
+
+    @property
+    def state(self):
+        return self._session.ui_state_data
+
+    @state.setter
+    def state(self, value):
+        self._session.ui_state_data = value
+
+    @property
+    def version(self):
+        return self._session.ui_state_version
+
+    @version.setter
+    def version(self, value):
+        self._session.ui_state_version = value
+
+
+class SharedSession(Session):
+    """Session 과 같은 속성이지만 SHARED_FIELDS (+ password) 는 백엔드에서 읽고 씀"""
+
+    def __init__(self, shared, session_id):
+        object.__setattr__(self, "_shared", shared)
+        object.__setattr__(self, "session_id", session_id)
+        object.__setattr__(self, "task", SharedTaskStateMachine(shared, session_id))
+        object.__setattr__(self, "ui_state", SharedUiStateSync(self))
+
+    def __getattr__(self, name):
+        # 일반 속성에 없을 때만 호출됨
+        if name == "password":
+            raw = self._shared.backend.kv_get(CREDENTIALS_NAMESPACE, self.session_id)
+            return decode(raw) if raw is not None else None
+        if name not in SHARED_FIELDS:
+            raise AttributeError(name)
+        raw = self._shared.cached_fields(self.session_id).get(name)
+        if raw is None:
+            default = SHARED_FIELDS[name]
+            return list(default) if isinstance(default, list) else default
+        return decode(raw)
+
+    def __setattr__(self, name, value):
+        if name == "password":
+            if value is None:
+                self._shared.backend.kv_delete(CREDENTIALS_NAMESPACE, self.session_id)
+            else:
+                self._shared.backend.kv_put(CREDENTIALS_NAMESPACE, self.session_id, encode(value))
+        elif name in SHARED_FIELDS:
+            encoded = {name: encode(value)}
+            fields = self._shared.reads.peek(("fields", self.session_id))
+            if fields is not None and fields.get(name, encode(SHARED_FIELDS[name])) == encoded[name]:
+                return  # 이 step 에서 읽은 값과 같으면 쓰기 트랜잭션 생략
+            self._shared.backend.set_fields(self.session_id, encoded)
+            self._shared.update_cached_fields(self.session_id, encoded)
+        else:
+            object.__setattr__(self, name, value)
+
+    def transition(self, to, expect=None, **fields):
+        return self.task.transition(to, expect=expect, fields=fields)
+
+
+class SharedSessionRegistry:
+    """SessionRegistry 와 같은 인터페이스. 세션 목록은 백엔드, 대기자를 가진 SharedSession 객체는 worker 별로 캐시"""
+
+    def __init__(self, shared):
+        self._shared = shared
+        self._local = {}
+        self.get_or_create(DEFAULT_SESSION_ID)
+
+    def _wrap(self, session_id):
+        session = self._local.get(session_id)
+        if session is None:
+            session = SharedSession(self._shared, session_id)
+            self._local[session_id] = session
+        return session
+
+    def local(self, session_id):
+        """이 worker 에서 사용 중인 세션 객체 (없으면 None, notifier 용)"""
+        return self._local.get(session_id)
+
+    def get(self, session_id):
+        session_id = session_id or DEFAULT_SESSION_ID
+        if self._shared.cached_task(session_id) is None:  # 바로 이어지는 task.state 읽기와 같은 조회
+            self._local.pop(session_id, None)
+            return None
+        return self._wrap(session_id)
+
+    def get_or_create(self, session_id):
+        session_id = session_id or DEFAULT_SESSION_ID
+        if not self._shared.backend.has_session(session_id):  # 폴링마다 쓰기 트랜잭션이 생기지 않도록
+            self._shared.backend.create_session(session_id)
+            self._shared.forget(session_id)
+        return self._wrap(session_id)
+
+    def remove(self, session_id):
+        # default 세션은 지우지 않고 유지
+        if session_id and session_id != DEFAULT_SESSION_ID:
+            self._shared.backend.delete_session(session_id)
+            self._shared.backend.kv_delete(CREDENTIALS_NAMESPACE, session_id)
+            self._shared.forget(session_id)
+            self._local.pop(session_id, None)
+
+    def values(self):
+        return [self._wrap(session_id) for session_id in self._shared.backend.session_ids()]
+
+    def __len__(self):
+        return len(self._shared.backend.session_ids())
+
+    def __contains__(self, session_id):
+        return self._shared.backend.has_session(session_id)
+
+
+class SharedStateStore:
+    """state_store.MemoryStateStore 와 같은 인터페이스 (백엔드 kv 에 JSON 으로 저장)"""
+
+    NAMESPACE = "state"
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    @staticmethod
+    def _key(session_id, key):
+        return f"{session_id}\x1f{key}"
+
+    def get(self, session_id, key):
+        raw = self.backend.kv_get(self.NAMESPACE, self._key(session_id, key))
+        return decode(raw) if raw is not None else None
+
+    def put(self, session_id, key, value):
+        self.backend.kv_put(self.NAMESPACE, self._key(session_id, key), encode(value))
+
+    def delete(self, session_id, key):
+        return self.backend.kv_delete(self.NAMESPACE, self._key(session_id, key))
+
+    def exists(self, session_id, key):
+        return self.backend.kv_get(self.NAMESPACE, self._key(session_id, key)) is not None
+
+    def location(self, session_id, key):
+        return None
+
+    def close(self):
+        pass
+
+
+# ============================
+# worker 하나의 공유 상태 + notifier
+# ============================
+class SharedState:
+    def __init__(self, backend, poll_interval=0.01):
+        self.backend = backend
+        self.poll_interval = poll_interval
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"  # 이 worker 의 이벤트 구분용
+        self.reads = _StepCache()
+        self.sessions = SharedSessionRegistry(self)
+        self._task = None
+
+    def state_store(self):
+        return SharedStateStore(self.backend)
+
+    # ---------- 읽기 캐시 ----------
+    def cached_task(self, session_id):
+        """(state, version), 세션이 없으면 None (이 step 안에서는 한 번만 조회)"""
+        return self.reads.get(("task", session_id), lambda: self.backend.get_task(session_id))
+
+    def cached_fields(self, session_id):
+        """세션 필드 전체 {name: 인코딩된 값} (이 step 안에서는 한 번만 조회)"""
+        return self.reads.get(("fields", session_id), lambda: self.backend.get_fields(session_id))
+
+    def update_cached_fields(self, session_id, encoded):
+        """이 worker 가 쓴 필드를 캐시에도 반영 (같은 step 에서 다시 읽을 때 쓴 값이 보이도록)"""
+        fields = self.reads.peek(("fields", session_id))
+        if fields is not None:
+            fields.update(encoded)
+
+    def forget(self, session_id):
+        self.reads.drop(("task", session_id))
+        self.reads.drop(("fields", session_id))
+
+    def start(self):
+        """이벤트 루프 안에서 호출 (앱 startup)"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._notify_loop())
+
+    async def _notify_loop(self):
+        _, cursor = await asyncio.to_thread(self.backend.events_since, None)
+        next_prune = time.monotonic() + 60
+        next_checkpoint = time.monotonic() + 1
+        while True:
+            try:
+                events, cursor = await asyncio.to_thread(self.backend.events_since, cursor)
+                for origin, session_id, state, version in events:
+                    if origin == self.origin:
+                        continue
+                    session = self.sessions.local(session_id)
+                    if session is not None:
+                        session.task.remote_change(state, version)
+                if time.monotonic() >= next_checkpoint:
+                    next_checkpoint = time.monotonic() + 1
+                    await asyncio.to_thread(self.backend.checkpoint)
+                if time.monotonic() >= next_prune:
+                    next_prune = time.monotonic() + 60
+                    await asyncio.to_thread(self.backend.prune_events, time.time() - EVENT_RETENTION_SEC)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("[SharedState] 이벤트 읽기 실패")
+                await asyncio.sleep(1)
+            await asyncio.sleep(self.poll_interval)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.backend.close()
+
+
+def _backend_from_url(url):
+    timeout = float(os.environ.get("SHARED_STATE_TIMEOUT_MS", 100)) / 1000
+    if url.startswith("sqlite:///"):
+        return SqliteBackend(url[len("sqlite:///"):], loop_busy_timeout=timeout)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(url, prefix=os.environ.get("SHARED_STATE_PREFIX", "ndrims:"), timeout=timeout)
+    raise ValueError(f"지원하지 않는 SHARED_STATE: {url} (sqlite:///경로 또는 redis://...)")
+
+
+def from_env():
+    """SHARED_STATE=sqlite:///경로 | redis://... 이면 SharedState, 없으면 None (프로세스 메모리 사용)"""
+    url = os.environ.get("SHARED_STATE")
+    if not url:
+        return None
+    poll_interval = float(os.environ.get("SHARED_STATE_POLL_MS", 10)) / 1000
+    backend = _backend_from_url(url)
+    log.info("[SharedState] %s 사용 (worker %s)", type(backend).__name__, os.getpid())
+    return SharedState(backend, poll_interval=poll_interval)
+
+
+def reset_from_env():
+    """
+    서버 (부모 프로세스) 시작 때 이전 실행에서 남은 세션 / 테스크 상태 / 이벤트 / job / 비밀번호 삭제
+    남겨두면 이전 실행의 STATE / ACTION 테스크가 새 실행 웹에 다시 전달됨
+    SHARED_STATE_RESET (기본: sqlite 는 1, redis 는 여러 서버가 같이 쓸 수 있으므로 0). 삭제했으면 True
+    """
+    url = os.environ.get("SHARED_STATE")
+    if not url:
+        return False
+    default = "1" if url.startswith("sqlite:///") else "0"
+    if os.environ.get("SHARED_STATE_RESET", default).lower() not in ("1", "true", "yes"):
+        return False
+    backend = _backend_from_url(url)
+    try:
+        backend.reset()
+    finally:
+        backend.close()
+    log.info("[SharedState] 이전 실행의 공유 상태 삭제 (%s)", url)
+    return True
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+Speculative Decoding
+액션 JSON 은 짧고 반복적이라서 ({"name": "click", "args": {"selector": "role=treeitem[name='...']"}})
+앞으로 나올 토큰을 싸게 추측(draft)하고 본 모델 forward 한 번으로 여러 토큰을 한꺼번에 검증
+
+- NgramDrafter: 프롬프트(사이드바 라벨이 들어 있는 observation 포함) + 이전에 생성한 액션들에서
+  현재 끝 n-gram 과 같은 곳을 찾아 그 뒤 토큰을 draft 로 제안 (prompt lookup)
+- speculative_generate: greedy 전용. draft 를 한 번에 forward 해서 본 모델 argmax 와 일치하는 데까지 채택,
+  불일치 위치에서는 본 모델 토큰을 사용하고 KV-cache 를 잘라냄 → 출력은 일반 greedy 와 동일
+- 작은 draft 모델을 쓰려면 HF generate 의 assistant_model 사용 (draft_model_generate)
+"""
+import threading
+from collections import deque
+
+
+class ActionHistory:
+    """최근 생성된 액션들의 토큰 ID (draft 재료)"""
+
+    def __init__(self, max_items=32):
+        self._items = deque(maxlen=max_items)
+        self._lock = threading.Lock()
+
+    def add(self, token_ids):
+        if token_ids:
+            with self._lock:
+                self._items.append(list(token_ids))
+
+    def snapshot(self):
+        with self._lock:
+            return list(self._items)
+
+
+class SpeculativeStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.tokens = 0
+        self.forward_passes = 0
+        self.drafted = 0
+        self.accepted = 0
+
+    def record(self, num_tokens, stats):
+        with self._lock:
+            self.calls += 1
+            self.tokens += num_tokens
+            self.forward_passes += stats["forward_passes"]
+            self.drafted += stats["drafted"]
+            self.accepted += stats["accepted"]
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "tokens": self.tokens,
+                "forward_passes": self.forward_passes,
+                "drafted": self.drafted,
+                "accepted": self.accepted,
+                "acceptance_rate": round(self.accepted / self.drafted, 4) if self.drafted else None,
+                "tokens_per_forward": round(self.tokens / self.forward_passes, 2) if self.forward_passes else None,
+            }
+
+
+class NgramDrafter:
+    def __init__(self, sources, max_ngram=3, num_draft=8):
+        """
+        Args:
+            sources: draft 를 찾아볼 토큰 ID 시퀀스들 (이전 액션들)
+        """
+        self.max_ngram = max_ngram
+        self.num_draft = num_draft
+        self._index = {}  # n-gram tuple -> (시퀀스, 그 다음 위치), 나중에 본 것이 우선
+        for seq in sources:
+            self._add(seq, 0, len(seq))
+        self._context = None
+        self._context_indexed = 0
+
+    def _add(self, seq, start, end):
+        for i in range(start, end):
+            for n in range(1, self.max_ngram + 1):
+                if i - n + 1 < 0:
+                    break
+                self._index[tuple(seq[i - n + 1:i + 1])] = (seq, i + 1)
+
+    def propose(self, context):
+        """
+        context: 프롬프트 + 지금까지 생성한 토큰 (같은 list 객체에 계속 append 한다고 가정)
+        끝 n-gram(긴 것부터)이 나왔던 곳 뒤의 토큰을 최대 num_draft 개 제안
+        """
+        if context is not self._context:
+            self._context, self._context_indexed = context, 0
+        # 마지막 토큰 위치는 색인하지 않음 (자기 자신과 매칭되면 draft 가 비어버림)
+        if len(context) - 1 > self._context_indexed:
+            self._add(context, self._context_indexed, len(context) - 1)
+            self._context_indexed = len(context) - 1
+
+        for n in range(min(self.max_ngram, len(context)), 0, -1):
+            hit = self._index.get(tuple(context[-n:]))
+            if hit is not None:
+                seq, pos = hit
+                draft = seq[pos:pos + self.num_draft]
+                if draft:
+                    return draft
+        return []
+
+
+def speculative_generate(model, tokenizer, input_ids, max_new_tokens, drafter,
+                         past_key_values=None, past_length=0, stop_at_json=False):
+    """
+    greedy speculative decoding (배치 1)
+
+    Args:
+        input_ids: [1, L] 전체 입력 토큰
+        past_key_values / past_length: input_ids 앞 past_length 토큰의 KV-cache (prefix 캐시, 수정됨)
+        stop_at_json: 첫 JSON 객체가 닫히면 종료
+    Returns:
+        (생성된 토큰 ID list, stats dict)
+    """
+    import torch
+    from generation_utils import GenerationTimer, JsonObjectTracker
+
+    eos_ids = tokenizer.eos_token_id
+    eos_ids = set(eos_ids) if isinstance(eos_ids, (list, tuple)) else {eos_ids}
+    tracker = JsonObjectTracker() if stop_at_json else None
+    context = input_ids[0].tolist()
+    generated = []
+    stats = {"forward_passes": 0, "drafted": 0, "accepted": 0}
+
+    def _forward(ids, past):
+        stats["forward_passes"] += 1
+        with torch.no_grad():
+            out = model(input_ids=ids, past_key_values=past, use_cache=True)
+        return out.logits[0], out.past_key_values
+
+    # prefill (prefix 캐시가 있으면 나머지만)
+    timer = GenerationTimer("speculative")
+    logits, past = _forward(input_ids[:, past_length:], past_key_values)
+    next_token = int(logits[-1].argmax())
+    timer.mark_first_token()
+    cache_length = input_ids.shape[1]
+
+    while True:
+        # next_token 채택
+        generated.append(next_token)
+        context.append(next_token)
+        if next_token in eos_ids or len(generated) >= max_new_tokens:
+            break
+        if tracker is not None and tracker.feed(tokenizer.decode([next_token])):
+            break
+
+        draft = drafter.propose(context)[:max_new_tokens - len(generated)]
+        stats["drafted"] += len(draft)
+        step_ids = torch.tensor([[next_token] + draft], device=input_ids.device)
+        logits, past = _forward(step_ids, past)
+        predicted = logits.argmax(dim=-1).tolist()  # predicted[i] = step_ids[i] 다음에 올 토큰
+
+        accepted = 0
+        stop = False
+        for i, token in enumerate(draft):
+            if token != predicted[i]:
+                break
+            accepted += 1
+            generated.append(token)
+            context.append(token)
+            if token in eos_ids or len(generated) >= max_new_tokens:
+                stop = True
+                break
+            if tracker is not None and tracker.feed(tokenizer.decode([token])):
+                stop = True
+                break
+        stats["accepted"] += accepted
+        if stop:
+            break
+
+        # 채택 안 된 draft 의 KV 를 잘라냄 (next_token + 채택된 draft 까지만 유지)
+        cache_length += 1 + accepted
+        if accepted < len(draft):
+            past.crop(cache_length)
+        next_token = predicted[accepted]
+
+    timer.finish(len(generated))
+    return generated, stats
+
+
+def draft_model_generate(model, tokenizer, assistant_model, input_ids, max_new_tokens, stopping_criteria=None):
+    """작은 draft 모델로 assisted generation (HF generate 의 assistant_model, greedy)"""
+    import torch
+    from generation_utils import GenerationTimer
+
+    timer = GenerationTimer("draft_model")
+    gen_kwargs = timer.attach({"stopping_criteria": stopping_criteria})
+    with torch.no_grad():
+        output = model.generate(
+            input_ids=input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            assistant_model=assistant_model,
+            max_new_tokens=max_new_tokens,
+            do_sample=False,
+            pad_token_id=tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id,
+            **gen_kwargs,
+        )
+    timer.finish(output.shape[1] - input_ids.shape[1])
+    return output[0][input_ids.shape[1]:].tolist()
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+State Store
+state.json / login_state.json 파일 대신 세션별 상태를 보관하는 저장소
+
+- MemoryStateStore: 기본값. 메모리 dict 에만 보관 (요청 처리 중 디스크 I/O 없음)
+- WriteBehindStateStore: 메모리에 먼저 반영하고, 백그라운드 스레드가 모아서 파일로 저장
+  (compact JSON + 임시파일 → os.replace 로 원자적 교체, 재시작 시 파일에서 복구)
+
+STATE_STORE=memory|file, STATE_STORE_DIR=저장 폴더 (file 일 때만)
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class MemoryStateStore:
+    def __init__(self):
+        self._data = {}  # (session_id, key) -> dict
+        self._lock = threading.Lock()
+
+    def get(self, session_id, key):
+        with self._lock:
+            return self._data.get((session_id, key))
+
+    def put(self, session_id, key, value):
+        with self._lock:
+            self._data[(session_id, key)] = value
+
+    def delete(self, session_id, key):
+        with self._lock:
+            return self._data.pop((session_id, key), None) is not None
+
+    def exists(self, session_id, key):
+        with self._lock:
+            return (session_id, key) in self._data
+
+    def location(self, session_id, key):
+        return None
+
+    def close(self):
+        pass
+
+
+class WriteBehindStateStore(MemoryStateStore):
+    def __init__(self, directory, flush_interval=0.5):
+        super().__init__()
+        self.directory = directory
+        self.flush_interval = flush_interval
+        os.makedirs(directory, exist_ok=True)
+        self._dirty = set()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._load()
+        self._thread = threading.Thread(target=self._run, name="state-store-writer", daemon=True)
+        self._thread.start()
+
+    def location(self, session_id, key):
+        safe = re.sub(r"[^0-9A-Za-z_-]", "_", session_id)[:40]
+        digest = hashlib.sha1(session_id.encode("utf-8")).hexdigest()[:8]
+        return os.path.join(self.directory, f"{safe}-{digest}.{key}.json")
+
+    def put(self, session_id, key, value):
+        super().put(session_id, key, value)
+        self._mark_dirty(session_id, key)
+
+    def delete(self, session_id, key):
+        removed = super().delete(session_id, key)
+        self._mark_dirty(session_id, key)
+        return removed
+
+    def _mark_dirty(self, session_id, key):
+        with self._lock:
+            self._dirty.add((session_id, key))
+        self._wakeup.set()
+
+    def _load(self):
+        # 재시작 시 남아있는 파일에서 복구
+        for fname in os.listdir(self.directory):
+            if not fname.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, fname)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    record = json.load(f)
+                self._data[(record["session_id"], record["key"])] = record["value"]
+            except Exception as e:
+                log.warning("[StateStore] %s 복구 실패: %s", fname, e)
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait()
+            # 짧은 시간 동안 들어온 변경은 한 번에 모아서 저장
+            time.sleep(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            snapshot = {k: self._data.get(k) for k in dirty}
+
+        for (session_id, key), value in snapshot.items():
+            path = self.location(session_id, key)
+            try:
+                if value is None:
+                    if os.path.exists(path):
+                        os.remove(path)
+                    continue
+                tmp_path = path + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump({"session_id": session_id, "key": key, "value": value},
+                              f, ensure_ascii=False, separators=(",", ":"))
+                os.replace(tmp_path, path)
+            except Exception as e:
+                log.error("[StateStore] %s 저장 실패: %s", path, e)
+
+    def close(self):
+        self._closed = True
+        self._wakeup.set()
+        self._thread.join(timeout=5)
+        self.flush()
+
+
+def from_env():
+    backend = os.environ.get("STATE_STORE", "memory").lower()
+    if backend == "file":
+        directory = os.environ.get("STATE_STORE_DIR", os.path.join(os.path.dirname(__file__), "state_store"))
+        return WriteBehindStateStore(directory)
+    return MemoryStateStore()
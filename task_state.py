@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Task State
+세션마다 있던 TASK_TYPE 정수(0,1,2,3,4,5,99) + prompt_event / login_event 를 대체하는 테스크 상태 기계
+
+- TaskType: 기존 TASK_TYPE 값을 그대로 쓰는 IntEnum (실행 웹에 보내는 task_type 값은 동일)
+- transition(to, expect=...): 허용된 전이만 적용, expect 와 현재 상태가 다르면 InvalidTransition
+  (다른 요청이 먼저 상태를 바꿨는데 덮어쓰는 lost update 방지)
+- await wait_for(states, timeout): 해당 상태로 전이되는 순간에만 깨어남 → 전이된 상태 반환
+  (SHUTDOWN → NONE 처럼 금방 지나가는 상태도 놓치지 않음)
+- notify() / wait_for_change(): 상태는 그대로지만 새 액션이 준비된 경우 등 (SSE 용)
+
+이벤트 루프 스레드에서만 사용 (전이 / 대기 모두 async 핸들러 안에서 호출)
+여러 worker 가 상태를 공유할 때는 shared_state.SharedTaskStateMachine (state / version 을 백엔드에서 읽고 CAS 로 전이)
+"""
+import asyncio
+from enum import IntEnum
+
+
+class TaskType(IntEnum):
+    NONE = 0
+    LOGIN = 1
+    STATE = 2
+    ACTION = 3
+    SHUTDOWN = 4
+    VERIFICATION = 5
+    LOGOUT = 99
+
+
+# 현재 상태 → 갈 수 있는 상태
+TRANSITIONS = {
+    TaskType.NONE: {TaskType.LOGIN, TaskType.STATE, TaskType.SHUTDOWN, TaskType.LOGOUT},
+    TaskType.LOGIN: {TaskType.NONE, TaskType.SHUTDOWN, TaskType.LOGOUT},
+    TaskType.STATE: {TaskType.ACTION, TaskType.NONE, TaskType.SHUTDOWN, TaskType.LOGOUT},
+    TaskType.ACTION: {TaskType.STATE, TaskType.VERIFICATION, TaskType.NONE, TaskType.SHUTDOWN, TaskType.LOGOUT},
+    TaskType.VERIFICATION: {TaskType.NONE, TaskType.ACTION, TaskType.SHUTDOWN, TaskType.LOGOUT},  # ACTION: plan 모드 replan
+    TaskType.SHUTDOWN: {TaskType.NONE, TaskType.LOGIN, TaskType.SHUTDOWN, TaskType.LOGOUT},
+    TaskType.LOGOUT: {TaskType.NONE, TaskType.LOGIN, TaskType.LOGOUT},
+}
+
+# 프롬프트 하나를 처리 중인 상태 (이 동안 새 /prompt 는 거절)
+ACTIVE_STATES = frozenset((TaskType.STATE, TaskType.ACTION, TaskType.VERIFICATION))
+# 실행 웹에 보낼 명령이 있는 상태
+PENDING_STATES = frozenset(TaskType) - {TaskType.NONE}
+
+
+class InvalidTransition(Exception):
+    """허용되지 않은 전이이거나 expect 와 현재 상태가 다름"""
+
+    def __init__(self, current, to):
+        super().__init__(f"테스크 상태를 {current.name} → {to.name} 로 바꿀 수 없습니다.")
+        self.current = current
+        self.to = to
+
+
+class SessionGone(InvalidTransition):
+    """세션이 삭제됨 (다른 worker 에서 로그아웃 등) → 전이할 대상이 없음"""
+
+    def __init__(self, session_id, to):
+        Exception.__init__(self, f"세션이 삭제되어 테스크 상태를 {to.name} 로 바꿀 수 없습니다: {session_id}")
+        self.current = None
+        self.to = to
+        self.session_id = session_id
+
+
+class TaskStateMachine:
+    def __init__(self):
+        self._state = TaskType.NONE
+        self._version = 0      # 전이 / notify 마다 증가
+        self._waiters = []     # [(상태 집합 또는 None(아무 변경), 등록 시점 version, Future)]
+
+    @property
+    def state(self):
+        return self._state
+
+    @property
+    def version(self):
+        return self._version
+
+    def can_transition(self, to):
+        return TaskType(to) in TRANSITIONS[self._state]
+
+    def transition(self, to, expect=None):
+        """
+        Args:
+            expect: 현재 상태가 이것(또는 이 중 하나)이어야 전이 (compare-and-set)
+        Returns:
+            이전 상태
+        Raises:
+            InvalidTransition
+        """
+        to = TaskType(to)
+        current = self._state
+        if expect is not None:
+            expected = {expect} if isinstance(expect, int) else set(expect)
+            if current not in expected:
+                raise InvalidTransition(current, to)
+        if to not in TRANSITIONS[current]:
+            raise InvalidTransition(current, to)
+        self._state = to
+        self._version += 1
+        self._wake(to)
+        return current
+
+    def notify(self):
+        """상태 변화 없이 '변경 있음'만 알림 (새 액션 준비 등)"""
+        self._version += 1
+        self._wake(None)
+
+    def _wake(self, state, version=None):
+        """
+        state 로 전이됨 (None 이면 상태 변화 없는 알림) → 해당 대기자만 깨움
+        version: 이 변경 후의 version (다른 worker 의 변경이 늦게 도착한 경우, 그보다 나중에 등록한 대기자는 건너뜀)
+        """
+        remaining = []
+        for entry in self._waiters:
+            states, since, fut = entry
+            if fut.done():
+                continue
+            if version is not None and version <= since:
+                remaining.append(entry)
+            elif states is None or (state is not None and state in states):
+                fut.set_result(state if state is not None else self.state)
+            else:
+                remaining.append(entry)
+        self._waiters = remaining
+
+    async def wait_for(self, states, timeout=None):
+        """
+        현재 상태가 states 중 하나면 바로, 아니면 그 상태로 전이될 때까지 대기
+        Returns:
+            전이된 상태 (timeout 이면 None)
+        """
+        states = frozenset(TaskType(s) for s in states)
+        current = self.state
+        if current in states:
+            return current
+        return await self._wait(states, timeout)
+
+    async def wait_for_change(self, version, timeout):
+        """version 이후 전이 / notify 가 있을 때까지 최대 timeout 초 대기. 변경이 있었으면 True"""
+        if self.version != version:
+            return True
+        return await self._wait(None, timeout, since=version) is not None
+
+    async def _wait(self, states, timeout, since=None):
+        fut = asyncio.get_running_loop().create_future()
+        entry = (states, self.version if since is None else since, fut)
+        self._waiters.append(entry)
+        try:
+            return await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+model_worker_pool 테스트: rendezvous 라우팅 / 죽은 worker 재시작 / 스트리밍 (python -m pytest -q)
+worker 프로세스는 mock_action_model (스트리밍은 이 파일) 을 import
+"""
+import asyncio
+import os
+import signal
+import time
+
+import pytest
+
+from model_worker_pool import ModelWorkerPool, WorkerProcesses, socket_paths
+
+SESSIONS = [f"session-{i}" for i in range(200)]
+
+# worker 프로세스에서 이 파일을 모듈로 import 했을 때의 메서드 (스트리밍 테스트용)
+WORKER_METHODS = ("count",)
+
+
+def count(n):
+    for i in range(n):
+        yield i
+
+
+def _pool(workers, **kwargs):
+    pool = ModelWorkerPool(socket_paths("/nonexistent", workers), **kwargs)
+    for worker in pool._workers:
+        worker.healthy = True
+    return pool
+
+
+async def _until(pool, condition, timeout=60.0):
+    """health check 를 돌리면서 condition 이 참이 될 때까지"""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "시간 안에 조건을 만족하지 못함"
+        await pool.check()
+        await asyncio.sleep(0.05)
+
+
+@pytest.fixture
+def socket_dir(tmp_path):
+    return str(tmp_path / "w")
+
+
+# ============================
+# rendezvous hashing
+# ============================
+def test_route_is_the_same_in_every_api_process():
+    a, b = _pool(3), _pool(3)
+    assert [a.route(s).index for s in SESSIONS] == [b.route(s).index for s in SESSIONS]
+    assert {a.route(s).index for s in SESSIONS} == {0, 1, 2}
+
+
+def test_only_sessions_of_removed_worker_move():
+    pool = _pool(3)
+    before = {s: pool.route(s).index for s in SESSIONS}
+
+    pool._workers[1].healthy = False  # worker 1 이 죽음
+    during = {s: pool.route(s).index for s in SESSIONS}
+    assert all(during[s] == before[s] for s in SESSIONS if before[s] != 1)
+    assert {during[s] for s in SESSIONS if before[s] == 1} == {0, 2}  # 한 worker 로 몰리지 않음
+
+    pool._workers[1].healthy = True  # 재시작 후 원래 세션이 돌아옴
+    assert {s: pool.route(s).index for s in SESSIONS} == before
+
+
+# ============================
+# worker 프로세스
+# ============================
+def test_crashed_worker_is_restarted_and_its_sessions_return(socket_dir):
+    processes = WorkerProcesses("mock_action_model", 2, socket_dir=socket_dir, restart_backoff=0.05)
+    pool = ModelWorkerPool(processes.paths, start_timeout=60, processes=processes)
+    routes = _pool(2)
+    key = next(s for s in SESSIONS if routes.route(s).index == 0)
+    other = next(s for s in SESSIONS if routes.route(s).index == 1)
+
+    async def call(session_id):
+        _, timing = await pool.call("get_next_action", session_id, session_id=session_id, prompt_text="학적부 조회")
+        return timing["worker"]
+
+    async def scenario():
+        await asyncio.to_thread(pool.start)
+        try:
+            assert (await call(key), await call(other)) == (0, 1)
+            old_pid = processes.pid(0)
+            os.kill(old_pid, signal.SIGKILL)
+            processes._procs[0].wait()
+
+            # 죽은 worker 의 세션은 한 번 재시도해서 다른 worker 에서 처리, 다른 세션은 그대로
+            assert (await call(key), await call(other)) == (1, 1)
+            assert pool.stats()["retried"] == 1
+
+            await _until(pool, lambda: processes.pid(0) != old_pid and pool._workers[0].healthy)
+            assert processes.restarts[0] == 1
+            assert (await call(key), await call(other)) == (0, 1)
+        finally:
+            await pool.close()
+
+    asyncio.run(scenario())
+
+
+def test_stream_yields_chunks_and_aborted_stream_drops_connection(socket_dir):
+    processes = WorkerProcesses(__name__, 1, socket_dir=socket_dir)
+    pool = ModelWorkerPool(processes.paths, start_timeout=60, processes=processes)
+
+    async def scenario():
+        await asyncio.to_thread(pool.start)
+        try:
+            assert [chunk async for chunk in pool.stream("count", "s1", n=3)] == [0, 1, 2]
+
+            chunks = pool.stream("count", "s1", n=1000)
+            assert await chunks.__anext__() == 0
+            await chunks.aclose()  # 클라이언트가 중간에 끊음 → 남은 조각이 다음 요청에 섞이지 않음
+            assert [chunk async for chunk in pool.stream("count", "s1", n=2)] == [0, 1]
+            assert pool.stats()["pending"] == 0
+        finally:
+            await pool.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+presence 테스트: 폴링이 끊긴 실행 웹의 timing wheel 만료 (가짜 시계, python -m pytest -q)
+"""
+import pytest
+
+from presence import PresenceRegistry
+from shared_state import SqliteBackend
+
+TIMEOUT = 8.0
+TICK = 0.25
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return _Clock()
+
+
+@pytest.fixture
+def expired():
+    return []
+
+
+@pytest.fixture
+def registry(clock, expired):
+    return PresenceRegistry(timeout=TIMEOUT, tick=TICK, on_expire=expired.append, clock=clock)
+
+
+def test_web_that_stops_polling_expires_after_timeout(registry, clock, expired):
+    registry.heartbeat("web-1", "s1", browser_running=True, browser_count=2)
+    registry.heartbeat("web-2", "s1")
+
+    clock.now += TIMEOUT - TICK
+    assert registry.session_status("s1")["execution_webs"] == 2
+    registry.heartbeat("web-2", "s1")  # web-2 만 계속 폴링
+
+    clock.now += 2 * TICK
+    registry.advance()  # start() 의 run() 이 tick 마다 하는 일
+    assert [web.web_id for web in expired] == ["web-1"]
+    status = registry.session_status("s1")
+    assert (status["connected"], status["execution_webs"], status["browser_running"], status["browser_count"]) == \
+        (True, 1, False, 0)
+
+    clock.now += TIMEOUT
+    registry.advance()
+    assert [web.web_id for web in expired] == ["web-1", "web-2"]
+    assert registry.connected_sessions() == set()
+    stats = registry.stats()
+    assert (stats["connected"], stats["sessions"], stats["browsers_running"], stats["browser_count"]) == (0, 0, 0, 0)
+    assert stats["expired_total"] == 2
+
+
+def test_heartbeats_keep_web_alive_across_wheel_rotations(registry, clock, expired):
+    for _ in range(4 * int(TIMEOUT / TICK)):  # 바퀴를 여러 번 도는 동안 tick 마다 폴링
+        registry.heartbeat("web-1", "s1")
+        clock.now += TICK
+        registry.advance()
+    assert expired == []
+    assert registry.connected_sessions() == {"s1"}
+
+
+def test_long_poll_keeps_web_alive_until_it_finishes(registry, clock, expired):
+    registry.heartbeat("web-1", "s1")
+    registry.poll_started("web-1")  # /command?wait= 로 대기 중 → 폴링 요청이 새로 오지 않음
+
+    clock.now += 3 * TIMEOUT
+    assert registry.connected_sessions() == {"s1"}
+    assert registry.stats()["polling"] == 1
+
+    registry.poll_finished("web-1")
+    clock.now += TIMEOUT + TICK
+    registry.advance()
+    assert [web.web_id for web in expired] == ["web-1"]
+    assert registry.stats()["polling"] == 0
+
+
+def test_long_pause_only_expires_once(registry, clock, expired):
+    registry.heartbeat("web-1", "s1")
+    clock.now += 100 * TIMEOUT  # advance 가 오래 멈춰 있었음 → 한 바퀴만 처리
+    assert registry.connected_sessions() == set()
+    assert len(expired) == 1
+
+
+def test_local_expiry_keeps_web_still_polling_another_worker(tmp_path, clock):
+    store = SqliteBackend(str(tmp_path / "shared.db"))
+    a = PresenceRegistry(timeout=TIMEOUT, tick=TICK, store=store, clock=clock)
+    b = PresenceRegistry(timeout=TIMEOUT, tick=TICK, store=store, clock=clock)
+    try:
+        a.heartbeat("web-1", "s1")
+        b.heartbeat("web-1", "s1")  # 이후 폴링은 b 로만 감
+
+        clock.now += TIMEOUT + TICK
+        assert a.stats()["expired_total"] == 1  # a 가 받은 폴링 기준으로는 끊김
+        assert a.connected_sessions() == {"s1"}  # store 에는 b 의 최근 폴링이 남아 있음
+        assert [entry["execution_web_id"] for entry in a.list("s1")] == ["web-1"]
+    finally:
+        store.close()
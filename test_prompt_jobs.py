@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+prompt_jobs 테스트: worker 두 개 (PromptJobManager 두 개) 가 SQLite 파일 하나를 공유 (python -m pytest -q)
+"""
+import asyncio
+
+import pytest
+
+from prompt_jobs import JobCancelled, PromptJobManager
+from shared_state import SqliteBackend
+
+
+@pytest.fixture
+def store(tmp_path):
+    backend = SqliteBackend(str(tmp_path / "shared.db"))
+    yield backend
+    backend.close()
+
+
+class _Runner:
+    """release 될 때까지 job 을 붙잡고 있는 runner (실행된 job 텍스트 기록)"""
+
+    def __init__(self):
+        self.ran = []
+        self.release = None
+
+    async def __call__(self, job):
+        self.ran.append(job.text)
+        await self.release.wait()
+        return {"success": True}
+
+
+def test_logout_on_other_worker_cancels_queued_jobs(store):
+    runner_a = _Runner()
+    a = PromptJobManager(runner_a, store=store)
+    b = PromptJobManager(_Runner(), store=store)
+
+    async def scenario():
+        runner_a.release = asyncio.Event()
+        first = a.submit("s1", "학적부 조회")
+        queued = a.submit("s1", "성적 조회")
+        await asyncio.sleep(0)
+        assert first.status == "running"
+
+        assert b.cancel_session("s1") == 0  # b 에는 대기 job 없음 → store 로만 전달
+        runner_a.release.set()
+        await a.wait(queued, 1)
+        return first, queued
+
+    first, queued = asyncio.run(scenario())
+    assert first.status == "succeeded"  # 실행 중이던 job 은 runner 가 LOGOUT 으로 끝냄
+    assert queued.status == "cancelled"
+    assert runner_a.ran == ["학적부 조회"]
+    assert b.snapshot(queued.job_id)["status"] == "cancelled"
+
+
+def test_jobs_submitted_after_logout_still_run(store):
+    runner = _Runner()
+    a = PromptJobManager(runner, store=store)
+    b = PromptJobManager(_Runner(), store=store)
+
+    async def scenario():
+        runner.release = asyncio.Event()
+        runner.release.set()
+        b.cancel_session("s1")
+        await asyncio.sleep(0.01)  # 다시 로그인 후 새 프롬프트
+        job = a.submit("s1", "다시 조회")
+        await a.wait(job, 1)
+        return job
+
+    job = asyncio.run(scenario())
+    assert job.status == "succeeded"
+    assert runner.ran == ["다시 조회"]
+
+
+def test_runner_cancellation_is_not_a_failure(store):
+    async def runner(job):
+        raise JobCancelled("세션이 삭제되어 취소되었습니다.")
+
+    manager = PromptJobManager(runner, store=store)
+
+    async def scenario():
+        job = manager.submit("s1", "학적부 조회")
+        await manager.wait(job, 1)
+        return job
+
+    job = asyncio.run(scenario())
+    assert job.status == "cancelled"
+    assert job.error == "세션이 삭제되어 취소되었습니다."
+
+
+def test_old_cancellation_records_are_pruned(store):
+    manager = PromptJobManager(_Runner(), ttl=0, store=store)
+    manager.cancel_session("s1")
+    manager.cancel_session("s2")  # s1 기록은 ttl 이 지나서 삭제
+    assert store.kv_get(PromptJobManager.CANCEL_NAMESPACE, "s1") is None
+    assert store.kv_get(PromptJobManager.CANCEL_NAMESPACE, "s2") is not None
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+shared_state 테스트: worker 두 개 (SharedState 두 개) 가 SQLite 파일 하나를 공유 (python -m pytest -q)
+"""
+import asyncio
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from shared_state import CREDENTIALS_NAMESPACE, SharedState, SqliteBackend, reset_from_env
+from task_state import InvalidTransition, SessionGone, TaskType
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "shared.db")
+
+
+@pytest.fixture
+def workers(db_path):
+    states = [SharedState(SqliteBackend(db_path), poll_interval=0.005) for _ in range(2)]
+    yield states
+    for state in states:
+        state.backend.close()
+
+
+def _finishes(fn, timeout=2.0):
+    """fn 이 timeout 안에 끝나는지 (끝나지 않는 재시도 루프 검사용). (끝났는지, 결과 또는 예외)"""
+    outcome = {}
+
+    def run():
+        try:
+            outcome["result"] = fn()
+        except Exception as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    return not thread.is_alive(), outcome.get("error", outcome.get("result"))
+
+
+# ============================
+# compare-and-set
+# ============================
+def test_transition_is_visible_to_other_worker(workers):
+    a, b = workers
+    a.sessions.get_or_create("s1").transition(TaskType.STATE, prompt_text="학적부 조회")
+    session = b.sessions.get("s1")
+    assert session.task.state == TaskType.STATE
+    assert session.task.version == 1
+    assert session.prompt_text == "학적부 조회"
+
+
+def test_cas_conflict_rechecks_expect(workers):
+    a, b = workers
+    a.sessions.get_or_create("s1").task.transition(TaskType.STATE)
+    session_a, session_b = a.sessions.get("s1"), b.sessions.get("s1")
+
+    # a 가 STATE 를 읽은 뒤, CAS 직전에 b 가 먼저 NONE 으로 바꿈
+    original = a.backend.compare_and_set_task
+    calls = []
+
+    def racing_cas(*args):
+        if not calls:
+            session_b.task.transition(TaskType.NONE)
+        calls.append(args)
+        return original(*args)
+
+    a.backend.compare_and_set_task = racing_cas
+    with pytest.raises(InvalidTransition) as info:
+        session_a.task.transition(TaskType.ACTION, expect=TaskType.STATE)
+    assert info.value.current == TaskType.NONE
+    assert len(calls) == 1  # 다시 읽은 상태가 expect 와 달라서 재시도하지 않음
+    assert session_b.task.state == TaskType.NONE
+
+
+def test_cas_conflict_retries_when_still_allowed(workers):
+    a, b = workers
+    a.sessions.get_or_create("s1").task.transition(TaskType.STATE)
+    session_a, session_b = a.sessions.get("s1"), b.sessions.get("s1")
+
+    original = a.backend.compare_and_set_task
+    calls = []
+
+    def racing_cas(*args):
+        if not calls:
+            session_b.task.transition(TaskType.ACTION)
+        calls.append(args)
+        return original(*args)
+
+    a.backend.compare_and_set_task = racing_cas
+    # LOGOUT 은 어느 상태에서나 가능 → 다시 읽고 ACTION 에서 전이
+    assert session_a.task.transition(TaskType.LOGOUT) == TaskType.ACTION
+    assert len(calls) == 2
+    assert session_b.task.state == TaskType.LOGOUT
+    assert session_b.task.version == 3
+
+
+def test_transition_on_deleted_session_raises(workers):
+    a, b = workers
+    session_a = a.sessions.get_or_create("s1")
+    session_a.task.transition(TaskType.STATE)
+    b.sessions.remove("s1")  # 다른 worker 에서 로그아웃
+
+    finished, error = _finishes(lambda: session_a.task.transition(TaskType.NONE))
+    assert finished, "삭제된 세션에서 전이가 끝나지 않음"
+    assert isinstance(error, SessionGone)
+    assert isinstance(error, InvalidTransition)  # 기존 except InvalidTransition 도 그대로 처리
+    assert a.sessions.get("s1") is None
+
+
+def test_notify_on_deleted_session_is_noop(workers):
+    a, b = workers
+    session_a = a.sessions.get_or_create("s1")
+    b.sessions.remove("s1")
+    finished, error = _finishes(session_a.task.notify)
+    assert finished and error is None
+
+
+# ============================
+# 다른 worker 의 대기자 깨우기
+# ============================
+def test_remote_transition_wakes_waiter(workers):
+    a, b = workers
+
+    async def scenario():
+        a.start()
+        b.start()
+        try:
+            a.sessions.get_or_create("s1")
+            waiter = asyncio.ensure_future(b.sessions.get("s1").task.wait_for((TaskType.STATE,), timeout=2))
+            await asyncio.sleep(0.02)
+            a.sessions.get("s1").task.transition(TaskType.STATE)
+            return await waiter
+        finally:
+            await a.close()
+            await b.close()
+
+    assert asyncio.run(scenario()) == TaskType.STATE
+
+
+def test_late_remote_event_does_not_wake_newer_waiter(workers):
+    a, b = workers
+    a.sessions.get_or_create("s1").task.transition(TaskType.STATE)  # version 1
+
+    async def scenario():
+        task = b.sessions.get("s1").task
+        waiter = asyncio.ensure_future(task.wait_for_change(task.version, timeout=0.2))
+        await asyncio.sleep(0)
+        task.remote_change(int(TaskType.STATE), 1)  # 대기자가 이미 본 version 의 이벤트가 늦게 도착
+        return await waiter
+
+    assert asyncio.run(scenario()) is False
+
+
+# ============================
+# 읽기 캐시 / 비밀번호 / reset
+# ============================
+def test_step_cache_rereads_after_await(workers):
+    a, b = workers
+    a.sessions.get_or_create("s1").prompt_text = "before"
+
+    async def scenario():
+        session = b.sessions.get("s1")
+        first = session.prompt_text
+        a.sessions.get("s1").prompt_text = "after"
+        same_step = session.prompt_text  # 같은 step 안에서는 캐시
+        await asyncio.sleep(0)
+        return first, same_step, session.prompt_text
+
+    assert asyncio.run(scenario()) == ("before", "before", "after")
+
+
+def test_password_is_kept_out_of_session_fields(workers):
+    a, b = workers
+    session = a.sessions.get_or_create("s1")
+    session.password = "secret"
+    assert b.sessions.get("s1").password == "secret"
+    assert "password" not in a.backend.get_fields("s1")
+
+    b.sessions.get("s1").password = None
+    assert a.backend.kv_get(CREDENTIALS_NAMESPACE, "s1") is None
+
+    session.password = "secret"
+    a.sessions.remove("s1")
+    assert a.backend.kv_get(CREDENTIALS_NAMESPACE, "s1") is None
+
+
+def test_reset_from_env_clears_previous_run(workers, db_path, monkeypatch):
+    a, _ = workers
+    a.sessions.get_or_create("stale").transition(TaskType.STATE, prompt_text="old")
+    a.backend.kv_put("jobs", "job-1", "{}")
+
+    monkeypatch.setenv("SHARED_STATE", "sqlite:///" + db_path)
+    monkeypatch.setenv("SHARED_STATE_RESET", "0")
+    assert reset_from_env() is False
+    assert a.backend.has_session("stale")
+
+    monkeypatch.delenv("SHARED_STATE_RESET")
+    assert reset_from_env() is True
+    assert a.backend.session_ids() == []
+    assert a.backend.kv_values("jobs") == []
+
+
+# ============================
+# 이벤트 루프에서의 잠금 대기
+# ============================
+def test_lock_wait_on_event_loop_is_capped(db_path):
+    backend = SqliteBackend(db_path, busy_timeout=5.0, loop_busy_timeout=0.05)
+    backend.create_session("s1")
+    holder = sqlite3.connect(db_path, isolation_level=None)
+    holder.execute("BEGIN IMMEDIATE")  # 다른 worker 가 쓰기 잠금을 오래 잡고 있음
+
+    async def write_on_loop():
+        started = time.monotonic()
+        try:
+            backend.set_fields("s1", {"prompt_text": '"x"'})
+        except SqliteBackend.errors:
+            return time.monotonic() - started
+        return None
+
+    try:
+        elapsed = asyncio.run(write_on_loop())
+        assert elapsed is not None and elapsed < 1.0  # busy_timeout(5초) 까지 루프를 막지 않음
+    finally:
+        holder.execute("ROLLBACK")
+        holder.close()
+    backend.set_fields("s1", {"prompt_text": '"y"'})  # 잠금이 풀리면 그대로 사용 가능
+    assert backend.get_fields("s1") == {"prompt_text": '"y"'}
+    backend.close()
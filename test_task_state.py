@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+task_state 전이 표 / 엔드포인트 전이 테스트 (python -m pytest -q)
+"""
+import asyncio
+
+import pytest
+
+from task_state import ACTIVE_STATES, PENDING_STATES, TRANSITIONS, InvalidTransition, TaskStateMachine, TaskType
+
+
+def _machine(state):
+    machine = TaskStateMachine()
+    machine._state = state
+    return machine
+
+
+# ============================
+# 전이 표
+# ============================
+def test_every_state_has_transitions():
+    assert set(TRANSITIONS) == set(TaskType)
+    for targets in TRANSITIONS.values():
+        assert targets <= set(TaskType)
+
+
+def test_logout_is_reachable_from_every_state():
+    for state in TaskType:
+        assert TaskType.LOGOUT in TRANSITIONS[state], state
+
+
+def test_shutdown_is_reachable_unless_logout_is_pending():
+    for state in TaskType:
+        assert (TaskType.SHUTDOWN in TRANSITIONS[state]) == (state != TaskType.LOGOUT), state
+
+
+def test_every_pending_command_returns_to_none():
+    # /command 가 명령을 전달한 뒤 (또는 /verification 이) NONE 으로 돌려놓을 수 있어야 다음 /prompt 가 시작됨
+    for state in PENDING_STATES:
+        assert TaskType.NONE in TRANSITIONS[state], state
+
+
+def test_prompt_can_only_start_from_none():
+    for state in TaskType:
+        assert (TaskType.STATE in TRANSITIONS[state]) == (state in (TaskType.NONE, TaskType.ACTION)), state
+    assert TaskType.NONE not in ACTIVE_STATES
+
+
+@pytest.mark.parametrize("path", [
+    # step 모드: /prompt → (/command state → /state → /command action → /action) x N → /verification
+    [TaskType.STATE, TaskType.ACTION, TaskType.STATE, TaskType.ACTION, TaskType.VERIFICATION, TaskType.NONE],
+    # plan 모드 replan: verification 단계에서 checkpoint 실패 보고 → 다시 /action
+    [TaskType.STATE, TaskType.ACTION, TaskType.VERIFICATION, TaskType.ACTION, TaskType.VERIFICATION, TaskType.NONE],
+    # 로그인 / 종료 / 로그아웃 명령
+    [TaskType.LOGIN, TaskType.NONE, TaskType.SHUTDOWN, TaskType.NONE, TaskType.LOGOUT, TaskType.NONE],
+])
+def test_protocol_paths(path):
+    machine = TaskStateMachine()
+    for to in path:
+        machine.transition(to)
+    assert machine.state == TaskType.NONE
+    assert machine.version == len(path)
+
+
+# ============================
+# TaskStateMachine
+# ============================
+def test_invalid_transition_keeps_state():
+    machine = _machine(TaskType.LOGOUT)
+    with pytest.raises(InvalidTransition) as info:
+        machine.transition(TaskType.SHUTDOWN)
+    assert info.value.current == TaskType.LOGOUT
+    assert machine.state == TaskType.LOGOUT
+    assert machine.version == 0
+
+
+def test_expect_mismatch_is_rejected():
+    machine = _machine(TaskType.STATE)
+    with pytest.raises(InvalidTransition):
+        machine.transition(TaskType.STATE, expect=TaskType.ACTION)
+    machine.transition(TaskType.ACTION, expect=(TaskType.STATE, TaskType.ACTION))
+    assert machine.state == TaskType.ACTION
+
+
+def test_wait_for_wakes_on_matching_transition():
+    async def scenario():
+        machine = TaskStateMachine()
+        waiter = asyncio.ensure_future(machine.wait_for((TaskType.NONE, TaskType.LOGOUT), timeout=1))
+        machine.transition(TaskType.STATE)
+        await asyncio.sleep(0)
+        assert not waiter.done()
+        machine.transition(TaskType.LOGOUT)
+        return await waiter
+
+    assert asyncio.run(scenario()) == TaskType.LOGOUT
+
+
+# ============================
+# 엔드포인트 (Api.py)
+# ============================
+@pytest.fixture
+def client():
+    from fastapi.testclient import TestClient
+    import Api
+    with TestClient(Api.app) as test_client:
+        yield test_client
+
+
+def test_shutdown_after_logout_is_not_an_error(client):
+    session = {"session_id": "test-logout-shutdown"}
+    assert client.post("/login", json={"student_id": "s", "password": "p", **session}).status_code == 200
+    assert client.get("/command", params=session).json()["type"] == "login"
+    assert client.post("/logout", params=session).status_code == 200
+
+    # 로그아웃 명령이 아직 전달되지 않음 → 그 명령이 shutdown 으로 전달됨
+    assert client.post("/browser/close", params=session).status_code == 200
+    assert client.post("/execution_web/shutdown", json=session).status_code == 200
+    assert client.get("/command", params=session).json() == {"has_task": True, "type": "shutdown"}
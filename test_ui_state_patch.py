@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+ui_state_patch 테스트: 버전은 commit 할 때만 올라감 (python -m pytest -q)
+"""
+import copy
+
+import pytest
+
+from inference_executor import InferenceQueueFull
+from ui_state_patch import UiStateConflict, UiStateSync, make_patch
+
+UI_STATE = {"url": "u", "sidebar": [{"label": "학적", "expanded": False, "checked": False, "sub_items": []}]}
+
+
+def _changed(ui_state):
+    new = copy.deepcopy(ui_state)
+    new["sidebar"][0]["expanded"] = True
+    return new
+
+
+def test_resolve_does_not_advance_version():
+    sync = UiStateSync()
+    sync.update({"ui_state": UI_STATE})
+    patch = {"ui_state_patch": {"base_version": 1, "ops": make_patch(UI_STATE, _changed(UI_STATE))}}
+
+    state, kind = sync.resolve(patch)
+    assert (kind, state) == ("patch", _changed(UI_STATE))
+    assert (sync.version, sync.state) == (1, UI_STATE)
+
+    assert sync.resolve(patch) == (state, kind)  # 반영 전이라 같은 patch 를 다시 받을 수 있음
+    sync.commit(state)
+    assert (sync.version, sync.state) == (2, state)
+    with pytest.raises(UiStateConflict):
+        sync.resolve(patch)
+
+
+# ============================
+# 엔드포인트 (Api.py)
+# ============================
+@pytest.fixture
+def client():
+    from fastapi.testclient import TestClient
+    import Api
+    with TestClient(Api.app) as test_client:
+        yield test_client
+
+
+def test_rejected_state_keeps_ui_state_version(client, monkeypatch):
+    import Api
+
+    session = {"session_id": "test-ui-state-429"}
+    assert client.post("/login", json={"student_id": "s", "password": "p", **session}).status_code == 200
+    Api.SESSIONS.get(session["session_id"]).prompt_text = "학적부 조회"
+    monkeypatch.setattr(Api, "PLAN_CACHE_ENABLED", False)
+
+    version = client.post("/state", json={"data": {"ui_state": UI_STATE}, **session}).json()["ui_state_version"]
+    patch = {"ui_state_patch": {"base_version": version, "ops": make_patch(UI_STATE, _changed(UI_STATE))}}
+
+    run_action_model = Api._run_action_model
+
+    async def queue_full(**request):
+        raise InferenceQueueFull("대기열 초과")
+
+    monkeypatch.setattr(Api, "_run_action_model", queue_full)
+    assert client.post("/state", json={"data": patch, **session}).status_code == 429
+
+    # 429 뒤 같은 base_version 으로 다시 보낸 patch 가 그대로 적용됨 (409 resync 없음)
+    monkeypatch.setattr(Api, "_run_action_model", run_action_model)
+    resp = client.post("/state", json={"data": patch, **session})
+    assert resp.status_code == 200
+    assert resp.json()["ui_state_version"] == version + 1
+    assert Api.SESSIONS.get(session["session_id"]).ui_state.state == _changed(UI_STATE)
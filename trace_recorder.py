@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Trace Recorder
+/state 에서 실제로 모델을 호출한 step 의 (prompt, observations) → generated_action 을 JSONL 로 기록
+기록한 파일은 replay.py 로 다른 get_next_action 구현(양자화 / 배치 / 캐시 변경 등)에 그대로 다시 돌려볼 수 있음
+
+- record(): 큐에 넣기만 하고 파일 쓰기는 백그라운드 스레드가 모아서 처리 (요청 경로에서 파일 I/O 없음)
+- 파일 이름이 .gz 로 끝나면 gzip 으로 저장
+- TRACE_RECORD_PATH 가 없으면 기록 안 함, TRACE_RECORD_SAMPLE 로 일부만 기록 (0~1)
+
+한 줄 형식:
+    {"ts", "session_id", "step", "prompt_text", "observations", "generated_action",
+     "latency_ms", "queued_ms", "batch_size", "model"}
+"""
+import atexit
+import gzip
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+
+def _open(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def read_traces(path):
+    """기록 파일을 한 줄씩 dict 로 (깨진 줄은 건너뜀)"""
+    with _open(path, "r") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                log.warning("[TraceRecorder] %s:%s 줄을 읽을 수 없어 건너뜀", path, line_no)
+
+
+class TraceRecorder:
+    def __init__(self, path, sample_rate=1.0, flush_interval=1.0, max_queue=10000):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.flush_interval = flush_interval
+        self.recorded = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="trace-recorder", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)  # 종료 직전에 남은 기록 flush
+
+    def record(self, session_id, step, prompt_text, observations, generated_action, timing=None, model=None):
+        if self._closed or (self.sample_rate < 1.0 and random.random() >= self.sample_rate):
+            return
+        timing = timing or {}
+        entry = {
+            "v": FORMAT_VERSION,
+            "ts": round(time.time(), 3),
+            "session_id": session_id,
+            "step": step,
+            "prompt_text": prompt_text,
+            "observations": observations,
+            "generated_action": generated_action,
+            "latency_ms": timing.get("run_ms"),
+            "queued_ms": timing.get("queued_ms"),
+            "batch_size": timing.get("batch_size", 1),
+            "model": model,
+        }
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1  # 디스크가 못 따라가면 버림 (요청은 막지 않음)
+
+    def _run(self):
+        while not self._closed or not self._queue.empty():
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = [first]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _write(self, batch):
+        try:
+            with _open(self.path, "a") as f:
+                for entry in batch:
+                    f.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":"), default=str) + "\n")
+            self.recorded += len(batch)
+        except Exception as e:
+            self.dropped += len(batch)
+            log.error("[TraceRecorder] %s 기록 실패: %s", self.path, e)
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "sample_rate": self.sample_rate,
+            "recorded": self.recorded,
+            "pending": self._queue.qsize(),
+            "dropped": self.dropped,
+        }
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._thread.join(timeout=5)
+
+
+def from_env():
+    """TRACE_RECORD_PATH 가 있으면 TraceRecorder, 없으면 None"""
+    path = os.environ.get("TRACE_RECORD_PATH")
+    if not path:
+        return None
+    return TraceRecorder(path, sample_rate=float(os.environ.get("TRACE_RECORD_SAMPLE", 1.0)))
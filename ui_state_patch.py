@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+UI State Patch
+실행 웹이 매 step 마다 전체 ui_state(sidebar 트리 + current_page.form_fields)를 다시 보내는 대신
+서버가 마지막으로 받은(ack) 버전에 대한 변경분만 보내도록 하는 모듈
+
+/state 의 data:
+    {"ui_state": {...}}                                          전체 (항상 허용, 새 버전이 됨)
+    {"ui_state_patch": {"base_version": 3, "ops": [...]}}         변경분
+응답의 ui_state_version 을 다음 patch 의 base_version 으로 사용
+base_version 이 다르거나 적용에 실패하면 409 (resync) → 실행 웹은 전체 ui_state 를 다시 보냄
+
+ops: JSON Patch(RFC 6902) 의 add / remove / replace, path 는 JSON Pointer(RFC 6901)
+    {"op": "replace", "path": "/sidebar/0/expanded", "value": true}
+    {"op": "add", "path": "/sidebar/0/sub_items/-", "value": {...}}
+    {"op": "remove", "path": "/current_page/form_fields/2"}
+
+적용할 때 바뀌는 경로 위의 dict / list 만 얕은 복사 (copy-on-write)
+→ 비용이 메뉴 전체 크기가 아니라 바뀐 경로 길이에 비례하고,
+  이전 ui_state 객체는 그대로라서 state 저장소 / trace 기록이 참조하고 있어도 안전
+"""
+
+_MISSING = object()
+
+
+class PatchError(ValueError):
+    """적용할 수 없는 patch (잘못된 path / op)"""
+
+
+class UiStateConflict(Exception):
+    """서버가 가진 버전과 base_version 이 다르거나 patch 적용 실패 → 전체 ui_state 재전송 필요 (409)"""
+
+    def __init__(self, message, version):
+        super().__init__(message)
+        self.version = version
+
+
+def parse_pointer(path):
+    """JSON Pointer → 토큰 리스트 ("" 는 문서 전체)"""
+    if path == "":
+        return []
+    if not isinstance(path, str) or not path.startswith("/"):
+        raise PatchError(f"잘못된 path: {path!r}")
+    return [token.replace("~1", "/").replace("~0", "~") for token in path[1:].split("/")]
+
+
+def _index(container, token, allow_end=False):
+    if allow_end and token == "-":
+        return len(container)
+    if not token.isdigit() or (len(token) > 1 and token[0] == "0"):
+        raise PatchError(f"리스트 인덱스가 아닙니다: {token!r}")
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise PatchError(f"리스트 인덱스 범위 초과: {index}")
+    return index
+
+
+def _child(container, token):
+    if isinstance(container, dict):
+        if token not in container:
+            raise PatchError(f"없는 키: {token!r}")
+        return container[token]
+    if isinstance(container, list):
+        return container[_index(container, token)]
+    raise PatchError(f"dict / list 가 아닌 값 아래 경로: {token!r}")
+
+
+def _apply_op(node, tokens, op, value):
+    """node 의 tokens 경로에 op 를 적용한 새 node 반환 (경로 위의 컨테이너만 복사)"""
+    token, rest = tokens[0], tokens[1:]
+    if rest:
+        if isinstance(node, dict):
+            copied = dict(node)
+            copied[token] = _apply_op(_child(node, token), rest, op, value)
+        elif isinstance(node, list):
+            index = _index(node, token)
+            copied = list(node)
+            copied[index] = _apply_op(node[index], rest, op, value)
+        else:
+            raise PatchError(f"dict / list 가 아닌 값 아래 경로: {token!r}")
+        return copied
+
+    if isinstance(node, dict):
+        copied = dict(node)
+        if op == "remove" or op == "replace":
+            if token not in node:
+                raise PatchError(f"없는 키: {token!r}")
+        if op == "remove":
+            del copied[token]
+        else:
+            copied[token] = value
+        return copied
+    if isinstance(node, list):
+        copied = list(node)
+        if op == "add":
+            copied.insert(_index(node, token, allow_end=True), value)
+        elif op == "remove":
+            del copied[_index(node, token)]
+        else:
+            copied[_index(node, token)] = value
+        return copied
+    raise PatchError(f"dict / list 가 아닌 값 아래 경로: {token!r}")
+
+
+def apply_patch(doc, ops):
+    """ops 를 순서대로 적용한 새 문서 반환 (doc 은 바뀌지 않음)"""
+    if not isinstance(ops, list):
+        raise PatchError("ops 는 리스트여야 합니다.")
+    for i, operation in enumerate(ops):
+        if not isinstance(operation, dict):
+            raise PatchError(f"ops[{i}] 가 객체가 아닙니다.")
+        op = operation.get("op")
+        if op not in ("add", "remove", "replace"):
+            raise PatchError(f"ops[{i}]: 지원하지 않는 op: {op!r}")
+        value = operation.get("value", _MISSING)
+        if op != "remove" and value is _MISSING:
+            raise PatchError(f"ops[{i}]: value 가 없습니다.")
+        tokens = parse_pointer(operation.get("path"))
+        if not tokens:
+            if op == "remove":
+                raise PatchError(f"ops[{i}]: 문서 전체는 remove 할 수 없습니다.")
+            doc = value
+            continue
+        doc = _apply_op(doc, tokens, op, value)
+    return doc
+
+
+def _escape(token):
+    return str(token).replace("~", "~0").replace("/", "~1")
+
+
+def make_patch(old, new, path=""):
+    """
+    old → new 로 바꾸는 ops (실행 웹 / 테스트용)
+    dict 는 키별로, list 는 앞에서부터 원소별로 재귀 + 늘어난 / 줄어든 뒷부분 add / remove, 그 외에는 replace
+    """
+    if old == new:
+        return []
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops = []
+        for key, value in new.items():
+            child = f"{path}/{_escape(key)}"
+            if key not in old:
+                ops.append({"op": "add", "path": child, "value": value})
+            else:
+                ops.extend(make_patch(old[key], value, child))
+        for key in old:
+            if key not in new:
+                ops.append({"op": "remove", "path": f"{path}/{_escape(key)}"})
+        return ops
+    if isinstance(old, list) and isinstance(new, list):
+        ops = []
+        for i, (a, b) in enumerate(zip(old, new)):
+            ops.extend(make_patch(a, b, f"{path}/{i}"))
+        for i in range(len(old), len(new)):
+            ops.append({"op": "add", "path": f"{path}/{i}", "value": new[i]})
+        for i in range(len(old) - 1, len(new) - 1, -1):
+            ops.append({"op": "remove", "path": f"{path}/{i}"})
+        return ops
+    return [{"op": "replace", "path": path, "value": new}]
+
+
+class UiStateSync:
+    """세션 하나가 마지막으로 받은 ui_state 와 그 버전"""
+
+    def __init__(self):
+        self.state = None
+        self.version = 0
+
+    def reset(self):
+        """다음 요청은 전체 ui_state 여야 함"""
+        self.state = None
+
+    def update(self, data):
+        """resolve + commit (받은 ui_state 를 바로 현재 버전으로)"""
+        state, kind = self.resolve(data)
+        if kind is not None:
+            self.commit(state)
+        return state, kind
+
+    def resolve(self, data):
+        """
+        /state 의 data 에서 ui_state / ui_state_patch 를 읽어 새 ui_state 를 만듦 (버전은 그대로, 반영은 commit)
+        Returns:
+            (전체 ui_state, "full" | "patch"), 둘 다 없으면 (None, None)
+        Raises:
+            UiStateConflict
+        """
+        if "ui_state" in data:
+            return data["ui_state"], "full"
+
+        patch = data.get("ui_state_patch")
+        if patch is None:
+            return None, None
+        if not isinstance(patch, dict):
+            raise UiStateConflict("ui_state_patch 형식이 잘못되었습니다.", self.version)
+        if self.state is None:
+            raise UiStateConflict("서버에 기준 ui_state 가 없습니다. 전체 ui_state 를 보내주세요.", self.version)
+        if patch.get("base_version") != self.version:
+            raise UiStateConflict(
+                f"ui_state 버전이 다릅니다. (서버 {self.version}, 요청 {patch.get('base_version')})", self.version)
+        try:
+            return apply_patch(self.state, patch.get("ops", [])), "patch"
+        except PatchError as e:
+            self.reset()
+            raise UiStateConflict(f"ui_state_patch 적용 실패: {e}", self.version)
+
+    def commit(self, state):
+        """resolve 로 만든 ui_state 를 현재 ui_state 로 (버전 +1)"""
+        self.state = state
+        self.version += 1